@@ -7,13 +7,21 @@
 2. 水务数据获取
 """
 
-from flask import Flask, render_template, jsonify, request, redirect, url_for
-import openpyxl
+from flask import Flask, render_template, jsonify, request, redirect, url_for, Response, stream_with_context
 from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
 import copy
 from datetime import datetime, timedelta
 import os
-import re
+
+from workbook_cache import get_parsed_sheet, get_sheet_names
+from date_index import get_sheet_date_index, month_bounds
+from supply_aggregation import get_supply_matrix, summarize_by_header
+from supply_rollups import get_period_results
+from sheet_query import query_rows, QueryError
+from supply_export import export_stream, ExportError
+from supply_formulas import evaluate_sheet_row
+from month_index import get_month_index, month_title
+from sheet_pages import get_sheet_page
 
 app = Flask(__name__)
 
@@ -228,66 +236,22 @@ def get_info():
                 'message': f'Excel文件不存在: {EXCEL_PATH}'
             })
         
-        wb = openpyxl.load_workbook(EXCEL_PATH)
-        
-        if "石滩区" not in wb.sheetnames:
+        # 月份标题和总行数来自月份索引（文件未变化时不加载工作簿）
+        try:
+            index = get_month_index(EXCEL_PATH)
+        except KeyError:
             return jsonify({
                 'success': False,
                 'message': '工作表"石滩区"不存在'
             })
         
-        ws = wb["石滩区"]
-        
-        # 查找最后一个月份（从单元格中查找）
-        last_month = None
-        all_months = []  # 存储所有找到的月份 (year, month, month_str)
-        
-        # 遍历所有单元格，查找月份标题
-        for row in ws.iter_rows():
-            for cell in row:
-                if cell.value:
-                    # 情况1: 文本格式的月份 "2025年6月"
-                    if isinstance(cell.value, str):
-                        match = re.search(r'(\d{4})年(\d{1,2})月', cell.value)
-                        if match:
-                            year = int(match.group(1))
-                            month = int(match.group(2))
-                            month_str = f"{year}年{month}月"
-                            if (year, month, month_str) not in all_months:
-                                all_months.append((year, month, month_str))
-                    
-                    # 情况2: Excel日期序列号（整数，且在合理范围内）
-                    elif isinstance(cell.value, (int, float)):
-                        # Excel日期序列号通常在 40000-50000 之间（2009-2037年）
-                        if 40000 <= cell.value <= 50000:
-                            try:
-                                from datetime import datetime, timedelta
-                                excel_start = datetime(1899, 12, 30)
-                                actual_date = excel_start + timedelta(days=int(cell.value))
-                                # 只取每月1号的日期作为月份标题
-                                if actual_date.day == 1:
-                                    year = actual_date.year
-                                    month = actual_date.month
-                                    month_str = f"{year}年{month}月"
-                                    if (year, month, month_str) not in all_months:
-                                        all_months.append((year, month, month_str))
-                            except:
-                                pass
-        
-        # 按年月排序，取最新的
-        if all_months:
-            all_months.sort(reverse=True)  # 降序排列
-            last_month = all_months[0][2]  # 取最新月份的字符串
-        
-        # 获取总行数
-        total_rows = ws.max_row
-        
-        wb.close()
+        latest = index.latest()
+        last_month = month_title(latest[0], latest[1]) if latest else None
         
         return jsonify({
             'success': True,
             'excel_path': os.path.basename(EXCEL_PATH),
-            'total_rows': ws.max_row,
+            'total_rows': index.max_row,
             'last_month': last_month
         })
     except Exception as e:
@@ -339,44 +303,112 @@ def prepare_git_before_modify():
     except Exception as e:
         print(f"[GIT PREP] Error: {str(e)}")
 
-@app.route('/add_summary', methods=['POST'])
-def add_summary():
-    """添加月度统计表"""
-    try:
-        data = request.get_json()
-        month_offset = data.get('month_offset', 1)
-        sale_values = data.get('sale_values', [])
-        
+def add_summary_job(params, report):
+    """
+    任务：拉取最新代码并添加月度统计表，成功后提交GitHub同步任务
+    
+    params 带 batch 时批量添加 start_month 至 end_month 的统计表（保存一次、同步一次）
+    """
+    from add_summary_web import (add_monthly_summary_to_main, add_monthly_summaries_to_main,
+                                 EXCEL_PATH as SUMMARY_EXCEL_PATH)
+    from workbook_lock import workbook_lock
+    
+    # 拉取最新代码和添加统计表都在写入锁内，拉取不会覆盖正在写入的文件
+    with workbook_lock(SUMMARY_EXCEL_PATH):
         # 在修改文件前，先拉取最新代码
+        report(10, '正在拉取最新代码...', 'git_pull')
         prepare_git_before_modify()
         
-        # 导入添加函数
-        from add_summary_web import add_monthly_summary_to_main
-        
-        result = add_monthly_summary_to_main(
-            month_offset=month_offset,
-            use_real_data=True,
-            sale_values=sale_values
-        )
-        
-        # 如果成功，自动同步到 GitHub
-        if result.get('success'):
-            result['download_url'] = '/download_excel/石滩区分区计量.xlsx'
-            
-            # 尝试自动同步到 GitHub
-            sync_result = sync_excel_to_github(
-                'excel_exports/石滩区分区计量.xlsx',
-                f"自动更新: 添加{result.get('month', '月度')}统计表"
+        report(40, '正在添加统计表...', 'add_summary')
+        if params.get('batch'):
+            result = add_monthly_summaries_to_main(
+                start_month=params.get('start_month'),
+                end_month=params.get('end_month'),
+                use_real_data=True,
+                sale_values=params.get('sale_values') or {}
+            )
+        else:
+            result = add_monthly_summary_to_main(
+                month_offset=params.get('month_offset', 1),
+                use_real_data=True,
+                sale_values=params.get('sale_values', [])
             )
-            
-            if sync_result['success']:
-                result['message'] += ' | ✅ 已自动同步到GitHub'
-                result['github_synced'] = True
-            else:
-                result['message'] += f" | ⚠️ GitHub同步失败: {sync_result['message']}"
-                result['github_synced'] = False
-        
-        return jsonify(result)
+    
+    # 如果成功，提交 GitHub 同步任务
+    if result.get('success'):
+        months = result.get('months')
+        month_label = f"{months[0]}至{months[-1]}" if months and len(months) > 1 else result.get('month', '月度')
+        result['download_url'] = '/download_excel/石滩区分区计量.xlsx'
+        result['sync_task_id'] = enqueue_github_sync(
+            SUMMARY_EXCEL_PATH, f"自动更新: 添加{month_label}统计表")
+        result['message'] += ' | 已加入GitHub同步队列'
+        report(100, result['message'])
+    return result
+
+def github_sync_job(params, report):
+    """任务：把文件同步到 GitHub；推送失败时抛出异常，由任务队列延后重试"""
+    report(10, '正在同步到GitHub...', 'sync')
+    result = sync_excel_to_github(params['file_path'], params['commit_message'])
+    if not result['success'] and os.environ.get('GITHUB_TOKEN') and os.path.exists(params['file_path']):
+        raise RuntimeError(result['message'])
+    report(100, result['message'])
+    return result
+
+def enqueue_github_sync(file_path, commit_message):
+    """提交 GitHub 同步任务，返回任务ID"""
+    from job_queue import enqueue
+    
+    task, created = enqueue('github_sync', {'file_path': file_path, 'commit_message': commit_message},
+                            dedup_key=f'github_sync:{file_path}:{commit_message}')
+    return task['id']
+
+def queued_response(task, created):
+    """提交任务后立即返回的响应，页面按 task_id 查询进度和结果"""
+    return jsonify({
+        'success': True,
+        'queued': True,
+        'deduplicated': not created,
+        'task_id': task['id'],
+        'status_url': f"/task_status?task_id={task['id']}",
+        'message': '任务已加入队列' if created else '相同的任务正在排队或执行中'
+    })
+
+@app.route('/add_summary', methods=['POST'])
+def add_summary():
+    """
+    添加月度统计表（提交到任务队列，连续点击相同参数只执行一次）
+    
+    批量模式：{"batch": true, "start_month": "YYYY-MM", "end_month": "YYYY-MM", "sale_values": {"YYYY-MM": [...]}}，
+    不指定月份时补齐最后月份之后到数据源最后一个完整抄表周期的所有月份
+    """
+    try:
+        from job_queue import enqueue, QueueFullError
+        
+        data = request.get_json(silent=True) or {}
+        if data.get('batch'):
+            for key in ('start_month', 'end_month'):
+                if data.get(key):
+                    try:
+                        datetime.strptime(data[key], '%Y-%m')
+                    except (TypeError, ValueError):
+                        return jsonify({'success': False, 'message': f'{key} 格式错误，应为 YYYY-MM'})
+            params = {
+                'batch': True,
+                'start_month': data.get('start_month'),
+                'end_month': data.get('end_month'),
+                'sale_values': data.get('sale_values') or {}
+            }
+        else:
+            params = {
+                'month_offset': data.get('month_offset', 1),
+                'sale_values': data.get('sale_values', [])
+            }
+        
+        try:
+            task, created = enqueue('add_summary', params)
+        except QueueFullError as e:
+            return jsonify({'success': False, 'message': str(e)})
+        return queued_response(task, created)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -424,34 +456,21 @@ def data_page():
 
 # 导入水务数据获取的所有功能路由
 # 这些路由来自 web_app_fixed.py
-import json
 import glob
-import threading
 import time
 
-# 全局变量存储任务状态
-task_status = {
-    'running': False,
-    'progress': 0,
-    'message': '准备就绪',
-    'data': None,
-    'error': None,
-    'start_time': None,
-    'end_time': None
-}
+# 后台任务状态登记在 task_registry.db 中，所有 gunicorn 进程共享
+DATA_TASK_KIND = 'fetch_recent_data'
 
 @app.route('/get_data')
 def get_data():
     """获取现有数据（兼容原有接口）"""
-    # 查找最新的JSON文件
+    # 从读数存储中取最近一次获取的日期范围
     try:
-        json_files = glob.glob('WEB_COMPLETE_8_METERS_*.json')
-        if json_files:
-            json_files.sort(reverse=True)
-            latest_file = json_files[0]
-            with open(latest_file, 'r', encoding='utf-8') as f:
-                file_data = json.load(f)
-            
+        from water_store import get_water_store
+        
+        file_data = get_water_store().latest_snapshot()
+        if file_data:
             # 前端逻辑分析:
             # 1. 第1610行: if (result.success && result.data) displayData(result.data)
             # 2. 第1147行: if (!data.data || !data.data.rows)
@@ -460,7 +479,7 @@ def get_data():
             # 所以需要: result.data.data.rows 存在
             # 即: result = {success: true, data: {data: {rows: [...]}}}
             #
-            # JSON文件是: {success: true, data: {rows: [...]}}
+            # 快照数据是: {success: true, data: {rows: [...]}}
             # 所以需要包装一层
             # 调试：打印返回的数据结构
             result = {
@@ -477,192 +496,173 @@ def get_data():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+def _requested_task_status():
+    """
+    按 task_id 参数查询任务状态，未指定时返回最近一次取数任务
+    
+    长轮询：带 wait（秒）和 version（上次拿到的版本）参数时，等到任务变化或超时才返回
+    """
+    from task_registry import get_task_registry, task_status_dict, TASK_REGISTRY_CONFIG
+    
+    registry = get_task_registry()
+    task_id = request.args.get('task_id')
+    task = registry.get(task_id) if task_id else registry.latest(DATA_TASK_KIND)
+    
+    wait = request.args.get('wait', type=float) or 0
+    version = request.args.get('version', type=int)
+    if task is not None and wait > 0 and version is not None:
+        wait = min(wait, TASK_REGISTRY_CONFIG['max_wait_seconds'])
+        task = registry.wait_for_change(task['id'], version, wait)
+    return task_status_dict(task)
+
+@app.route('/task_events/<task_id>')
+def task_events(task_id):
+    """任务进度推送（Server-Sent Events），断线重连时通过 Last-Event-ID 从已知版本继续"""
+    from task_registry import iter_task_events
+    
+    last_version = request.headers.get('Last-Event-ID', type=int)
+    response = Response(stream_with_context(iter_task_events(task_id, last_version)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/status')
 def get_status():
     """获取任务状态"""
-    return jsonify(task_status)
+    return jsonify(_requested_task_status())
 
 @app.route('/start_task', methods=['POST'])
 def start_task():
-    """启动数据获取任务"""
-    global task_status
+    """启动数据获取任务（同时只运行一个，重复点击返回正在运行的任务）"""
+    from job_queue import enqueue, QueueFullError
+    
+    try:
+        task, created = enqueue(DATA_TASK_KIND)
+    except QueueFullError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    if not created:
+        return jsonify({'success': True, 'message': '任务正在运行中', 'task_id': task['id'], 'deduplicated': True})
+    
+    return jsonify({'success': True, 'message': '任务已启动', 'task_id': task['id']})
+
+def run_data_task(params, report):
+    """
+    执行数据获取任务 - 从水务系统获取真实数据
+    
+    Args:
+        params: 任务参数（未使用）
+        report: report(progress, message, stage) 更新任务进度
+    
+    Returns:
+        dict: 获取的数据（保存为任务结果）；失败时返回 {'success': False, 'error', 'message'}
+    """
+    report(0, '开始获取数据...', 'start')
+    
+    # 登录（会话池内已有登录会话时直接复用）
+    report(10, '正在登录水务系统...', 'login')
+    
+    from water_session_pool import get_session_pool
+    
+    pool = get_session_pool()
+    if not pool.warm_up():
+        return {'success': False, 'error': '登录失败，请检查账号密码', 'message': '登录失败'}
+    
+    # 获取数据
+    report(60, '登录成功，正在调用数据API...', 'fetch')
     
-    if task_status['running']:
-        return jsonify({'success': False, 'message': '任务正在运行中'})
+    start_date, end_date = calculate_recent_7days()
+    
+    meter_ids = [
+        '1261181000263', '1261181000300', '1262330402331',
+        '2190066', '2190493', '2501200108', '2520005', '2520006'
+    ]
+    
+    data = pool.fetch_water_yield(start_date, end_date, meter_ids=meter_ids)
+    
+    if data is None:
+        return {'success': False, 'error': 'API返回空响应或无效的JSON数据', 'message': '数据获取失败'}
+    
+    # 保存数据到读数存储（按 (水表, 日期) 去重合并，不再每次生成快照文件）
+    report(90, '正在保存数据...', 'store')
+    from water_store import get_water_store
     
-    # 重置状态
-    task_status = {
-        'running': True,
-        'progress': 0,
-        'message': '任务已启动...',
-        'data': None,
-        'error': None,
-        'start_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'end_time': None
+    note = f'通过Web界面获取的{datetime.now().strftime("%Y年%m月%d日")}最新数据'
+    get_water_store().record_fetch(data, start_date, end_date, 'web_interface_scraper', note=note)
+    
+    output_data = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'source': 'web_interface_scraper',
+        'success': True,
+        'data_type': 'json',
+        'calculation_date': datetime.now().strftime('%Y-%m-%d'),
+        'date_range': {
+            'start': start_date,
+            'end': end_date,
+            'description': '昨天往前推7天的数据'
+        },
+        'meter_count': len(meter_ids),
+        'data': data,
+        'note': note
     }
     
-    # 在后台线程运行任务
-    thread = threading.Thread(target=run_data_task)
-    thread.daemon = True
-    thread.start()
+    report(100, f'数据获取成功！共获取{len(data.get("rows", []))}个水表数据')
+    return output_data
+
+def auto_update_job(params, report):
+    """任务：获取指定日期的数据并写入Excel"""
+    from integrated_excel_updater import update_excel_with_real_data
+    from daily_update_pipeline import replay_journal
+    
+    # 先重放写入日志中未保存的记录（如上次等锁超时留下的数据），失败的记录累计次数，多次失败后转为死信
+    replay_journal()
     
-    return jsonify({'success': True, 'message': '任务已启动'})
+    report(10, f"正在获取 {params['date']} 的数据并写入Excel...", 'update')
+    # 获取、写入、重算派生列、设置打开时重新计算，工作簿只加载和保存一次；重试时写入日志中的数据不再重新获取
+    result = update_excel_with_real_data(params['date'])
+    if result.get('success'):
+        report(100, result.get('message') or '数据更新成功！')
+    return result
 
-def run_data_task():
-    """执行数据获取任务 - 从水务系统获取真实数据"""
-    global task_status
+def backfill_job(params, report):
+    """任务：按日期范围批量补数"""
+    from water_backfill import backfill_excel
     
-    try:
-        task_status['running'] = True
-        task_status['progress'] = 0
-        task_status['message'] = '开始获取数据...'
-        task_status['error'] = None
-        task_status['start_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        task_status['data'] = None
-        
-        # 更新进度
-        task_status['progress'] = 10
-        task_status['message'] = '正在登录系统...'
-        time.sleep(1)
-        
-        # 直接调用数据获取函数
-        task_status['progress'] = 30
-        task_status['message'] = '正在获取数据...'
-        
-        # 导入必要的库
-        import requests
-        from bs4 import BeautifulSoup
-        import hashlib
-        
-        session = requests.Session()
-        
-        # 登录
-        task_status['progress'] = 40
-        task_status['message'] = '正在登录水务系统...'
-        
-        login_url = "http://axwater.dmas.cn/Login.aspx"
-        login_page = session.get(login_url)
-        
-        soup = BeautifulSoup(login_page.text, 'html.parser')
-        form = soup.find('form')
-        form_data = {}
-        
-        for input_elem in form.find_all('input'):
-            name = input_elem.get('name')
-            value = input_elem.get('value', '')
-            if name:
-                form_data[name] = value
-        
-        username = '13509288500'
-        password = '288500'
-        form_data['user'] = username
-        form_data['pwd'] = hashlib.md5(password.encode('utf-8')).hexdigest()
-        
-        login_response = session.post(login_url, data=form_data)
-        
-        if "window.location='frmMain.aspx'" in login_response.text:
-            task_status['progress'] = 60
-            task_status['message'] = '登录成功，正在访问报表页面...'
-            
-            # 跳转到主页面
-            main_url = "http://axwater.dmas.cn/frmMain.aspx"
-            main_response = session.get(main_url)
-            
-            if main_response.status_code == 200:
-                # 访问报表页面
-                task_status['progress'] = 70
-                task_status['message'] = '正在获取水表数据...'
-                time.sleep(1)
-                
-                report_url = "http://axwater.dmas.cn/reports/FluxRpt.aspx"
-                report_response = session.get(report_url)
-                
-                if '登录超时' not in report_response.text:
-                    # 获取数据
-                    task_status['progress'] = 80
-                    task_status['message'] = '正在调用数据API...'
-                    
-                    start_date, end_date = calculate_recent_7days()
-                    
-                    meter_ids = [
-                        '1261181000263', '1261181000300', '1262330402331',
-                        '2190066', '2190493', '2501200108', '2520005', '2520006'
-                    ]
-                    
-                    formatted_node_ids = "'" + "','".join(meter_ids) + "'"
-                    
-                    api_url = "http://axwater.dmas.cn/reports/ashx/getRptWaterYield.ashx"
-                    api_params = {
-                        'nodeId': formatted_node_ids,
-                        'startDate': start_date,
-                        'endDate': end_date,
-                        'meterType': '-1',
-                        'statisticsType': 'flux',
-                        'type': 'dayRpt'
-                    }
-                    
-                    api_headers = {
-                        'Referer': report_url,
-                        'X-Requested-With': 'XMLHttpRequest',
-                        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                    }
-                    
-                    api_response = session.post(api_url, data=api_params, headers=api_headers)
-                    
-                    if api_response.text and len(api_response.text) > 10:
-                        try:
-                            data = api_response.json()
-                            
-                            # 保存数据
-                            timestamp = time.strftime('%Y%m%d_%H%M%S')
-                            filename = f"WEB_COMPLETE_8_METERS_{timestamp}.json"
-                            
-                            output_data = {
-                                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
-                                'source': 'web_interface_scraper',
-                                'success': True,
-                                'data_type': 'json',
-                                'calculation_date': datetime.now().strftime('%Y-%m-%d'),
-                                'date_range': {
-                                    'start': start_date,
-                                    'end': end_date,
-                                    'description': '昨天往前推7天的数据'
-                                },
-                                'meter_count': len(meter_ids),
-                                'data': data,
-                                'note': f'通过Web界面获取的{datetime.now().strftime("%Y年%m月%d日")}最新数据'
-                            }
-                            
-                            with open(filename, 'w', encoding='utf-8') as f:
-                                json.dump(output_data, f, ensure_ascii=False, indent=2)
-                            
-                            task_status['data'] = output_data
-                            task_status['progress'] = 100
-                            task_status['message'] = f'数据获取成功！共获取{len(data.get("rows", []))}个水表数据'
-                            
-                        except json.JSONDecodeError:
-                            task_status['error'] = 'API返回的不是有效的JSON数据'
-                            task_status['message'] = '数据解析失败'
-                    else:
-                        task_status['error'] = 'API返回空响应'
-                        task_status['message'] = '数据获取失败'
-                else:
-                    task_status['error'] = '访问报表页面时显示登录超时'
-                    task_status['message'] = '会话已过期'
-            else:
-                task_status['error'] = '无法访问主页面'
-                task_status['message'] = '系统访问失败'
-        else:
-            task_status['error'] = '登录失败，请检查账号密码'
-            task_status['message'] = '登录失败'
-            
-    except Exception as e:
-        task_status['error'] = str(e)
-        task_status['message'] = f'❌ 获取失败: {str(e)}'
-    finally:
-        task_status['running'] = False
-        task_status['end_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    report(10, f"正在补数 {params['start_date']} ~ {params['end_date']}...", 'backfill')
+    result = backfill_excel(params['start_date'], params['end_date'])
+    if result.get('success'):
+        report(100, result['message'])
+    return result
+
+# 任务队列中的任务类型（每个 gunicorn 进程导入本模块时登记）
+from job_queue import register_job, get_job_queue
+
+register_job(DATA_TASK_KIND, run_data_task, priority='interactive')
+register_job('auto_update', auto_update_job, priority='interactive', max_attempts=2)
+register_job('add_summary', add_summary_job, priority='interactive')
+register_job('github_sync', github_sync_job, priority='normal', max_attempts=3)
+register_job('backfill', backfill_job, priority='backfill')
+
+@app.before_request
+def ensure_job_workers():
+    """在当前进程中启动任务队列的工作线程（--preload 时 fork 前启动的线程不会带到工作进程）"""
+    get_job_queue()
+
+@app.route('/cancel_task', methods=['POST'])
+def cancel_task():
+    """取消任务：排队中的任务直接取消，执行中的任务在下一步开始前停止"""
+    from job_queue import cancel
+    from task_registry import task_status_dict
+    
+    data = request.get_json(silent=True) or {}
+    task_id = data.get('task_id')
+    if not task_id:
+        return jsonify({'success': False, 'message': '请提供任务ID'})
+    
+    task = cancel(task_id)
+    if task is None:
+        return jsonify({'success': False, 'message': f'任务不存在: {task_id}'})
+    return jsonify({'success': True, 'message': task['message'], 'status': task_status_dict(task)})
 
 @app.route('/history')
 def history_page():
@@ -671,23 +671,17 @@ def history_page():
 
 @app.route('/get_history')
 def get_history():
-    """获取历史数据文件列表"""
+    """获取历史取数记录列表"""
     try:
-        json_files = glob.glob('WEB_COMPLETE_8_METERS_*.json')
-        json_files.sort(reverse=True)
+        from water_store import get_water_store
         
         history_data = []
-        for file in json_files[:20]:  # 最多返回20条
-            try:
-                with open(file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    history_data.append({
-                        'file': file,
-                        'date': data.get('export_time', '未知'),
-                        'count': len(data.get('data', []))
-                    })
-            except:
-                continue
+        for fetch in get_water_store().recent_fetches(limit=20):  # 最多返回20条
+            history_data.append({
+                'file': fetch['source_file'] or f"{fetch['start_date']} ~ {fetch['end_date']}",
+                'date': fetch['fetched_at'],
+                'count': fetch['meter_count']
+            })
         
         return jsonify({'success': True, 'data': history_data})
     except Exception as e:
@@ -696,7 +690,7 @@ def get_history():
 @app.route('/task_status')
 def task_status_route():
     """获取任务状态（兼容路由）"""
-    return jsonify(task_status)
+    return jsonify(_requested_task_status())
 
 @app.route('/export_excel', methods=['POST'])
 def export_excel():
@@ -745,53 +739,59 @@ def update_excel_date():
 
 @app.route('/execute_auto_update', methods=['POST'])
 def execute_auto_update():
-    """执行自动更新Excel任务"""
+    """执行自动更新Excel任务（提交到任务队列，同一日期的重复点击只执行一次）"""
     try:
-        data = request.get_json()
+        from job_queue import enqueue, QueueFullError
+        
+        data = request.get_json(silent=True) or {}
         target_date = data.get('date')
         
         if not target_date:
             return jsonify({'success': False, 'message': '请提供目标日期'})
         
-        # 导入更新模块
-        from integrated_excel_updater import update_excel_with_real_data
+        try:
+            task, created = enqueue('auto_update', {'date': target_date})
+        except QueueFullError as e:
+            return jsonify({'success': False, 'message': str(e)})
+        return queued_response(task, created)
         
-        # 执行更新
-        result = update_excel_with_real_data(target_date)
-        
-        # 如果更新成功，重新保存Excel以保留公式
-        if result.get('success'):
-            try:
-                excel_path = os.path.abspath(DATA_SOURCE_PATH)
-                print(f"[INFO] 重新保存Excel文件以保留公式: {excel_path}")
-                
-                # 以保留公式的方式重新加载和保存
-                wb = openpyxl.load_workbook(excel_path, data_only=False)
-                wb.calculation.calcMode = 'auto'
-                wb.calculation.fullCalcOnLoad = True
-                wb.save(excel_path)
-                wb.close()
-                
-                print("[SUCCESS] Excel文件已重新保存，公式已保留")
-                result['formula_preserved'] = True
-                result['note'] = '公式已保留，将在Excel中打开时自动计算'
-                
-            except Exception as save_error:
-                print(f"[WARNING] 重新保存失败: {save_error}")
-                result['formula_preserved'] = False
-                result['save_warning'] = f'数据已更新，但重新保存失败: {str(save_error)}'
-        
-        return jsonify(result)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'更新失败: {str(e)}'
+        })
+
+@app.route('/execute_backfill', methods=['POST'])
+def execute_backfill():
+    """按日期范围批量补数（提交到任务队列，优先级低于交互操作）"""
+    try:
+        from job_queue import enqueue, QueueFullError
         
-    except ImportError as e:
+        data = request.get_json(silent=True) or {}
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+
+        if not start_date or not end_date:
+            return jsonify({'success': False, 'message': '请提供开始日期和结束日期'})
+
+        for value in (start_date, end_date):
+            datetime.strptime(value, '%Y-%m-%d')
+
+        try:
+            task, created = enqueue('backfill', {'start_date': start_date, 'end_date': end_date})
+        except QueueFullError as e:
+            return jsonify({'success': False, 'message': str(e)})
+        return queued_response(task, created)
+
+    except ValueError as e:
         return jsonify({
             'success': False,
-            'message': f'缺少必要的模块: {str(e)}'
+            'message': f'日期格式错误: {str(e)}'
         })
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'更新失败: {str(e)}'
+            'message': f'补数失败: {str(e)}'
         })
 
 # ==================== 功能4：在线查看Excel表格 ====================
@@ -815,9 +815,16 @@ def view_partition_meter():
 
 @app.route('/api/get_partition_meter_data')
 def get_partition_meter_data():
-    """获取分区计量表数据"""
+    """
+    获取分区计量表数据（分页）
+    
+    参数：sheet 工作表名称（默认"石滩区"），offset 起始行（0开始），limit 行数
+    每个工作表按文件版本只解析一次，合并单元格只返回与本页相交的部分
+    """
     try:
         sheet_name = request.args.get('sheet', '石滩区')  # 默认显示"石滩区"工作表
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', type=int)
         
         if not os.path.exists(EXCEL_PATH):
             return jsonify({
@@ -825,52 +832,14 @@ def get_partition_meter_data():
                 'message': f'Excel文件不存在: {EXCEL_PATH}'
             })
         
-        # 读取Excel文件
-        wb = openpyxl.load_workbook(EXCEL_PATH, data_only=True)
-        
         # 获取所有工作表名称
-        sheet_names = wb.sheetnames
+        sheet_names = get_sheet_names(EXCEL_PATH)
         
         # 检查请求的工作表是否存在
         if sheet_name not in sheet_names:
             sheet_name = sheet_names[0]  # 如果不存在，使用第一个工作表
         
-        ws = wb[sheet_name]
-        
-        # 读取所有数据
-        data = []
-        for row in ws.iter_rows(values_only=True):
-            # 转换为列表，处理None值
-            row_data = []
-            for cell in row:
-                if cell is None:
-                    row_data.append('')
-                elif isinstance(cell, (int, float)):
-                    # 检查是否是Excel日期序列号
-                    if isinstance(cell, int) and 40000 <= cell <= 50000:
-                        try:
-                            excel_start = datetime(1899, 12, 30)
-                            actual_date = excel_start + timedelta(days=cell)
-                            row_data.append(f"{actual_date.year}年{actual_date.month}月{actual_date.day}日")
-                        except:
-                            row_data.append(cell)
-                    else:
-                        row_data.append(cell)
-                else:
-                    row_data.append(str(cell))
-            data.append(row_data)
-        
-        # 获取合并单元格信息
-        merged_cells = []
-        for merged_range in ws.merged_cells.ranges:
-            merged_cells.append({
-                'start_row': merged_range.min_row - 1,  # 转换为0索引
-                'start_col': merged_range.min_col - 1,
-                'end_row': merged_range.max_row - 1,
-                'end_col': merged_range.max_col - 1
-            })
-        
-        wb.close()
+        page = get_sheet_page(get_parsed_sheet(EXCEL_PATH, sheet_name), offset, limit)
         
         # 获取文件最后修改时间
         file_time = os.path.getmtime(EXCEL_PATH)
@@ -878,14 +847,11 @@ def get_partition_meter_data():
         
         return jsonify({
             'success': True,
-            'data': data,
             'sheet_names': sheet_names,
             'current_sheet': sheet_name,
-            'merged_cells': merged_cells,
-            'total_rows': len(data),
-            'total_cols': len(data[0]) if data else 0,
             'last_update': last_update,
-            'file_name': '石滩区分区计量.xlsx'
+            'file_name': '石滩区分区计量.xlsx',
+            **page
         })
         
     except Exception as e:
@@ -947,13 +913,10 @@ def get_weekly_stats():
         if not os.path.exists(excel_path):
             return jsonify({'success': False, 'message': 'Excel文件不存在'})
         
-        wb = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
-        ws = wb.active
-        
-        # 读取表头（第4行）
-        all_rows = list(ws.iter_rows(values_only=True))
-        header = all_rows[3]
-        data_rows = all_rows[4:]
+        # 读取表头（第4行）和数据（使用已解析工作表缓存）
+        sheet = get_parsed_sheet(excel_path)
+        header = sheet.header
+        data_rows = sheet.data_rows
         
         # 计算指定周的日期范围
         year_int = int(year)
@@ -969,15 +932,10 @@ def get_weekly_stats():
         week_start = first_monday + timedelta(weeks=week_int - 1)
         week_end = week_start + timedelta(days=6)
         
-        # 筛选指定周的数据
-        weekly_data = []
-        for row in data_rows:
-            date_val = row[0]
-            if isinstance(date_val, datetime):
-                if week_start <= date_val <= week_end:
-                    weekly_data.append(row)
-        
-        wb.close()
+        # 筛选指定周的数据（日期索引二分查找）
+        date_index = get_sheet_date_index(sheet)
+        week_positions = date_index.range(week_start, week_end)
+        weekly_data = [data_rows[i] for i in week_positions]
         
         # 格式化日期范围
         date_range = f"{week_start.strftime('%m月%d日')} - {week_end.strftime('%m月%d日')}"
@@ -992,60 +950,31 @@ def get_weekly_stats():
                 'message': '该周暂无数据'
             })
         
-        # 计算统计数据
+        # 统计数据直接取预先计算的周汇总（每列的总计/平均值/最大值/最小值，排除空白和0值）
         stats = []
         summary_data = [['指标名称'] + list(header[1:])]  # 表头
+        results = (get_period_results(sheet, 'week', week_start.strftime('%Y-%m-%d'))
+                   or get_supply_matrix(sheet).aggregate(week_positions))
         
         # 统计指标
-        stat_names = ['总计', '平均值', '最大值', '最小值']
+        stat_keys = [('总计', 'total'), ('平均值', 'average'), ('最大值', 'max'), ('最小值', 'min')]
         
-        for stat_name in stat_names:
+        for stat_name, stat_key in stat_keys:
             row_data = [stat_name]
-            for col_idx in range(1, len(header)):
-                values = []
-                for row in weekly_data:
-                    if col_idx < len(row) and row[col_idx] is not None:
-                        try:
-                            val = float(row[col_idx])
-                            if val != 0:  # 排除0值
-                                values.append(val)
-                        except (ValueError, TypeError):
-                            pass
-                
-                if values:
-                    if stat_name == '总计':
-                        row_data.append(sum(values))
-                    elif stat_name == '平均值':
-                        row_data.append(sum(values) / len(values))
-                    elif stat_name == '最大值':
-                        row_data.append(max(values))
-                    elif stat_name == '最小值':
-                        row_data.append(min(values))
-                else:
-                    row_data.append(0)
-            
+            for result in results:
+                row_data.append(result[stat_key] if result else 0)
             summary_data.append(row_data)
         
         # 生成统计卡片数据（取前4列的总计）
-        if len(weekly_data) > 0:
-            for col_idx in range(1, min(5, len(header))):
-                col_name = header[col_idx] if col_idx < len(header) else f'列{col_idx}'
-                values = []
-                for row in weekly_data:
-                    if col_idx < len(row) and row[col_idx] is not None:
-                        try:
-                            val = float(row[col_idx])
-                            if val != 0:
-                                values.append(val)
-                        except (ValueError, TypeError):
-                            pass
-                
-                if values:
-                    stats.append({
-                        'name': col_name,
-                        'value': round(sum(values)),
-                        'unit': '周累计 (m³)'
-                    })
+        for col_idx in range(1, min(5, len(header))):
+            col_name = header[col_idx] if col_idx < len(header) else f'列{col_idx}'
+            result = results[col_idx - 1]
+            if result:
+                stats.append({
+                    'name': col_name,
+                    'value': round(result['total']),
+                    'unit': '周累计 (m³)'
+                })
         
         # 返回数据
         return jsonify({
@@ -1073,25 +1002,21 @@ def get_monthly_stats():
         if not os.path.exists(excel_path):
             return jsonify({'success': False, 'message': 'Excel文件不存在'})
         
-        wb = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
-        ws = wb.active
-        
-        # 读取表头（第4行）
-        all_rows = list(ws.iter_rows(values_only=True))
-        header = all_rows[3]
-        data_rows = all_rows[4:]
+        # 读取表头（第4行）和数据（使用已解析工作表缓存）
+        sheet = get_parsed_sheet(excel_path)
+        header = sheet.header
+        data_rows = sheet.data_rows
         
-        # 筛选指定年月的数据
+        # 筛选指定年月的数据（日期索引二分查找）
         year_int = int(year)
         month_int = int(month)
         monthly_data = []
         
-        for row in data_rows:
-            date_val = row[0]
-            if isinstance(date_val, datetime) and date_val.year == year_int and date_val.month == month_int:
-                monthly_data.append(row)
-        
-        wb.close()
+        if 1 <= month_int <= 12:
+            month_start, month_end = month_bounds(year_int, month_int)
+            date_index = get_sheet_date_index(sheet)
+            month_positions = date_index.range(month_start, month_end)
+            monthly_data = [data_rows[i] for i in month_positions]
         
         if not monthly_data:
             return jsonify({
@@ -1102,26 +1027,10 @@ def get_monthly_stats():
                 'message': f'未找到{year}年{month}月的数据'
             })
         
-        # 计算统计数据（对数值列求和、平均等）
-        summary = {}
-        for col_idx, col_name in enumerate(header):
-            if col_idx == 0:  # 跳过日期列
-                continue
-            
-            values = []
-            for row in monthly_data:
-                cell_value = row[col_idx]
-                if cell_value and isinstance(cell_value, (int, float)):
-                    values.append(cell_value)
-            
-            if values:
-                summary[col_name] = {
-                    'total': round(sum(values)),
-                    'average': round(sum(values) / len(values)),
-                    'max': round(max(values)),
-                    'min': round(min(values)),
-                    'count': len(values)
-                }
+        # 统计数据直接取预先计算的月汇总
+        results = (get_period_results(sheet, 'month', f'{year_int}-{month_int:02d}')
+                   or get_supply_matrix(sheet).aggregate(month_positions))
+        summary = summarize_by_header(header, results)
         
         return jsonify({
             'success': True,
@@ -1156,25 +1065,19 @@ def get_quarterly_stats():
         if not os.path.exists(excel_path):
             return jsonify({'success': False, 'message': 'Excel文件不存在'})
         
-        wb = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
-        ws = wb.active
-        
-        # 读取表头和数据
-        all_rows = list(ws.iter_rows(values_only=True))
-        header = all_rows[3]
-        data_rows = all_rows[4:]
+        # 读取表头（第4行）和数据（使用已解析工作表缓存）
+        sheet = get_parsed_sheet(excel_path)
+        header = sheet.header
+        data_rows = sheet.data_rows
         
-        # 筛选季度数据
+        # 筛选季度数据（季度内的月份连续，按首月第一天到末月最后一天取范围）
         year_int = int(year)
         months_int = [int(m) for m in months]
-        quarterly_data = []
-        
-        for row in data_rows:
-            date_val = row[0]
-            if isinstance(date_val, datetime) and date_val.year == year_int and date_val.month in months_int:
-                quarterly_data.append(row)
-        
-        wb.close()
+        quarter_start, _ = month_bounds(year_int, months_int[0])
+        _, quarter_end = month_bounds(year_int, months_int[-1])
+        date_index = get_sheet_date_index(sheet)
+        quarter_positions = date_index.range(quarter_start, quarter_end)
+        quarterly_data = [data_rows[i] for i in quarter_positions]
         
         if not quarterly_data:
             return jsonify({
@@ -1185,26 +1088,11 @@ def get_quarterly_stats():
                 'message': f'未找到{year}年第{quarter}季度的数据'
             })
         
-        # 计算季度统计
-        summary = {}
-        for col_idx, col_name in enumerate(header):
-            if col_idx == 0:
-                continue
-            
-            values = []
-            for row in quarterly_data:
-                cell_value = row[col_idx]
-                if cell_value and isinstance(cell_value, (int, float)):
-                    values.append(cell_value)
-            
-            if values:
-                summary[col_name] = {
-                    'total': round(sum(values)),
-                    'average': round(sum(values) / len(values)),
-                    'max': round(max(values)),
-                    'min': round(min(values)),
-                    'count': len(values)
-                }
+        # 季度统计直接取预先计算的季度汇总
+        quarter_key = f'{year_int}-Q{(months_int[0] - 1) // 3 + 1}'
+        results = (get_period_results(sheet, 'quarter', quarter_key)
+                   or get_supply_matrix(sheet).aggregate(quarter_positions))
+        summary = summarize_by_header(header, results)
         
         return jsonify({
             'success': True,
@@ -1223,7 +1111,14 @@ def get_quarterly_stats():
 def get_excel_data():
     """
     获取Excel数据（只读模式）
-    默认只显示当前年份的数据，支持分页和搜索
+    默认只显示当前年份的数据，支持分页、搜索、日期范围、数值范围筛选和排序
+    
+    可选参数：
+        start_date / end_date: 日期范围 YYYY-MM-DD
+        has_data=1: 只返回有有效数值的行
+        filters: 数值范围筛选JSON，如 {"荔新大道": {"min": 1000, "max": 50000}}，也支持AG-Grid数值筛选模型
+        sort / order: 排序列（列下标或列名）和方向 asc/desc
+        count=0: 不统计总行数，当前页取满后即停止扫描
     """
     try:
         excel_path = DATA_SOURCE_PATH
@@ -1240,19 +1135,10 @@ def get_excel_data():
         search_text = request.args.get('search', '', type=str)
         year_filter = request.args.get('year', str(datetime.now().year), type=str)  # 默认当前年份
         
-        # 读取Excel文件
-        wb = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
-        ws = wb.active
-        
-        # 获取所有数据
-        all_rows = []
-        for row in ws.iter_rows(values_only=True):
-            row_data = [cell if cell is not None else '' for cell in row]
-            all_rows.append(row_data)
+        # 读取Excel文件（使用已解析工作表缓存）
+        sheet = get_parsed_sheet(excel_path)
         
-        wb.close()
-        
-        if len(all_rows) < 5:
+        if len(sheet.rows) < 5:
             return jsonify({
                 'success': False,
                 'message': 'Excel文件数据不完整'
@@ -1265,53 +1151,31 @@ def get_excel_data():
         # 第4行: 真正的表头
         # 第5行开始: 数据
         
-        # 使用第4行作为表头（索引3）
-        header = all_rows[3]
-        
-        # 从第5行开始作为数据（索引4）
-        data_rows = all_rows[4:]
-        
-        # 组合成最终数据：[表头, 数据行1, 数据行2, ...]
-        all_data = [header] + data_rows
-        
-        # 按年份过滤（如果不是"全部"）
-        if year_filter != 'all':
-            header = all_data[0]
-            filtered_by_year = [header]  # 保留表头
-            
-            for row in all_data[1:]:
-                # 检查第一列（日期列）是否包含指定年份
-                date_str = str(row[0]) if row and row[0] else ''
-                if year_filter in date_str:
-                    filtered_by_year.append(row)
-        else:
-            filtered_by_year = all_data
-        
-        # 如果有搜索条件，进一步过滤
-        if search_text:
-            search_lower = search_text.lower()
-            filtered_data = [filtered_by_year[0]]  # 保留表头
-            for row in filtered_by_year[1:]:
-                if any(search_lower in str(cell).lower() for cell in row):
-                    filtered_data.append(row)
-        else:
-            filtered_data = filtered_by_year
-        
-        # 分离表头和数据行
-        header = filtered_data[0]
-        data_rows_only = filtered_data[1:]
+        # 按需查询：年份/日期范围走日期索引，只转换当前页的行
+        try:
+            result = query_rows(
+                sheet,
+                year=year_filter,
+                search=search_text,
+                start_date=request.args.get('start_date', ''),
+                end_date=request.args.get('end_date', ''),
+                has_data=request.args.get('has_data', '0') in ('1', 'true'),
+                filters=request.args.get('filters', ''),
+                sort=request.args.get('sort', ''),
+                order=request.args.get('order', 'asc'),
+                page=page,
+                page_size=page_size,
+                count=request.args.get('count', '1') not in ('0', 'false')
+            )
+        except QueryError as e:
+            return jsonify({'success': False, 'message': f'查询参数错误: {str(e)}'})
         
-        # 计算分页（只对数据行分页）
-        total_data_rows = len(data_rows_only)
+        header = result['header']
+        total_data_rows = result['total_rows']
         total_pages = (total_data_rows + page_size - 1) // page_size if total_data_rows > 0 else 1
-        start_idx = (page - 1) * page_size
-        end_idx = min(start_idx + page_size, total_data_rows)
-        
-        # 获取当前页的数据行
-        current_page_rows = data_rows_only[start_idx:end_idx]
         
         # 每页都返回：表头 + 当前页数据
-        page_data = [header] + current_page_rows
+        page_data = [header] + result['rows']
         
         # 获取文件修改时间
         file_time = os.path.getmtime(excel_path)
@@ -1321,6 +1185,8 @@ def get_excel_data():
             'success': True,
             'data': page_data,
             'total_rows': total_data_rows,  # 只计算数据行数，不含表头
+            'total_exact': result['total_exact'],
+            'has_more': result['has_more'],
             'total_cols': len(header) if header else 0,
             'current_page': page,
             'page_size': page_size,
@@ -1335,6 +1201,40 @@ def get_excel_data():
             'message': f'读取Excel失败: {str(e)}'
         })
 
+@app.route('/api/export_supply_data')
+def export_supply_data():
+    """
+    流式导出每日供水数据
+    
+    参数：
+        format: ndjson（默认）、csv 或 arrow（需要pyarrow）
+        start_date / end_date: 日期范围 YYYY-MM-DD，省略时导出全部
+    """
+    try:
+        excel_path = DATA_SOURCE_PATH
+        if not os.path.exists(excel_path):
+            return jsonify({'success': False, 'message': 'Excel文件不存在'}), 404
+        
+        export_format = request.args.get('format', 'ndjson', type=str).lower()
+        start_date = request.args.get('start_date', '', type=str)
+        end_date = request.args.get('end_date', '', type=str)
+        
+        sheet = get_parsed_sheet(excel_path)
+        try:
+            stream, mimetype, extension = export_stream(sheet, export_format, start_date, end_date)
+        except ExportError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        filename = f"daily_supply_{start_date or 'begin'}_{end_date or 'end'}.{extension}"
+        return Response(
+            stream_with_context(stream),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'导出失败: {str(e)}'}), 500
+
 # ==================== 数据分析仪表板 ====================
 
 @app.route('/dashboard')
@@ -1342,6 +1242,15 @@ def dashboard():
     """数据分析仪表板主页"""
     return render_template('dashboard.html')
 
+# 仪表板字段 -> 派生列名（公式见 supply_formulas.DAILY_SUPPLY_FORMULAS）
+DASHBOARD_DERIVED_FIELDS = {
+    'total_water': '石滩供水服务部日供水',
+    'diff': '环比差值',
+    'shitan': '石滩',
+    'sanjiang': '三江',
+    'shazhuang': '沙庄'
+}
+
 @app.route('/api/dashboard_data')
 def get_dashboard_data():
     """获取仪表板数据"""
@@ -1354,11 +1263,10 @@ def get_dashboard_data():
                 'message': 'Excel文件不存在'
             })
         
-        wb = openpyxl.load_workbook(excel_path, data_only=True)
-        ws = wb.active
+        sheet = get_parsed_sheet(excel_path)
         
         # 获取表头（第4行）
-        headers = [cell.value for cell in ws[4]]
+        headers = list(sheet.header)
         
         # 找到关键列的索引
         col_indices = {}
@@ -1368,49 +1276,63 @@ def get_dashboard_data():
                 if clean_header not in col_indices:
                     col_indices[clean_header] = idx
         
-        # 获取所有数据行（从第5行开始）
-        all_data = []
-        for row in ws.iter_rows(min_row=5, values_only=True):
-            if row[0]:  # 确保日期不为空
-                try:
-                    # 转换日期
-                    if isinstance(row[0], datetime):
-                        date_str = row[0].strftime('%Y-%m-%d')
-                    else:
-                        date_str = str(row[0])
-                    
-                    # 提取关键数据
-                    row_data = {
-                        'date': date_str,
-                        'total_water': row[col_indices.get('石滩供水服务部日供水', 2) - 1] if '石滩供水服务部日供水' in col_indices else 0,
-                        'diff': row[col_indices.get('环比差值', 3) - 1] if '环比差值' in col_indices else 0,
-                        'shitan': row[col_indices.get('石滩', 4) - 1] if '石滩' in col_indices else 0,
-                        'sanjiang': row[col_indices.get('三江', 5) - 1] if '三江' in col_indices else 0,
-                        'shazhuang': row[col_indices.get('沙庄', 6) - 1] if '沙庄' in col_indices else 0,
-                        'lixin': row[col_indices.get('荔新大道', 7) - 1] if '荔新大道' in col_indices else 0,
-                        'xincheng': row[col_indices.get('新城大道', 8) - 1] if '新城大道' in col_indices else 0,
-                        'sanjiang_new': row[col_indices.get('三江新总表', 9) - 1] if '三江新总表' in col_indices else 0,
-                    }
-                    
-                    # 过滤掉所有数据都为空或0的行
-                    has_data = any(v for k, v in row_data.items() if k != 'date' and v not in [None, 0, '0', '-', ''])
-                    if has_data:
-                        all_data.append(row_data)
-                except Exception as e:
-                    continue
-        
-        wb.close()
-        
-        # 按日期排序（最新的在前）
-        all_data.sort(key=lambda x: x['date'], reverse=True)
-        
-        # 过滤掉今天及未来的数据
         today = datetime.now()
         yesterday = today - timedelta(days=1)
         yesterday_str = yesterday.strftime('%Y-%m-%d')
+        month_start = datetime(today.year, today.month, 1)
         
-        # 只保留昨天及之前的数据
-        all_data = [item for item in all_data if item['date'] <= yesterday_str]
+        # 从昨天开始按日期倒序取数据（最新的在前，不包含今天及未来）
+        # 只需覆盖最近30条有数据的行和本月的数据，用日期索引定位起点后向前遍历
+        date_index = get_sheet_date_index(sheet)
+        all_data = []
+        # 本月累计（只统计到昨天），与显示的日数据使用同一套数值（包括按公式补算的派生列）
+        month_total = 0.0
+        position = date_index.last_on_or_before(yesterday)
+        while position >= 0:
+            row_date = date_index.dates[position]
+            if len(all_data) >= 30 and row_date < month_start:
+                break
+            row = sheet.data_rows[date_index.refs[position]]
+            position -= 1
+            try:
+                # 转换日期
+                if isinstance(row[0], datetime):
+                    date_str = row[0].strftime('%Y-%m-%d')
+                else:
+                    date_str = str(row[0])
+                
+                # 提取关键数据
+                row_data = {
+                    'date': date_str,
+                    'total_water': row[col_indices.get('石滩供水服务部日供水', 2) - 1] if '石滩供水服务部日供水' in col_indices else 0,
+                    'diff': row[col_indices.get('环比差值', 3) - 1] if '环比差值' in col_indices else 0,
+                    'shitan': row[col_indices.get('石滩', 4) - 1] if '石滩' in col_indices else 0,
+                    'sanjiang': row[col_indices.get('三江', 5) - 1] if '三江' in col_indices else 0,
+                    'shazhuang': row[col_indices.get('沙庄', 6) - 1] if '沙庄' in col_indices else 0,
+                    'lixin': row[col_indices.get('荔新大道', 7) - 1] if '荔新大道' in col_indices else 0,
+                    'xincheng': row[col_indices.get('新城大道', 8) - 1] if '新城大道' in col_indices else 0,
+                    'sanjiang_new': row[col_indices.get('三江新总表', 9) - 1] if '三江新总表' in col_indices else 0,
+                }
+                
+                # 派生列为空（如公式缓存值丢失）时，按公式定义从水表读数计算
+                empty_derived = [key for key in DASHBOARD_DERIVED_FIELDS
+                                 if DASHBOARD_DERIVED_FIELDS[key] in col_indices and row_data[key] in (None, '')]
+                if empty_derived:
+                    previous_row = sheet.data_rows[date_index.refs[position]] if position >= 0 else None
+                    derived = evaluate_sheet_row(row, col_indices, previous_row)
+                    for key in empty_derived:
+                        row_data[key] = round(derived[DASHBOARD_DERIVED_FIELDS[key]], 2)
+                
+                total_water = row_data['total_water']
+                if row_date >= month_start and isinstance(total_water, (int, float)) and not isinstance(total_water, bool):
+                    month_total += total_water
+                
+                # 过滤掉所有数据都为空或0的行
+                has_data = any(v for k, v in row_data.items() if k != 'date' and v not in [None, 0, '0', '-', ''])
+                if has_data:
+                    all_data.append(row_data)
+            except Exception as e:
+                continue
         
         today_data = None
         yesterday_data = None
@@ -1444,7 +1366,6 @@ def get_dashboard_data():
         # 获取本月数据（只统计到昨天）
         current_month = today.strftime('%Y-%m')
         month_data = [item for item in all_data if item['date'].startswith(current_month)]
-        month_total = sum(item.get('total_water', 0) or 0 for item in month_data)
         
         # 获取最近7天数据（用于折线图，不包含今天）
         recent_7_days = all_data[:7] if len(all_data) >= 7 else all_data
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发水务数据获取客户端
+用 asyncio 调度相互独立的请求（按日期窗口或按水表拆分），在并发数和请求速率限制下执行，
+多月数据的获取时间取决于最慢的一次请求而不是所有请求之和。
+请求本身仍是阻塞的 requests 调用，放到客户端自己的线程池中执行（线程并发，不是非阻塞I/O，线程数等于并发数）；
+登录、会话复用和超时重登由共享会话池（water_session_pool.get_session_pool）负责，
+客户端按并发数扩大会话池，每个并发请求都有自己的已登录会话，补数与其他取数共用同一个池。
+失败处理：
+- 响应为空/无效或数据不完整（total 大于返回的行数）时，对半拆分窗口重试（最多拆分 max_split_depth 层）
+- 网络错误有限次重试；登录失败直接结束本次获取，不再拆分
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from datetime import datetime, timedelta
+
+from water_session_pool import get_session_pool, WaterApiError
+
+# 异步客户端配置
+ASYNC_CLIENT_CONFIG = {
+    'concurrency': 6,           # 同时进行的最大请求数（会话池按此扩容）
+    'rate_per_second': 4,       # 每秒最多发起的请求数
+    'max_window_days': 31,      # 单次请求的最大天数
+    'max_split_depth': 3,       # 响应无效或不完整时窗口最多拆分的层数（31天最多拆到4天）
+    'max_retries': 2,           # 网络错误的重试次数
+    'retry_delay': 1.0,         # 网络错误重试前的等待秒数（按次数递增）
+    'split': 'window'           # 'window' 按日期窗口拆分；'meter' 再按水表拆分
+}
+
+# 完整的8个水表ID列表
+METER_IDS = [
+    '1261181000263',  # 荔新大道DN1200流量计
+    '1261181000300',  # 新城大道医院DN800流量计
+    '1262330402331',  # 宁西总表DN1200
+    '2190066',        # 三江新总表DN800
+    '2190493',        # 沙庄总表
+    '2501200108',     # 2501200108
+    '2520005',        # 如丰大道600监控表
+    '2520006'         # 三棵树600监控表
+]
+
+
+def _to_date(value):
+    """把 'YYYY-MM-DD' 字符串或 datetime 转换为 date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    return value
+
+
+def split_date_windows(start_date, end_date, max_days=None):
+    """
+    把日期范围切分为不超过 max_days 天的连续窗口
+
+    Returns:
+        list: [(开始日期字符串, 结束日期字符串), ...]
+    """
+    max_days = max_days or ASYNC_CLIENT_CONFIG['max_window_days']
+    start = _to_date(start_date)
+    end = _to_date(end_date)
+
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=max_days - 1), end)
+        windows.append((start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+        start = window_end + timedelta(days=1)
+    return windows
+
+
+def merge_rows(*row_lists):
+    """按水表ID合并多个请求返回的 rows，同一水表的日期列合并到一行"""
+    merged = {}
+    for rows in row_lists:
+        for row in rows:
+            if not isinstance(row, dict):
+                continue
+            key = row.get('ID') or row.get('Name')
+            if key in merged:
+                merged[key].update(row)
+            else:
+                merged[key] = dict(row)
+    return list(merged.values())
+
+
+class AsyncRateLimiter:
+    """简单的请求速率限制：相邻两次请求的发起间隔不小于 1/rate 秒"""
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second if rate_per_second else 0.0
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def is_partial_response(data):
+    """接口返回的行数少于 total（数据被截断）"""
+    total = data.get('total')
+    return isinstance(total, int) and total > len(data.get('rows') or [])
+
+
+class AsyncWaterClient:
+    """并发获取水表数据的客户端（asyncio 调度，请求在线程中执行）"""
+
+    def __init__(self, concurrency=None, rate_per_second=None, pool=None):
+        self.pool = pool or get_session_pool()
+        # 会话池至少要有与并发数相同的会话，否则多出的请求只会在线程中等待空闲会话
+        self.concurrency = concurrency or ASYNC_CLIENT_CONFIG['concurrency']
+        self.pool.ensure_size(self.concurrency)
+        # asyncio 默认线程池只有 CPU数+4 个线程，会把并发数压低，因此使用与并发数相同大小的线程池
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='water-fetch')
+        self.rate_per_second = rate_per_second if rate_per_second is not None else ASYNC_CLIENT_CONFIG['rate_per_second']
+
+    async def _request(self, semaphore, limiter, start_str, end_str, meter_ids):
+        """
+        受并发数和速率限制的一次接口请求，网络错误有限次重试
+
+        Raises:
+            WaterApiError: 登录失败、响应无效，或网络错误重试后仍失败
+        """
+        max_retries = ASYNC_CLIENT_CONFIG['max_retries']
+        for attempt in range(max_retries + 1):
+            async with semaphore:
+                await limiter.wait()
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(
+                        self._executor,
+                        partial(self.pool.fetch_water_yield, start_str, end_str, meter_ids, raise_errors=True))
+                except WaterApiError as e:
+                    if e.kind != 'transport' or attempt == max_retries:
+                        raise
+                    print(f"[WARNING] {start_str} ~ {end_str}: {e}，第{attempt + 1}次重试")
+            await asyncio.sleep(ASYNC_CLIENT_CONFIG['retry_delay'] * (attempt + 1))
+
+    async def _fetch_window(self, semaphore, limiter, start_str, end_str, meter_ids, depth=0):
+        """获取一个窗口；响应无效或不完整时对半拆分并发重试，登录/网络错误直接抛出"""
+        rows = None
+        try:
+            data = await self._request(semaphore, limiter, start_str, end_str, meter_ids)
+        except WaterApiError as e:
+            if e.kind != 'response':
+                raise
+            reason = str(e)
+        else:
+            rows = data.get('rows') if isinstance(data, dict) else None
+            if not isinstance(rows, list):
+                rows, reason = None, '响应中没有 rows'
+            elif is_partial_response(data):
+                reason = f"数据不完整（{len(rows)}/{data['total']}）"
+            else:
+                print(f"[OK] {start_str} ~ {end_str}: {len(rows)}个水表")
+                return rows
+
+        start = _to_date(start_str)
+        end = _to_date(end_str)
+        days = (end - start).days + 1
+        if days <= 1 or depth >= ASYNC_CLIENT_CONFIG['max_split_depth']:
+            print(f"[WARNING] {start_str} ~ {end_str}: {reason}，不再拆分")
+            return rows or []
+
+        middle = start + timedelta(days=days // 2 - 1)
+        print(f"[INFO] {start_str} ~ {end_str}: {reason}，拆分窗口重试")
+        left, right = await asyncio.gather(
+            self._fetch_window(semaphore, limiter, start_str, middle.strftime('%Y-%m-%d'), meter_ids, depth + 1),
+            self._fetch_window(semaphore, limiter, (middle + timedelta(days=1)).strftime('%Y-%m-%d'), end_str,
+                               meter_ids, depth + 1)
+        )
+        return merge_rows(left, right)
+
+    async def fetch_rows(self, start_date, end_date, meter_ids=None, split=None):
+        """
+        并发获取日期范围内的数据
+
+        Args:
+            split: 'window' 每个日期窗口一次请求；'meter' 每个窗口再按水表各发一次请求
+
+        Returns:
+            list: 合并后的 rows（每个水表一行，包含范围内所有日期列）
+
+        Raises:
+            WaterApiError: 登录失败或网络错误重试后仍失败（其余请求随之取消）
+        """
+        meter_ids = meter_ids or METER_IDS
+        split = split or ASYNC_CLIENT_CONFIG['split']
+
+        # 信号量和限速器需要绑定在当前事件循环中创建
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = AsyncRateLimiter(self.rate_per_second)
+
+        if split == 'meter':
+            groups = [[meter_id] for meter_id in meter_ids]
+        else:
+            groups = [meter_ids]
+
+        tasks = [
+            asyncio.ensure_future(self._fetch_window(semaphore, limiter, start_str, end_str, group))
+            for start_str, end_str in split_date_windows(start_date, end_date)
+            for group in groups
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except WaterApiError:
+            for task in tasks:
+                task.cancel()
+            raise
+        return merge_rows(*results)
+
+    async def get_water_data_for_date_range(self, start_date, end_date, split=None):
+        """获取指定日期范围的水表数据（与 complete_8_meters_getter 的返回格式一致）"""
+        start_str = _to_date(start_date).strftime('%Y-%m-%d')
+        end_str = _to_date(end_date).strftime('%Y-%m-%d')
+        print(f"🎯 并发获取日期范围: {start_str} ~ {end_str}")
+
+        try:
+            rows = await self.fetch_rows(start_str, end_str, split=split)
+        except Exception as e:
+            print(f"❌ 获取数据失败: {str(e)}")
+            return {'success': False, 'message': str(e)}
+
+        if not rows:
+            print("❌ 未获取到有效数据")
+            return {'success': False, 'message': '未获取到有效数据'}
+
+        print(f"✅ 成功获取数据，包含 {len(rows)} 个水表")
+        return {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'source': 'async_water_client',
+            'success': True,
+            'data_type': 'json',
+            'calculation_date': datetime.now().strftime('%Y-%m-%d'),
+            'date_range': {
+                'start': start_str,
+                'end': end_str,
+                'description': f'指定日期范围: {start_str} ~ {end_str}'
+            },
+            'meter_count': len(METER_IDS),
+            'data': {'total': len(rows), 'rows': rows}
+        }
+
+
+_default_client = None
+
+
+def get_async_client():
+    """获取进程内共享的客户端（使用共享会话池，会话在多次调用之间复用）"""
+    global _default_client
+    if _default_client is None:
+        _default_client = AsyncWaterClient()
+    return _default_client
+
+
+def fetch_rows(start_date, end_date, meter_ids=None, split=None):
+    """同步调用入口：并发获取日期范围内的 rows"""
+    return asyncio.run(get_async_client().fetch_rows(start_date, end_date, meter_ids=meter_ids, split=split))
+
+
+def get_water_data_for_date_range(start_date, end_date, split=None):
+    """同步调用入口：获取指定日期范围的水表数据"""
+    return asyncio.run(get_async_client().get_water_data_for_date_range(start_date, end_date, split=split))
+
+
+if __name__ == "__main__":
+    import sys
+    import json
+
+    if len(sys.argv) < 3:
+        print("用法: python async_water_client.py 开始日期 结束日期 [window|meter]")
+        sys.exit(1)
+
+    result = get_water_data_for_date_range(sys.argv[1], sys.argv[2], split=sys.argv[3] if len(sys.argv) > 3 else None)
+    print(json.dumps(result, ensure_ascii=False, indent=2)[:2000])
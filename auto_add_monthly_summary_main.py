@@ -6,9 +6,12 @@
 
 import openpyxl
 from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-import copy
 from datetime import date
 import sys
+from month_index import get_month_index, update_after_append, file_version
+from excel_style_registry import get_style_registry
+from workbook_journal import atomic_save
+from workbook_lock import workbook_lock, WorkbookLockTimeout
 
 def add_monthly_summary_to_main(excel_path, force_date=None):
     """
@@ -18,12 +21,22 @@ def add_monthly_summary_to_main(excel_path, force_date=None):
         excel_path: Excel文件路径
         force_date: 强制指定日期（用于测试）
     """
+    # 查找最后月份到保存在写入锁内完成，避免与网页添加统计表、每日更新同时改写文件
+    try:
+        with workbook_lock(excel_path):
+            return _add_monthly_summary_to_main(excel_path, force_date)
+    except WorkbookLockTimeout as e:
+        print(f"[ERROR] 工作簿正在被其他任务修改，请稍后重试: {e}")
+        return False
+
+def _add_monthly_summary_to_main(excel_path, force_date):
     print("=" * 80)
     print("[START] 在'石滩区'主工作表添加月度统计表")
     print("=" * 80)
     
-    # 加载工作簿
+    # 加载工作簿（记下加载时的版本，保存后据此更新月份索引）
     try:
+        loaded_version = file_version(excel_path)
         wb = openpyxl.load_workbook(excel_path)
     except Exception as e:
         print(f"[ERROR] 无法加载工作簿: {e}")
@@ -46,15 +59,14 @@ def add_monthly_summary_to_main(excel_path, force_date=None):
     print(f"[INFO] 将添加: {month_title}")
     
     # 检查是否已经添加过（避免重复）
-    for row in range(max(1, ws.max_row - 10), ws.max_row + 1):
-        for col in range(1, 10):
-            cell_value = ws.cell(row, col).value
-            if cell_value and month_title in str(cell_value):
-                print(f"[WARN] 检测到已存在 {month_title} 的统计表（第{row}行）")
-                print(f"[WARN] 跳过添加，避免重复")
-                return False
-    
-    # 开始添加统计表
+    existing_row = get_month_index(excel_path, sheet=ws).find(next_year, next_month)
+    if existing_row:
+        print(f"[WARN] 检测到已存在 {month_title} 的统计表（第{existing_row}行）")
+        print(f"[WARN] 跳过添加，避免重复")
+        return False
+    
+    # 开始添加统计表（样式按工作簿登记，相同样式只构建一次）
+    styles = get_style_registry(wb)
     start_row = ws.max_row + 2  # 留一行空行
     
     # 1. 添加月份标题
@@ -64,10 +76,7 @@ def add_monthly_summary_to_main(excel_path, force_date=None):
     
     # 复制格式
     if ws.cell(51, 5).value:
-        source_cell = ws.cell(51, 5)
-        month_cell.font = copy.copy(source_cell.font)
-        month_cell.alignment = copy.copy(source_cell.alignment)
-        month_cell.fill = copy.copy(source_cell.fill)
+        styles.apply(month_cell, ws.cell(51, 5), ('font', 'alignment', 'fill'))
     
     print(f"[OK] 添加月份标题: 第{month_row}行 - {month_title}")
     
@@ -90,11 +99,7 @@ def add_monthly_summary_to_main(excel_path, force_date=None):
         cell.value = header
         # 复制格式
         if ws.cell(53, col).value is not None or col >= 2:
-            source_cell = ws.cell(53, col)
-            cell.font = copy.copy(source_cell.font)
-            cell.alignment = copy.copy(source_cell.alignment)
-            cell.border = copy.copy(source_cell.border)
-            cell.fill = copy.copy(source_cell.fill)
+            styles.apply(cell, ws.cell(53, col), ('font', 'alignment', 'border', 'fill'))
     
     print(f"[OK] 添加表头行: 第{header_row}行")
     
@@ -107,17 +112,10 @@ def add_monthly_summary_to_main(excel_path, force_date=None):
         
         for col in range(2, 11):
             ws.cell(current_row, col).value = 0
-            source_cell = ws.cell(54, col)
-            ws.cell(current_row, col).font = copy.copy(source_cell.font)
-            ws.cell(current_row, col).alignment = copy.copy(source_cell.alignment)
-            ws.cell(current_row, col).border = copy.copy(source_cell.border)
-            if col >= 2:
-                ws.cell(current_row, col).number_format = source_cell.number_format
+            styles.apply(ws.cell(current_row, col), ws.cell(54, col),
+                         ('font', 'alignment', 'border', 'number_format'))
         
-        source_cell = ws.cell(54, 1)
-        ws.cell(current_row, 1).font = copy.copy(source_cell.font)
-        ws.cell(current_row, 1).alignment = copy.copy(source_cell.alignment)
-        ws.cell(current_row, 1).border = copy.copy(source_cell.border)
+        styles.apply(ws.cell(current_row, 1), ws.cell(54, 1), ('font', 'alignment', 'border'))
         
         print(f"[OK] 添加数据行: 第{current_row}行 - {area_name}")
         current_row += 1
@@ -128,25 +126,18 @@ def add_monthly_summary_to_main(excel_path, force_date=None):
     
     for col in range(7, 11):
         ws.cell(summary_row, col).value = 0
-        source_cell = ws.cell(57, col)
-        ws.cell(summary_row, col).font = copy.copy(source_cell.font)
-        ws.cell(summary_row, col).alignment = copy.copy(source_cell.alignment)
-        ws.cell(summary_row, col).border = copy.copy(source_cell.border)
-        ws.cell(summary_row, col).fill = copy.copy(source_cell.fill)
-        ws.cell(summary_row, col).number_format = source_cell.number_format
-    
-    source_cell = ws.cell(57, 6)
-    ws.cell(summary_row, 6).font = copy.copy(source_cell.font)
-    ws.cell(summary_row, 6).alignment = copy.copy(source_cell.alignment)
-    ws.cell(summary_row, 6).border = copy.copy(source_cell.border)
-    ws.cell(summary_row, 6).fill = copy.copy(source_cell.fill)
+        styles.apply(ws.cell(summary_row, col), ws.cell(57, col),
+                     ('font', 'alignment', 'border', 'fill', 'number_format'))
+    
+    styles.apply(ws.cell(summary_row, 6), ws.cell(57, 6), ('font', 'alignment', 'border', 'fill'))
     
     print(f"[OK] 添加合计行: 第{summary_row}行")
     
-    # 保存
+    # 保存（先保存到临时文件再替换原文件）
     try:
-        wb.save(excel_path)
+        atomic_save(wb, excel_path)
         print(f"\n[SAVE] 成功保存工作簿")
+        update_after_append(excel_path, [(next_year, next_month, month_row)], ws.max_row, loaded_version)
     except Exception as e:
         print(f"\n[ERROR] 保存失败: {e}")
         return False
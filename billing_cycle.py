@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抄表周期统计
+月度统计表（石滩区分区计量.xlsx）按抄表周期（上月25日至本月24日）汇总5个监控点的供水量，
+数据来自 石滩供水服务部每日总供水情况.xlsx 的"日供水数据"工作表：
+- 工作表读取已解析工作表缓存（workbook_cache），文件未变化时不再加载工作簿
+- 监控点列按表头名称解析，每个文件版本只解析一次
+- 周期合计直接取供水汇总表的 'cycle' 周期（supply_rollups），不再逐行累加
+extract_water_data、extract_water_data_smart 和添加统计表前的"24日数据"检查共用这里的结果。
+"""
+
+import math
+
+from workbook_cache import get_parsed_sheet
+from date_index import get_sheet_date_index
+from supply_rollups import get_period_results, period_bounds, ROLLUP_CONFIG
+
+# 抄表周期统计配置
+BILLING_CYCLE_CONFIG = {
+    'data_file': "excel_exports/石滩供水服务部每日总供水情况.xlsx"
+}
+
+# 监控点 -> 表头搜索关键词（按列顺序取第一个包含任一关键词的列）
+MONITOR_COLUMNS = {
+    "荔新大道": ["荔新大道", "荔新"],
+    "宁西2总表": ["宁西2总表", "宁西2"],
+    "如丰大道600监控表": ["如丰大道600", "如丰大道"],
+    "新城大道医院NB": ["新城大道医院NB", "新城大道医院", "新城大道"],
+    "三棵树600监控表": ["三棵树600", "三棵树", "三棵竹600"],
+}
+
+
+def find_header_column(header, search_terms):
+    """表头中第一个包含任一关键词的列（0开始）；未找到返回 None"""
+    for col_idx, header_val in enumerate(header):
+        if header_val:
+            header_str = str(header_val).strip()
+            if any(term in header_str for term in search_terms):
+                return col_idx
+    return None
+
+
+def get_monitor_columns(parsed_sheet):
+    """
+    监控点所在列（每个文件版本只解析一次）
+
+    Returns:
+        dict: {监控点: 列下标（0开始，对应 parsed_sheet.header）或 None}
+    """
+    columns = parsed_sheet.extras.get('monitor_columns')
+    if columns is None:
+        columns = {name: find_header_column(parsed_sheet.header, terms)
+                   for name, terms in MONITOR_COLUMNS.items()}
+        parsed_sheet.extras['monitor_columns'] = columns
+    return columns
+
+
+def _cycle_key(year, month):
+    return f'{year}-{month:02d}'
+
+
+def _plain_number(value):
+    """整数值的合计返回 int（与原来逐个单元格相加的结果一致）"""
+    return int(value) if float(value).is_integer() else value
+
+
+def get_cycle_totals(year, month, data_file=None):
+    """
+    某月抄表周期内各监控点的合计
+
+    Args:
+        year: 年份
+        month: 月份
+        data_file: 数据源文件路径，默认 BILLING_CYCLE_CONFIG['data_file']
+
+    Returns:
+        dict: {
+            'year', 'month', 'start_date', 'ideal_end_date', 'end_date'（datetime）,
+            'last_available_date': 数据源最后日期（没有日期时为 None）,
+            'is_partial': 周期尚未结束（数据源最后日期早于本月24日）,
+            'days': 周期内有数据的天数, 'expected_days': 周期天数,
+            'columns': {监控点: 列下标或 None}, 'headers': {监控点: 表头},
+            'totals': {监控点: 合计}, 'counts': {监控点: 有效数值个数}
+        }
+    """
+    sheet = get_parsed_sheet(data_file or BILLING_CYCLE_CONFIG['data_file'])
+    date_index = get_sheet_date_index(sheet)
+    columns = get_monitor_columns(sheet)
+
+    start_date, ideal_end_date = period_bounds('cycle', _cycle_key(year, month))
+    last_available_date = date_index.dates[-1] if len(date_index) else None
+    is_partial = last_available_date is not None and ideal_end_date > last_available_date
+    end_date = last_available_date if is_partial else ideal_end_date
+
+    results = get_period_results(sheet, 'cycle', _cycle_key(year, month)) or []
+    totals = {}
+    counts = {}
+    for name, col_idx in columns.items():
+        # 汇总结果从第1列（日期列之后）开始
+        result = results[col_idx - 1] if col_idx and col_idx - 1 < len(results) else None
+        totals[name] = _plain_number(result['total']) if result else 0
+        counts[name] = result['count'] if result else 0
+
+    return {
+        'year': year,
+        'month': month,
+        'start_date': start_date,
+        'ideal_end_date': ideal_end_date,
+        'end_date': end_date,
+        'last_available_date': last_available_date,
+        'is_partial': is_partial,
+        'days': len(date_index.range(start_date, ideal_end_date)),
+        'expected_days': (ideal_end_date - start_date).days + 1,
+        'columns': columns,
+        'headers': {name: sheet.header[col_idx] if col_idx is not None else None
+                    for name, col_idx in columns.items()},
+        'totals': totals,
+        'counts': counts
+    }
+
+
+def _has_monitor_data(sheet, position):
+    """某个数据行是否有监控点数据（任一监控点非空非0）"""
+    row = sheet.data_rows[position]
+    for col_idx in get_monitor_columns(sheet).values():
+        if col_idx is None or col_idx >= len(row):
+            continue
+        val = row[col_idx]
+        if isinstance(val, (int, float)) and not isinstance(val, bool) and val and not math.isnan(val):
+            return True
+    return False
+
+
+def has_cycle_end_data(year, month, data_file=None):
+    """数据源中本月24日（抄表周期最后一天）是否已有监控点数据（任一监控点非空非0）"""
+    sheet = get_parsed_sheet(data_file or BILLING_CYCLE_CONFIG['data_file'])
+    position = get_sheet_date_index(sheet).find(period_bounds('cycle', _cycle_key(year, month))[1])
+    return position is not None and _has_monitor_data(sheet, position)
+
+
+def last_data_date(data_file=None):
+    """
+    数据源中最后一个有监控点数据的日期（工作表中预先填好的未来日期行不算）
+
+    Returns:
+        datetime: 没有数据时返回 None
+    """
+    sheet = get_parsed_sheet(data_file or BILLING_CYCLE_CONFIG['data_file'])
+    if 'last_data_date' not in sheet.extras:
+        date_index = get_sheet_date_index(sheet)
+        sheet.extras['last_data_date'] = next(
+            (date for date, position in zip(reversed(date_index.dates), reversed(date_index.refs))
+             if _has_monitor_data(sheet, position)), None)
+    return sheet.extras['last_data_date']
+
+
+def last_complete_cycle(data_file=None):
+    """
+    数据源中最后一个数据已到结束日（24日）的抄表周期
+
+    Returns:
+        tuple: (年, 月)；数据源中没有数据时返回 None
+    """
+    last = last_data_date(data_file)
+    if last is None:
+        return None
+
+    year, month = last.year, last.month
+    if last.day < ROLLUP_CONFIG['cycle_start_day'] - 1:
+        # 本月周期还没到24日，最后一个完整周期是上个月
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return year, month
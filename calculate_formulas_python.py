@@ -8,9 +8,104 @@
 import openpyxl
 from datetime import datetime
 
+from supply_formulas import DAILY_SUPPLY_FORMULAS
+from workbook_journal import atomic_save
+from workbook_lock import workbook_lock, WorkbookLockTimeout
+
+# 公式定义见 supply_formulas.DAILY_SUPPLY_FORMULAS
+FORMULAS = DAILY_SUPPLY_FORMULAS
+
+# 公式计算用到的输入列
+INPUT_COLUMNS = FORMULAS.inputs
+
+# 计算结果写入的列
+RESULT_COLUMNS = FORMULAS.outputs
+
+
+def get_formula_columns(ws, header_row=4):
+    """
+    读取表头，返回 {列名: 列号}
+    
+    列名去掉换行符和前后空格；Excel中有重复的列名，只保留第一次出现的列。
+    """
+    col_indices = {}
+    for idx, header in enumerate(next(ws.iter_rows(min_row=header_row, max_row=header_row, values_only=True)), start=1):
+        if header:
+            clean_header = str(header).replace('\n', '').replace('\r', '').strip()
+            if clean_header not in col_indices:
+                col_indices[clean_header] = idx
+    return col_indices
+
+
+def has_key_columns(col_indices):
+    """荔新大道、新城大道、三江新总表 三个关键列是否都存在"""
+    return all(col_indices.get(name, 0) for name in ('荔新大道', '新城大道', '三江新总表'))
+
+
+def read_row_inputs(ws, row_idx, col_indices):
+    """读取一行的公式输入列（表中不存在的列不返回，计算时按0处理）"""
+    return {name: ws.cell(row_idx, col_indices[name]).value for name in INPUT_COLUMNS if name in col_indices}
+
+
+def write_row_values(ws, row_idx, col_indices, values, columns=None):
+    """写入一行的计算结果（保留2位小数）；columns 省略时写入全部派生列"""
+    for col_name in columns or RESULT_COLUMNS:
+        if col_name in col_indices:
+            ws.cell(row_idx, col_indices[col_name]).value = round(values[col_name], 2)
+
+
+def recalculate_dates(ws, date_index, dates, col_indices=None):
+    """
+    只重新计算指定日期所在行的公式列，以及下一行的环比差值
+    
+    在已打开的工作表中修改，不保存文件。
+    
+    Args:
+        ws: 已打开的工作表（非 data_only）
+        date_index: 该工作表的日期索引（date_index.DateRowIndex，行引用为Excel行号）
+        dates: 被写入的日期
+        col_indices: get_formula_columns() 的结果，省略时读取表头
+    
+    Returns:
+        int: 重新计算的行数
+    """
+    if col_indices is None:
+        col_indices = get_formula_columns(ws)
+    if not has_key_columns(col_indices):
+        print(f"[WARNING] 关键列索引未找到，跳过公式计算")
+        return 0
+    
+    recalculated = set()
+    
+    def evaluate(row_idx, previous=None):
+        return FORMULAS.evaluate_row(read_row_inputs(ws, row_idx, col_indices), previous)
+    
+    for date in sorted(dates):
+        position = date_index.last_on_or_before(date)
+        if position < 0:
+            continue
+        row_idx = date_index.refs[position]
+        if date_index.find(date) != row_idx:
+            continue
+        
+        # 当前行：全部公式列（环比差值取上一行的日供水）
+        previous = evaluate(date_index.refs[position - 1]) if position > 0 else None
+        values = evaluate(row_idx, previous)
+        write_row_values(ws, row_idx, col_indices, values)
+        recalculated.add(row_idx)
+        
+        # 下一行：环比差值依赖本行的日供水
+        if position + 1 < len(date_index.refs):
+            next_row = date_index.refs[position + 1]
+            write_row_values(ws, next_row, col_indices, evaluate(next_row, values), columns=['环比差值'])
+            recalculated.add(next_row)
+    
+    return len(recalculated)
+
+
 def calculate_water_formulas(excel_path):
     """
-    手动计算Excel中的公式列
+    手动计算Excel中的公式列（全表重算，公式定义见 supply_formulas.DAILY_SUPPLY_FORMULAS）
     
     公式说明：
     1. 石滩 = 荔新大道 - 宁西2总表 + 新城大道 + 边界过表用户（荔湖）
@@ -19,6 +114,16 @@ def calculate_water_formulas(excel_path):
     4. 石滩供水服务部日供水 = 石滩 + 三江 + 沙庄
     5. 环比差值 = 当前行石滩供水服务部日供水 - 上一行石滩供水服务部日供水
     """
+    # 读取到保存在写入锁内完成，避免与每日更新等任务同时改写文件
+    try:
+        with workbook_lock(excel_path):
+            return _calculate_water_formulas(excel_path)
+    except WorkbookLockTimeout as e:
+        print(f"[ERROR] 工作簿正在被其他任务修改，请稍后重试: {e}")
+        return False
+
+
+def _calculate_water_formulas(excel_path):
     print(f"[INFO] 开始计算公式: {excel_path}")
     
     try:
@@ -29,123 +134,41 @@ def calculate_water_formulas(excel_path):
         print(f"[INFO] 工作表: {ws.title}")
         print(f"[INFO] 总行数: {ws.max_row}")
         
-        # 读取表头（第4行，索引3）
-        header_row = 4
-        headers = [cell.value for cell in ws[header_row]]
-        
-        print(f"[INFO] 表头: {headers[:10]}...")  # 只打印前10列
+        # 读取表头（第4行），找到列索引（只保留第一次出现的列，因为Excel中有重复的列名）
+        col_indices = get_formula_columns(ws)
         
-        # 找到列索引（移除换行符和空格）
-        # 注意：只保留第一次出现的列（因为Excel中有重复的列名）
-        col_indices = {}
-        for idx, header in enumerate(headers, start=1):
-            if header:
-                # 移除所有换行符和前后空格
-                clean_header = str(header).replace('\n', '').replace('\r', '').strip()
-                # 只在第一次出现时记录（避免被后面的重复列覆盖）
-                if clean_header not in col_indices:
-                    col_indices[clean_header] = idx
+        print(f"[INFO] 表头: {list(col_indices)[:10]}...")  # 只打印前10列
         
         # 关键列
-        key_columns = [
-            '荔新大道', '新城大道', '三江新总表', '边界过水', 
-            '边界过表用户（荔湖）', '边界过表用户（增江）', '宁西2总表', '沙庄总表',
-            '石滩供水服务部日供水', '环比差值', '石滩', '三江', '沙庄'
-        ]
+        key_columns = INPUT_COLUMNS + RESULT_COLUMNS
         
         print(f"\n[INFO] 关键列索引:")
         for col in key_columns:
             if col in col_indices:
                 print(f"  {col}: 列{col_indices[col]}")
         
-        # 定义辅助函数
-        def get_cell_value(row, col_name):
-            """安全获取单元格值，处理列不存在的情况"""
-            col_idx = col_indices.get(col_name, 0)
-            if col_idx == 0:
-                return 0
-            try:
-                value = ws.cell(row, col_idx).value
-                return value if value is not None else 0
-            except:
-                return 0
-        
-        def to_float(val):
-            """将值转换为浮点数"""
-            try:
-                return float(val) if val not in (None, '', '-') else 0
-            except:
-                return 0
+        # 检查关键列是否存在
+        if not has_key_columns(col_indices):
+            print(f"[ERROR] 关键列索引未找到，停止处理")
+            print(f"  荔新大道: {col_indices.get('荔新大道', 0)}, 新城大道: {col_indices.get('新城大道', 0)}, 三江新总表: {col_indices.get('三江新总表', 0)}")
+            wb.close()
+            return True
         
-        # 从第5行开始计算（数据行）
+        # 从第5行开始，跳过日期列（第1列）为空的行
         data_start_row = 5
-        prev_total = None
+        row_indices = [row_idx for row_idx, (date_value,) in
+                       enumerate(ws.iter_rows(min_row=data_start_row, max_col=1, values_only=True), start=data_start_row)
+                       if date_value]
         
-        updated_count = 0
+        # 按列读取输入，整体计算：石滩、三江、沙庄、石滩供水服务部日供水、环比差值
+        inputs = {name: [ws.cell(row_idx, col_indices[name]).value for row_idx in row_indices]
+                  for name in INPUT_COLUMNS if name in col_indices}
+        results = FORMULAS.evaluate_columns(inputs) if row_indices else {}
         
-        # 遍历所有行，但跳过空行
-        for row_idx in range(data_start_row, ws.max_row + 1):
+        updated_count = 0
+        for i, row_idx in enumerate(row_indices):
             try:
-                # 检查日期列是否有值（第1列），如果没有则跳过
-                date_value = ws.cell(row_idx, 1).value
-                if not date_value:
-                    continue
-                
-                # 获取关键列索引（仅用于检查）
-                lixin_col = col_indices.get('荔新大道', 0)
-                xincheng_col = col_indices.get('新城大道', 0)
-                sanjiang_col = col_indices.get('三江新总表', 0)
-                
-                # 检查关键列是否存在
-                if lixin_col == 0 or xincheng_col == 0 or sanjiang_col == 0:
-                    if updated_count == 0:
-                        print(f"[ERROR] 关键列索引未找到，停止处理")
-                        print(f"  荔新大道: {lixin_col}, 新城大道: {xincheng_col}, 三江新总表: {sanjiang_col}")
-                    break
-                
-                # 使用安全方法获取所有列的值并转换为数值
-                lixin = to_float(get_cell_value(row_idx, '荔新大道'))
-                xincheng = to_float(get_cell_value(row_idx, '新城大道'))
-                sanjiang_table = to_float(get_cell_value(row_idx, '三江新总表'))
-                bianjie1 = to_float(get_cell_value(row_idx, '边界过水'))
-                bianjie_lihu = to_float(get_cell_value(row_idx, '边界过表用户（荔湖）'))
-                bianjie_zengjiang = to_float(get_cell_value(row_idx, '边界过表用户（增江）'))
-                ningxi = to_float(get_cell_value(row_idx, '宁西2总表'))
-                shazhuang_table = to_float(get_cell_value(row_idx, '沙庄总表'))
-                
-                # 计算公式
-                # 1. 石滩 = 荔新大道 - 宁西2总表 + 新城大道 + 边界过表用户（荔湖）
-                shitan = lixin - ningxi + xincheng + bianjie_lihu
-                
-                # 2. 三江 = 三江新总表 - 沙庄总表 - 边界过表用户（增江）
-                sanjiang_val = sanjiang_table - shazhuang_table - bianjie_zengjiang
-                
-                # 3. 沙庄 = 沙庄总表
-                shazhuang_val = shazhuang_table
-                
-                # 4. 石滩供水服务部日供水 = 石滩 + 三江 + 沙庄
-                total = shitan + sanjiang_val + shazhuang_val
-                
-                # 5. 环比差值 = 当前行 - 上一行
-                huanbi = total - prev_total if prev_total is not None else 0
-                
-                # 写入计算结果
-                if '石滩供水服务部日供水' in col_indices:
-                    ws.cell(row_idx, col_indices['石滩供水服务部日供水']).value = round(total, 2)
-                
-                if '环比差值' in col_indices:
-                    ws.cell(row_idx, col_indices['环比差值']).value = round(huanbi, 2)
-                
-                if '石滩' in col_indices:
-                    ws.cell(row_idx, col_indices['石滩']).value = round(shitan, 2)
-                
-                if '三江' in col_indices:
-                    ws.cell(row_idx, col_indices['三江']).value = round(sanjiang_val, 2)
-                
-                if '沙庄' in col_indices:
-                    ws.cell(row_idx, col_indices['沙庄']).value = round(shazhuang_val, 2)
-                
-                prev_total = total
+                write_row_values(ws, row_idx, col_indices, {name: results[name][i] for name in RESULT_COLUMNS})
                 updated_count += 1
                 
                 # 每100行打印一次进度
@@ -158,9 +181,9 @@ def calculate_water_formulas(excel_path):
                     print(f"[WARNING] 第{row_idx}行计算失败: {row_error}")
                 continue
         
-        # 保存文件
+        # 保存文件（先保存到临时文件再替换原文件）
         print(f"\n[INFO] 保存文件...")
-        wb.save(excel_path)
+        atomic_save(wb, excel_path)
         wb.close()
         
         print(f"[SUCCESS] 公式计算完成！共处理 {updated_count} 行数据")
@@ -4,16 +4,11 @@
 完整8个水表动态获取最近7天数据
 """
 
-import requests
-from bs4 import BeautifulSoup
-import hashlib
 import json
 import time
 from datetime import datetime, timedelta
 
-def md5_hash(text):
-    """计算MD5哈希"""
-    return hashlib.md5(text.encode('utf-8')).hexdigest()
+from water_session_pool import get_session_pool, format_node_ids
 
 def calculate_recent_7days():
     """计算最近7天的日期范围（昨天往前推7天）"""
@@ -30,138 +25,38 @@ def calculate_recent_7days():
     
     return start_str, end_str
 
-def login_to_system(session):
-    """登录到水务系统"""
-    try:
-        login_url = "http://axwater.dmas.cn/Login.aspx"
-        login_page = session.get(login_url)
-        
-        soup = BeautifulSoup(login_page.text, 'html.parser')
-        form = soup.find('form')
-        
-        # 提取表单数据
-        form_data = {}
-        for input_elem in form.find_all('input'):
-            name = input_elem.get('name')
-            value = input_elem.get('value', '')
-            if name:
-                form_data[name] = value
-        
-        # 设置登录凭据
-        username = '13509288500'
-        password = '288500'
-        form_data['user'] = username
-        form_data['pwd'] = md5_hash(password)
-        
-        # 执行登录
-        login_response = session.post(login_url, data=form_data)
-        print(f"登录响应状态: {login_response.status_code}")
-        
-        # 检查JavaScript重定向
-        if "window.location='frmMain.aspx'" in login_response.text:
-            print("✅ 检测到JavaScript重定向，登录成功！")
-            
-            # 跳转到主页面
-            main_url = "http://axwater.dmas.cn/frmMain.aspx"
-            main_response = session.get(main_url)
-            print(f"主页面状态: {main_response.status_code}")
-            
-            if main_response.status_code == 200:
-                print("✅ 成功访问主页面")
-                return True
-        
-        return False
-        
-    except Exception as e:
-        print(f"❌ 登录失败: {str(e)}")
-        return False
+def login_to_system():
+    """登录到水务系统（通过共享会话池，已登录时不会重复登录）"""
+    if get_session_pool().warm_up():
+        print("✅ 已获得登录会话")
+        return True
+    print("❌ 登录失败")
+    return False
 
-def fetch_water_data(session, meter_ids, start_date, end_date):
-    """获取水表数据"""
-    try:
-        # 访问报表页面
-        print("📊 访问报表页面...")
-        time.sleep(1)
-        
-        report_url = "http://axwater.dmas.cn/reports/FluxRpt.aspx"
-        report_response = session.get(report_url)
-        print(f"报表页面状态: {report_response.status_code}")
-        
-        if '登录超时' in report_response.text:
-            print("❌ 登录超时，需要重新登录")
-            return None
-            
-        print("✅ 成功访问报表页面！")
-        
-        # 格式化nodeId参数（所有水表ID）
-        formatted_node_ids = "'" + "','".join(meter_ids) + "'"
-        print(f"🔧 nodeId参数: {formatted_node_ids}")
-        
-        # API调用
-        api_url = "http://axwater.dmas.cn/reports/ashx/getRptWaterYield.ashx"
-        api_params = {
-            'nodeId': formatted_node_ids,
-            'startDate': start_date,
-            'endDate': end_date,
-            'rptType': 'day'
-        }
-        
-        print(f"🔗 API调用参数: {api_params}")
-        
-        # 获取报表页面的状态数据
-        report_soup = BeautifulSoup(report_response.text, 'html.parser')
-        viewstate = report_soup.find('input', {'name': '__VIEWSTATE'})
-        eventvalidation = report_soup.find('input', {'name': '__EVENTVALIDATION'})
-        
-        api_data = api_params.copy()
-        if viewstate:
-            api_data['__VIEWSTATE'] = viewstate.get('value', '')
-        if eventvalidation:
-            api_data['__EVENTVALIDATION'] = eventvalidation.get('value', '')
-        
-        # 设置请求头
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            'X-Requested-With': 'XMLHttpRequest',
-            'Referer': report_url
-        }
-        
-        print(f"🔗 发送API请求到: {api_url}")
-        api_response = session.post(api_url, data=api_data, headers=headers)
-        print(f"API响应状态码: {api_response.status_code}")
-        print(f"响应数据长度: {len(api_response.text)} 字符")
-        
-        # 调试信息：显示响应头和部分内容
-        print(f"🔍 响应头Content-Type: {api_response.headers.get('content-type', 'N/A')}")
-        if len(api_response.text.strip()) > 0:
-            preview = api_response.text[:200] if len(api_response.text) > 200 else api_response.text
-            print(f"🔍 响应内容预览: {preview}")
-        else:
-            print("🔍 响应内容为空")
-        
-        if api_response.status_code == 200 and len(api_response.text.strip()) > 0:
-            try:
-                json_data = json.loads(api_response.text)
-                print(f"✅ 成功解析JSON数据")
-                return {'data': json_data}
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON解析失败: {e}")
-                return None
-        else:
-            print("❌ API响应为空或无效")
-            return None
-            
-    except Exception as e:
-        print(f"❌ 获取水表数据失败: {str(e)}")
+def fetch_water_data(meter_ids, start_date, end_date):
+    """获取水表数据（复用会话池中已登录的会话，只发一次API请求）"""
+    print(f"🔗 获取水表数据: {start_date} ~ {end_date}, 共{len(meter_ids)}个水表")
+    
+    # 保持原来的请求参数（rptType=day，附带报表页的 __VIEWSTATE/__EVENTVALIDATION）
+    api_params = {
+        'nodeId': format_node_ids(meter_ids),
+        'startDate': start_date,
+        'endDate': end_date,
+        'rptType': 'day'
+    }
+    print(f"🔗 API调用参数: {api_params}")
+    
+    json_data = get_session_pool().post_report(api_params, include_form_state=True)
+    
+    if json_data is None:
+        print("❌ API响应为空或无效")
         return None
+    
+    print(f"✅ 成功解析JSON数据")
+    return {'data': json_data}
 
 def get_water_data_for_date_range(start_date, end_date):
     """获取指定日期范围的水表数据"""
-    session = requests.Session()
-    
     # 如果传入的是datetime对象，转换为字符串
     if isinstance(start_date, datetime):
         start_str = start_date.strftime('%Y-%m-%d')
@@ -190,13 +85,13 @@ def get_water_data_for_date_range(start_date, end_date):
     try:
         # 1. 登录
         print("🔐 正在登录...")
-        login_success = login_to_system(session)
+        login_success = login_to_system()
         if not login_success:
             return {'success': False, 'message': '登录失败'}
         
         # 2. 获取数据
         print("📊 正在获取水表数据...")
-        water_data = fetch_water_data(session, meter_ids, start_str, end_str)
+        water_data = fetch_water_data(meter_ids, start_str, end_str)
         
         if water_data and 'data' in water_data and water_data['data']['total'] > 0:
             result = {
@@ -226,8 +121,6 @@ def get_water_data_for_date_range(start_date, end_date):
 
 def get_complete_8_meters_data():
     """获取完整8个水表的最近7天数据"""
-    session = requests.Session()
-    
     print("🏭 完整8个水表数据获取器启动...")
     
     # 完整的8个水表ID列表（按图片顺序）
@@ -262,226 +155,128 @@ def get_complete_8_meters_data():
     print(f"📅 今天: {datetime.now().strftime('%Y年%m月%d日')}")
     print(f"📅 数据范围: {start_date} 至 {end_date} (昨天往前推7天)")
     
-    # 步骤1: 登录
-    print("\n步骤1: 执行登录")
-    login_url = "http://axwater.dmas.cn/Login.aspx"
-    login_page = session.get(login_url)
-    
-    soup = BeautifulSoup(login_page.text, 'html.parser')
-    form = soup.find('form')
-    
-    # 提取表单数据
-    form_data = {}
-    for input_elem in form.find_all('input'):
-        name = input_elem.get('name')
-        value = input_elem.get('value', '')
-        if name:
-            form_data[name] = value
-    
-    # 设置登录凭据
-    username = '13509288500'
-    password = '288500'
-    form_data['user'] = username
-    form_data['pwd'] = md5_hash(password)
-    
-    # 执行登录
-    login_response = session.post(login_url, data=form_data)
-    print(f"登录响应状态: {login_response.status_code}")
-    
-    # 检查JavaScript重定向
-    if "window.location='frmMain.aspx'" in login_response.text:
-        print("✅ 检测到JavaScript重定向，登录成功！")
-        
-        # 步骤2: 手动跳转到主页面
-        print("步骤2: 跳转到主页面")
-        main_url = "http://axwater.dmas.cn/frmMain.aspx"
-        main_response = session.get(main_url)
-        print(f"主页面状态: {main_response.status_code}")
-        
-        if main_response.status_code == 200:
-            print("✅ 成功访问主页面")
-            
-            # 步骤3: 访问报表页面
-            print("步骤3: 访问报表页面")
-            time.sleep(1)  # 稍等一下
-            
-            report_url = "http://axwater.dmas.cn/reports/FluxRpt.aspx"
-            report_response = session.get(report_url)
-            print(f"报表页面状态: {report_response.status_code}")
-            
-            if '登录超时' not in report_response.text:
-                print("✅ 成功访问报表页面！")
-                
-                # 步骤4: 获取完整8个水表的数据
-                print(f"步骤4: 获取完整8个水表 {start_date} 至 {end_date} 的数据")
-                
-                # 格式化nodeId参数（所有8个水表ID）
-                formatted_node_ids = "'" + "','".join(meter_ids) + "'"
-                print(f"🔧 完整nodeId参数: {formatted_node_ids}")
-                
-                # API调用 - 使用完整的8个水表ID
-                api_url = "http://axwater.dmas.cn/reports/ashx/getRptWaterYield.ashx"
-                api_params = {
-                    'nodeId': formatted_node_ids,  # 完整的8个水表
-                    'startDate': start_date,
-                    'endDate': end_date,
-                    'meterType': '-1',
-                    'statisticsType': 'flux',
-                    'type': 'dayRpt'
-                }
-                
-                api_headers = {
-                    'Referer': report_url,
-                    'X-Requested-With': 'XMLHttpRequest',
-                    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                }
-                
-                print(f"🔄 API请求参数:")
-                for key, value in api_params.items():
-                    if key == 'nodeId':
-                        print(f"  {key}: {value}")
-                    elif key in ['startDate', 'endDate']:
-                        print(f"  {key}: {value}")
+    # 步骤1: 获取已登录会话（会话池内已登录时直接复用）
+    print("\n步骤1: 获取登录会话")
+    if not login_to_system():
+        print("❌ 登录失败")
+        return False
+    
+    # 步骤2: 获取完整8个水表的数据
+    print(f"步骤2: 获取完整8个水表 {start_date} 至 {end_date} 的数据")
+    print(f"🔧 完整nodeId参数: {format_node_ids(meter_ids)}")
+    
+    data = get_session_pool().fetch_water_yield(start_date, end_date, meter_ids=meter_ids)
+    if data is None:
+        print("❌ API返回空响应或非JSON数据")
+        return False
+    
+    print("✅ 成功解析JSON数据")
+    
+    # 保存完整8个水表的数据
+    timestamp = time.strftime('%Y%m%d_%H%M%S')
+    today_str = datetime.now().strftime('%Y%m%d')
+    filename = f"COMPLETE_8_METERS_data_{today_str}_{timestamp}.json"
+    
+    output_data = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'source': 'complete_8_meters_scraper',
+        'success': True,
+        'data_type': 'json',
+        'calculation_date': datetime.now().strftime('%Y-%m-%d'),
+        'date_range': {
+            'start': start_date,
+            'end': end_date,
+            'description': '昨天往前推7天的数据'
+        },
+        'meter_count': len(meter_ids),
+        'target_meters': {
+            'ids': meter_ids,
+            'names': meter_names,
+            'total': len(meter_ids)
+        },
+        'data': data,
+        'note': f'这是{datetime.now().strftime("%Y年%m月%d日")}获取的完整8个水表最近7天真实数据'
+    }
+    
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(output_data, f, ensure_ascii=False, indent=2)
+    
+    print(f"🎉 完整8个水表数据已保存到: {filename}")
+    
+    # 显示详细数据摘要
+    print(f"\n📊 完整8个水表 {start_date} 至 {end_date} 数据摘要:")
+    if isinstance(data, dict):
+        total = data.get('total', 0)
+        rows = data.get('rows', [])
+        print(f"API返回总记录数: {total}")
+        print(f"实际获取行数: {len(rows)}")
+        print(f"目标水表数量: {len(meter_ids)}")
+    
+        if len(rows) == len(meter_ids):
+            print("✅ 成功获取所有8个水表数据！")
+        else:
+            print(f"⚠️  只获取到 {len(rows)} 个水表，缺少 {len(meter_ids) - len(rows)} 个")
+    
+        if rows:
+            # 分析日期范围
+            sample_row = rows[0] if rows else {}
+            date_columns = [key for key in sample_row.keys() if key.startswith('202')]
+            date_columns.sort()
+    
+            print(f"数据包含日期: {', '.join(date_columns)}")
+            print(f"实际天数: {len(date_columns)} 天")
+    
+            # 显示每个水表的详细信息
+            print(f"\n📋 各水表数据详情:")
+            for i, row in enumerate(rows):
+                if isinstance(row, dict):
+                    meter_id = row.get('ID', 'N/A')
+                    meter_name = row.get('Name', 'N/A')
+                    max_value = row.get('maxvalue', 'N/A')
+                    min_value = row.get('minvalue', 'N/A')
+                    avg_value = row.get('avg', 'N/A')
+    
+                    print(f"\n水表{i+1}: {meter_name} ({meter_id})")
+    
+                    # 检查这个水表是否在我们的目标列表中
+                    if meter_id in meter_ids:
+                        target_index = meter_ids.index(meter_id)
+                        expected_name = meter_names[target_index]
+                        print(f"  ✅ 目标水表 #{target_index+1}: {expected_name}")
                     else:
-                        print(f"  {key}: {value}")
-                
-                api_response = session.post(api_url, data=api_params, headers=api_headers)
-                print(f"API响应状态: {api_response.status_code}")
-                print(f"API响应长度: {len(api_response.text)}")
-                
-                if api_response.text and len(api_response.text) > 10:
-                    print("🎉 API返回数据！")
-                    
-                    try:
-                        data = api_response.json()
-                        print("✅ 成功解析JSON数据")
-                        
-                        # 保存完整8个水表的数据
-                        timestamp = time.strftime('%Y%m%d_%H%M%S')
-                        today_str = datetime.now().strftime('%Y%m%d')
-                        filename = f"COMPLETE_8_METERS_data_{today_str}_{timestamp}.json"
-                        
-                        output_data = {
-                            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
-                            'source': 'complete_8_meters_scraper',
-                            'success': True,
-                            'data_type': 'json',
-                            'calculation_date': datetime.now().strftime('%Y-%m-%d'),
-                            'date_range': {
-                                'start': start_date,
-                                'end': end_date,
-                                'description': '昨天往前推7天的数据'
-                            },
-                            'meter_count': len(meter_ids),
-                            'target_meters': {
-                                'ids': meter_ids,
-                                'names': meter_names,
-                                'total': len(meter_ids)
-                            },
-                            'data': data,
-                            'note': f'这是{datetime.now().strftime("%Y年%m月%d日")}获取的完整8个水表最近7天真实数据'
-                        }
-                        
-                        with open(filename, 'w', encoding='utf-8') as f:
-                            json.dump(output_data, f, ensure_ascii=False, indent=2)
-                        
-                        print(f"🎉 完整8个水表数据已保存到: {filename}")
-                        
-                        # 显示详细数据摘要
-                        print(f"\n📊 完整8个水表 {start_date} 至 {end_date} 数据摘要:")
-                        if isinstance(data, dict):
-                            total = data.get('total', 0)
-                            rows = data.get('rows', [])
-                            print(f"API返回总记录数: {total}")
-                            print(f"实际获取行数: {len(rows)}")
-                            print(f"目标水表数量: {len(meter_ids)}")
-                            
-                            if len(rows) == len(meter_ids):
-                                print("✅ 成功获取所有8个水表数据！")
-                            else:
-                                print(f"⚠️  只获取到 {len(rows)} 个水表，缺少 {len(meter_ids) - len(rows)} 个")
-                            
-                            if rows:
-                                # 分析日期范围
-                                sample_row = rows[0] if rows else {}
-                                date_columns = [key for key in sample_row.keys() if key.startswith('202')]
-                                date_columns.sort()
-                                
-                                print(f"数据包含日期: {', '.join(date_columns)}")
-                                print(f"实际天数: {len(date_columns)} 天")
-                                
-                                # 显示每个水表的详细信息
-                                print(f"\n📋 各水表数据详情:")
-                                for i, row in enumerate(rows):
-                                    if isinstance(row, dict):
-                                        meter_id = row.get('ID', 'N/A')
-                                        meter_name = row.get('Name', 'N/A')
-                                        max_value = row.get('maxvalue', 'N/A')
-                                        min_value = row.get('minvalue', 'N/A')
-                                        avg_value = row.get('avg', 'N/A')
-                                        
-                                        print(f"\n水表{i+1}: {meter_name} ({meter_id})")
-                                        
-                                        # 检查这个水表是否在我们的目标列表中
-                                        if meter_id in meter_ids:
-                                            target_index = meter_ids.index(meter_id)
-                                            expected_name = meter_names[target_index]
-                                            print(f"  ✅ 目标水表 #{target_index+1}: {expected_name}")
-                                        else:
-                                            print(f"  ⚠️  意外的水表ID")
-                                        
-                                        if max_value != 'N/A' and max_value is not None:
-                                            print(f"  最大值: {max_value}")
-                                            print(f"  最小值: {min_value}")
-                                            print(f"  平均值: {avg_value}")
-                                        
-                                        # 显示最近几天的数据
-                                        recent_data = []
-                                        for date_col in date_columns[-3:]:  # 最近3天
-                                            value = row.get(date_col)
-                                            if value is not None:
-                                                recent_data.append(f"{date_col}: {value}")
-                                        
-                                        if recent_data:
-                                            print(f"  最近数据: {', '.join(recent_data)}")
-                                
-                                # 检查缺失的水表
-                                returned_ids = [row.get('ID') for row in rows if isinstance(row, dict)]
-                                missing_ids = [mid for mid in meter_ids if mid not in returned_ids]
-                                
-                                if missing_ids:
-                                    print(f"\n⚠️  缺失的水表ID:")
-                                    for mid in missing_ids:
-                                        idx = meter_ids.index(mid)
-                                        print(f"  - {mid} ({meter_names[idx]})")
-                                else:
-                                    print(f"\n✅ 所有8个目标水表数据都已获取！")
-                            
-                            else:
-                                print("⚠️  没有返回水表数据")
-                        
-                        return True
-                        
-                    except json.JSONDecodeError:
-                        print("响应不是JSON格式")
-                        with open('complete_8_meters_api_response.txt', 'w', encoding='utf-8') as f:
-                            f.write(api_response.text)
-                        print("API响应已保存到 complete_8_meters_api_response.txt")
-                        return False
-                
-                else:
-                    print("❌ API返回空响应")
-                    return False
+                        print(f"  ⚠️  意外的水表ID")
+    
+                    if max_value != 'N/A' and max_value is not None:
+                        print(f"  最大值: {max_value}")
+                        print(f"  最小值: {min_value}")
+                        print(f"  平均值: {avg_value}")
+    
+                    # 显示最近几天的数据
+                    recent_data = []
+                    for date_col in date_columns[-3:]:  # 最近3天
+                        value = row.get(date_col)
+                        if value is not None:
+                            recent_data.append(f"{date_col}: {value}")
+    
+                    if recent_data:
+                        print(f"  最近数据: {', '.join(recent_data)}")
+    
+            # 检查缺失的水表
+            returned_ids = [row.get('ID') for row in rows if isinstance(row, dict)]
+            missing_ids = [mid for mid in meter_ids if mid not in returned_ids]
+    
+            if missing_ids:
+                print(f"\n⚠️  缺失的水表ID:")
+                for mid in missing_ids:
+                    idx = meter_ids.index(mid)
+                    print(f"  - {mid} ({meter_names[idx]})")
             else:
-                print("❌ 访问报表页面时显示登录超时")
-                return False
+                print(f"\n✅ 所有8个目标水表数据都已获取！")
+    
         else:
-            print("❌ 无法访问主页面")
-            return False
-    else:
-        print("❌ 登录失败，未检测到重定向")
-        return False
+            print("⚠️  没有返回水表数据")
+    
+    return True
 
 if __name__ == "__main__":
     success = get_complete_8_meters_data()
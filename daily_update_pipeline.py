@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+每日更新流水线
+获取数据 → 提取水表数值 → 写入 → 重算派生列 → 保存，工作簿只加载一次、保存一次：
+- 写入、派生列重算和“打开时重新计算”标记都在同一个打开的工作簿上完成，
+  不再需要单独重新保存或运行全表公式计算
+- 保存前任何一步失败都不会写文件；保存先写临时文件再替换原文件
+- 写入前把数据记入写入日志（workbook_journal），保存成功后才标记完成；
+  上次未保存成功的数据在下次写入时一并重放，重试同一天时不再重新获取接口数据
+- 合并写入时某条记录的数据无法写入（抛出异常），改为逐条写入，只有出错的记录累计失败次数，
+  多次失败后转为死信，不会让以后的每次写入都失败；replay_journal 在任务开始时单独重放未保存的记录
+- 写入在工作簿写入锁（workbook_lock）内进行，多个进程/线程同时写入时串行执行，
+  排队中的写入由先拿到锁的一方合并成一次加载/保存
+- 每一步记录耗时（秒），随结果返回
+"""
+
+import time
+from contextlib import contextmanager
+
+from specific_excel_writer import SpecificExcelWriter
+from integrated_excel_updater import extract_meter_values
+from workbook_journal import WriteJournal, JOURNAL_CONFIG, merge_entries
+from workbook_lock import workbook_lock, WorkbookLockTimeout
+from task_stages import report_stage
+
+
+class DailyUpdatePipeline:
+    """一次更新的流水线（每次更新新建一个实例）"""
+
+    def __init__(self, writer=None, log=print):
+        self.writer = writer or SpecificExcelWriter()
+        self.log = log
+        self.timings = {}
+        self.journal = WriteJournal(self.writer.excel_path)
+
+    @contextmanager
+    def stage(self, name):
+        """记录一个步骤的耗时（同名步骤累加），在后台任务中执行时同时报告步骤变化"""
+        report_stage(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings[name] = round(self.timings.get(name, 0) + elapsed, 3)
+
+    def fetch(self, target_date):
+        """获取目标日期的接口数据，返回 rows；失败时返回 None"""
+        from force_real_data_web import force_get_real_data_for_web
+
+        with self.stage('fetch'):
+            data_result = force_get_real_data_for_web(target_date)
+
+        if not data_result or not data_result.get('success'):
+            return None
+        return data_result.get('data', {}).get('rows', [])
+
+    def map(self, rows, target_date_str):
+        """从接口 rows 中提取某一天各水表的数值"""
+        with self.stage('map'):
+            return extract_meter_values(rows, target_date_str, log=self.log)
+
+    def _acquire_lock(self):
+        """等待工作簿写入锁；超时返回 None（数据留在写入日志中，之后重放）"""
+        lock = workbook_lock(self.writer.excel_path)
+        try:
+            with self.stage('lock'):
+                lock.acquire()
+        except WorkbookLockTimeout as e:
+            self.log(f"[ERROR] {e}")
+            return None
+        return lock
+
+    def write(self, data_by_date):
+        """
+        写入多天数据：加载一次，写入、重算派生列、设置重新计算标记后保存一次
+
+        先记入写入日志，再等待工作簿写入锁。拿到锁后把日志中所有未保存的记录合并写入；
+        等锁期间本次数据已被其他请求一并写入（日志中有本次记录的提交记录）时，不再加载和保存。
+
+        Args:
+            data_by_date: {日期字符串 'YYYY-MM-DD': {水表系统名称: 数值}}
+
+        Returns:
+            dict: {'success': bool, 'dates_written': int, 'meters_written': int, 'coalesced': bool}
+        """
+        failed = {'success': False, 'dates_written': 0, 'meters_written': 0, 'coalesced': False}
+        try:
+            with self.stage('journal'):
+                entry_id = self.journal.begin(data_by_date)
+        except WorkbookLockTimeout as e:
+            self.log(f"[ERROR] {e}")
+            return failed
+
+        lock = self._acquire_lock()
+        if lock is None:
+            return failed
+
+        try:
+            status = self.journal.status(entry_id)
+            if status == 'committed':
+                self.log("[INFO] 本次数据已由排队中的其他写入一并保存")
+                return {
+                    'success': True,
+                    'dates_written': len(data_by_date),
+                    'meters_written': sum(len(values) for values in data_by_date.values()),
+                    'coalesced': True
+                }
+            if status == 'dead':
+                self.log("[ERROR] 本次数据多次写入失败，已转为死信")
+                return failed
+            if status is None:
+                # 日志中找不到本次记录（如日志文件被手动删除），重新记录后写入
+                self.log("[WARNING] 写入日志中找不到本次记录，重新记录后写入")
+                entry_id = self.journal.begin(data_by_date)
+
+            written, result = self._write_entries(self.journal.entries())
+            result['success'] = entry_id in written
+            return result
+        finally:
+            lock.release()
+
+    def replay(self):
+        """
+        重放写入日志中未保存的记录（如等锁超时或保存失败留下的记录），没有记录时不加载工作簿
+
+        Returns:
+            dict: {'success': bool, 'replayed': 成功写入的记录数, 'failed': 仍未写入的记录数}
+        """
+        if not self.journal.entries():
+            return {'success': True, 'replayed': 0, 'failed': 0}
+
+        lock = self._acquire_lock()
+        if lock is None:
+            return {'success': False, 'replayed': 0, 'failed': len(self.journal.entries())}
+
+        try:
+            entries = self.journal.entries()
+            if not entries:
+                return {'success': True, 'replayed': 0, 'failed': 0}
+            self.log(f"[INFO] 重放写入日志中 {len(entries)} 条未保存的记录")
+            written, _ = self._write_entries(entries)
+            return {'success': len(written) == len(entries), 'replayed': len(written),
+                    'failed': len(entries) - len(written)}
+        finally:
+            lock.release()
+
+    def _write_entries(self, entries):
+        """
+        写入日志中的记录（需持有工作簿写入锁）
+
+        先合并写入；某条记录的数据无法写入（抛出异常）时改为逐条写入，只有出错的记录累计失败次数。
+        保存失败（如文件被占用）与数据无关，所有记录各累计一次失败。
+
+        Returns:
+            tuple: (已写入并提交的记录ID集合, {'dates_written', 'meters_written', 'coalesced'})
+        """
+        entry_ids = list(entries)
+        if len(entry_ids) > 1:
+            self.log(f"[INFO] 合并写入日志中 {len(entry_ids)} 条未保存的记录")
+
+        result, error = self._try_write(merge_entries(entries))
+        if result['success']:
+            self.journal.commit(entry_ids)
+            self.journal.compact()
+            return set(entry_ids), result
+        if error is None or len(entry_ids) == 1:
+            self._record_failure(entry_ids, error or '保存工作簿失败')
+            return set(), result
+
+        self.log(f"[WARNING] 合并写入失败（{error}），逐条写入以找出无法写入的记录")
+        written = set()
+        total = {'dates_written': 0, 'meters_written': 0, 'coalesced': False}
+        for entry_id in entry_ids:
+            result, error = self._try_write(entries[entry_id])
+            if result['success']:
+                self.journal.commit(entry_id)
+                written.add(entry_id)
+                total['dates_written'] += result['dates_written']
+                total['meters_written'] += result['meters_written']
+            else:
+                self._record_failure([entry_id], error or '保存工作簿失败')
+        self.journal.compact()
+        return written, total
+
+    def _try_write(self, data_by_date):
+        """
+        写入一次
+
+        Returns:
+            tuple: (结果, 异常信息)；异常信息为 None 表示没有抛出异常（可能是保存失败）
+        """
+        try:
+            return self._write_locked(data_by_date), None
+        except Exception as e:
+            self.log(f"[ERROR] 写入失败: {e}")
+            return {'success': False, 'dates_written': 0, 'meters_written': 0, 'coalesced': False}, str(e)
+
+    def _record_failure(self, entry_ids, error):
+        for entry_id in self.journal.fail(entry_ids, error):
+            self.log(f"[ERROR] 写入日志记录 {entry_id} 已失败 {JOURNAL_CONFIG['max_attempts']} 次，转为死信不再重放: {error}")
+
+    def _write_locked(self, data_by_date):
+        writer = self.writer
+        dates = sorted(data_by_date)
+
+        with self.stage('load'):
+            wb = writer.load_workbook_with_retry()
+        try:
+            sheet = wb.active
+
+            with self.stage('write'):
+                meters_written = sum(writer.apply_water_data(sheet, date, data_by_date[date]) for date in dates)
+
+            with self.stage('recompute'):
+                writer.recalculate_formulas(sheet, dates)
+
+            with self.stage('save'):
+                success = writer.save_workbook_with_retry(wb)
+
+            if success:
+                with self.stage('rollups'):
+                    writer.update_rollups(sheet, dates)
+        finally:
+            wb.close()
+
+        return {
+            'success': success,
+            'dates_written': len(dates) if success else 0,
+            'meters_written': meters_written if success else 0,
+            'coalesced': False
+        }
+
+    def run(self, target_date):
+        """
+        执行单日更新
+
+        Returns:
+            dict: 操作结果，包含各步骤耗时 'timings'
+        """
+        target_date_str = target_date if isinstance(target_date, str) else target_date.strftime('%Y-%m-%d')
+        started = time.perf_counter()
+
+        def finish(result):
+            self.timings['total'] = round(time.perf_counter() - started, 3)
+            result['timings'] = dict(self.timings)
+            self.log(f"[INFO] 各步骤耗时: {result['timings']}")
+            return result
+
+        extracted_data = self.journal.pending()[1].get(target_date_str)
+        if extracted_data:
+            # 上次已获取但未保存成功，直接重放
+            self.log(f"1. 写入日志中已有 {target_date_str} 未保存的数据，跳过获取")
+        else:
+            self.log("1. 获取真实水表数据...")
+            rows = self.fetch(target_date)
+            if rows is None:
+                self.log("获取数据失败")
+                return finish({'success': False, 'error': '无法获取水表数据'})
+            self.log(f"[INFO] 获取到 {len(rows)} 个水表的数据")
+
+            self.log("2. 提取水表数据...")
+            extracted_data = self.map(rows, target_date_str)
+            if not extracted_data:
+                self.log("未找到有效的水表数据")
+                return finish({'success': False, 'error': '未找到有效的水表数据'})
+
+        self.log("3. 写入Excel文件（写入、重算派生列、保存）...")
+        result = self.write({target_date_str: extracted_data})
+        if not result['success']:
+            self.log("[ERROR] Excel文件更新失败")
+            return finish({'success': False, 'error': 'Excel文件更新失败'})
+
+        self.log("[SUCCESS] Excel文件更新成功！")
+        return finish({
+            'success': True,
+            'message': f'成功更新 {len(extracted_data)} 个水表的数据到Excel文件',
+            'updated_meters': len(extracted_data),
+            'target_date': target_date,
+            'formula_preserved': True,
+            'note': '派生列已按公式重算，公式将在Excel中打开时自动计算'
+        })
+
+
+def replay_journal(writer=None, log=print):
+    """任务开始时重放写入日志中未保存的记录（见 DailyUpdatePipeline.replay）"""
+    return DailyUpdatePipeline(writer=writer, log=log).replay()
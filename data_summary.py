@@ -151,38 +151,37 @@ def show_latest_data_summary():
         return False
 
 def show_all_recent_files():
-    """显示所有最近的文件"""
-    print("\n📁 最近生成的所有数据文件:")
-    print("-" * 50)
-    
-    # 获取所有JSON文件
-    all_files = glob.glob("*.json")
+    """显示最近的取数记录（来自读数存储，不再逐个扫描快照文件）"""
+    from water_store import get_water_store
     
-    # 按修改时间排序
-    all_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
+    print("\n📁 最近的取数记录:")
+    print("-" * 50)
     
-    today = datetime.now().strftime('%Y%m%d')
+    store = get_water_store()
+    today = datetime.now().strftime('%Y-%m-%d')
     
-    for filename in all_files[:10]:  # 显示最近10个
-        mtime = datetime.fromtimestamp(os.path.getmtime(filename))
-        file_size = os.path.getsize(filename)
+    for fetch in store.recent_fetches(limit=10):  # 显示最近10次
+        source = fetch['source'] or ''
         
-        # 判断文件类型
-        if 'COMPLETE_8_METERS' in filename:
-            file_type = "🏆 完整版"
-        elif 'TEST_recent' in filename:
-            file_type = "🧪 测试版"
-        elif 'REAL_water' in filename:
-            file_type = "💎 真实数据"
+        # 判断来源类型
+        if 'complete_8_meters' in source:
+            fetch_type = "🏆 完整版"
+        elif 'web_interface' in source:
+            fetch_type = "🌐 Web获取"
+        elif fetch['source_file']:
+            fetch_type = "📄 导入快照"
         else:
-            file_type = "📄 其他"
+            fetch_type = "💎 真实数据"
         
-        # 判断是否是今天的文件
-        is_today = today in filename
-        today_mark = " 🆕" if is_today else ""
+        # 判断是否是今天获取的
+        today_mark = " 🆕" if (fetch['fetched_at'] or '').startswith(today) else ""
         
-        print(f"  {file_type} {filename}{today_mark}")
-        print(f"     时间: {mtime.strftime('%Y-%m-%d %H:%M:%S')} | 大小: {file_size:,} 字节")
+        print(f"  {fetch_type} {fetch['start_date']} ~ {fetch['end_date']}{today_mark}")
+        print(f"     时间: {fetch['fetched_at']} | 水表: {fetch['meter_count']} | 来源: {fetch['source_file'] or source}")
+    
+    summary = store.summary()
+    print(f"\n📊 存储共 {summary['readings']:,} 条读数，{summary['meters']} 个水表，"
+          f"{summary['first_date']} ~ {summary['last_date']}，{summary['fetches']} 次取数")
 
 if __name__ == "__main__":
     success = show_latest_data_summary()
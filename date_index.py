@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日期索引
+每日供水表的第1列是按时间顺序排列的日期。这里把 日期 -> 行 建成有序索引，
+按日期查找和按日期范围取行都用二分查找完成（O(log n) + 结果行数），不再逐行扫描。
+- 报表接口：索引挂在已解析工作表（workbook_cache.ParsedSheet）上，每个文件版本只建一次
+- SpecificExcelWriter：在打开的工作簿上建一次索引，插入新行时同步更新
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+
+def parse_date_cell(value):
+    """把日期列的单元格值转换为 datetime；不是日期时返回 None"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value.strip()[:10], '%Y-%m-%d')
+        except ValueError:
+            return None
+    return None
+
+
+def _day(value):
+    """把日期参数统一为当天零点的 datetime"""
+    if isinstance(value, str):
+        value = datetime.strptime(value, '%Y-%m-%d')
+    return datetime(value.year, value.month, value.day)
+
+
+class DateRowIndex:
+    """有序的 日期 -> 行引用 索引（行引用可以是Excel行号，也可以是数据行列表的下标）"""
+
+    def __init__(self, entries=()):
+        pairs = sorted(entries)
+        self.dates = [date for date, _ in pairs]
+        self.refs = [ref for _, ref in pairs]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """由数据行列表建立索引，行引用为列表下标"""
+        entries = []
+        for position, row in enumerate(rows):
+            date = parse_date_cell(row[0]) if row else None
+            if date is not None:
+                entries.append((date, position))
+        return cls(entries)
+
+    @classmethod
+    def from_sheet(cls, sheet, min_row=5):
+        """由 openpyxl 工作表的第1列建立索引，行引用为Excel行号"""
+        entries = []
+        for row_num, (value,) in enumerate(sheet.iter_rows(min_row=min_row, max_col=1, values_only=True), start=min_row):
+            date = parse_date_cell(value)
+            if date is not None:
+                entries.append((date, row_num))
+        return cls(entries)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def find(self, date):
+        """查找某天的行引用；没有该日期返回 None"""
+        date = _day(date)
+        i = bisect_left(self.dates, date)
+        if i < len(self.dates) and self.dates[i] == date:
+            return self.refs[i]
+        return None
+
+    def range(self, start, end):
+        """日期在 [start, end] 内（含首尾，按天比较）的行引用，按日期升序"""
+        lo = bisect_left(self.dates, _day(start))
+        hi = bisect_right(self.dates, _day(end))
+        return self.refs[lo:hi]
+
+    def last_on_or_before(self, date):
+        """不晚于某天的最后一个位置（用于倒序遍历），没有时返回 -1"""
+        return bisect_right(self.dates, _day(date)) - 1
+
+    def next_after(self, date):
+        """第一个晚于某天的行引用；没有时返回 None"""
+        i = bisect_right(self.dates, _day(date))
+        return self.refs[i] if i < len(self.refs) else None
+
+    def insert(self, date, row_num):
+        """
+        登记在 row_num 处插入的新日期行（Excel行号引用）
+
+        原来位于 row_num 及之后的行都会下移一行。
+        """
+        self.refs = [ref + 1 if ref >= row_num else ref for ref in self.refs]
+        date = _day(date)
+        i = bisect_right(self.dates, date)
+        self.dates.insert(i, date)
+        self.refs.insert(i, row_num)
+
+
+def get_sheet_date_index(parsed_sheet):
+    """获取已解析工作表的日期索引（每个文件版本只建立一次）"""
+    index = parsed_sheet.extras.get('date_index')
+    if index is None:
+        index = DateRowIndex.from_rows(parsed_sheet.data_rows)
+        parsed_sheet.extras['date_index'] = index
+    return index
+
+
+def month_bounds(year, month):
+    """某年某月的第一天和最后一天（datetime）"""
+    first_day = datetime(year, month, 1)
+    if month == 12:
+        next_month = datetime(year + 1, 1, 1)
+    else:
+        next_month = datetime(year, month + 1, 1)
+    return first_day, next_month - timedelta(days=1)
@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 import os
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from excel_style_registry import get_style_registry
 
 # 优先尝试导入pandas，如果失败则使用备用方案
 PANDAS_AVAILABLE = False
@@ -26,6 +27,19 @@ except ImportError as e:
             return None
     pd = MockPandas()
 
+# 追加数据行的样式（只创建一次，按工作簿登记后直接复用）
+DATA_FONT = Font(name='Microsoft YaHei', size=11)
+DATA_ALIGNMENT = Alignment(horizontal='center', vertical='center')
+DATA_BORDER = Border(
+    left=Side(border_style='thin'),
+    right=Side(border_style='thin'),
+    top=Side(border_style='thin'),
+    bottom=Side(border_style='thin')
+)
+EMPTY_VALUE_FILL = PatternFill(start_color="F5F5F5", end_color="F5F5F5", fill_type="solid")  # 浅灰色背景
+HIGH_VALUE_FILL = PatternFill(start_color='FFE6E6', end_color='FFE6E6', fill_type='solid')    # >100000
+MEDIUM_VALUE_FILL = PatternFill(start_color='FFF2E6', end_color='FFF2E6', fill_type='solid')  # >50000
+
 def calculate_yesterday():
     """计算昨天的日期"""
     yesterday = datetime.now() - timedelta(days=1)
@@ -423,7 +437,16 @@ def test_excel_export():
         return False
 
 def update_excel_with_date(excel_file_path, water_data, target_date):
-    """向现有Excel文件中添加指定日期的数据"""
+    """向现有Excel文件中添加指定日期的数据（在工作簿写入锁内加载、修改、保存）"""
+    from workbook_lock import workbook_lock, WorkbookLockTimeout
+    
+    try:
+        with workbook_lock(excel_file_path):
+            return _update_excel_with_date(excel_file_path, water_data, target_date)
+    except WorkbookLockTimeout as e:
+        return False, f"Excel文件正在被其他任务修改，请稍后重试: {str(e)}"
+
+def _update_excel_with_date(excel_file_path, water_data, target_date):
     import time
     
     try:
@@ -529,21 +552,12 @@ def update_excel_with_date(excel_file_path, water_data, target_date):
         if insert_row <= ws.max_row:
             ws.insert_rows(insert_row)
         
-        # 定义样式
-        data_font = Font(name='Microsoft YaHei', size=11)
-        data_alignment = Alignment(horizontal='center', vertical='center')
-        border = Border(
-            left=Side(border_style='thin'),
-            right=Side(border_style='thin'),
-            top=Side(border_style='thin'),
-            bottom=Side(border_style='thin')
-        )
+        # 样式按工作簿登记，相同样式只构建一次
+        styles = get_style_registry(wb)
         
         # 添加日期
         date_cell = ws.cell(row=insert_row, column=1, value=target_date)
-        date_cell.font = data_font
-        date_cell.alignment = data_alignment
-        date_cell.border = border
+        styles.apply(date_cell, font=DATA_FONT, alignment=DATA_ALIGNMENT, border=DATA_BORDER)
         
         # 添加各水表数据
         for col_idx, meter_name in enumerate(header_meters, 2):
@@ -551,27 +565,27 @@ def update_excel_with_date(excel_file_path, water_data, target_date):
             # 如果值是None，在Excel中显示为空白
             display_value = value if value is not None else ""
             cell = ws.cell(row=insert_row, column=col_idx, value=display_value)
-            cell.font = data_font
-            cell.alignment = data_alignment
-            cell.border = border
+            cell_style = {'font': DATA_FONT, 'alignment': DATA_ALIGNMENT, 'border': DATA_BORDER}
             
             # 如果是空白值，可以添加特殊样式
             if value is None:
-                cell.fill = PatternFill(start_color="F5F5F5", end_color="F5F5F5", fill_type="solid")  # 浅灰色背景
+                cell_style['fill'] = EMPTY_VALUE_FILL
             
             # 数值格式化和高亮
             if isinstance(value, (int, float)) and value != '':
-                cell.number_format = '#,##0.00'
+                cell_style['number_format'] = '#,##0.00'
                 if value > 100000:
-                    cell.fill = PatternFill(start_color='FFE6E6', end_color='FFE6E6', fill_type='solid')
+                    cell_style['fill'] = HIGH_VALUE_FILL
                 elif value > 50000:
-                    cell.fill = PatternFill(start_color='FFF2E6', end_color='FFF2E6', fill_type='solid')
+                    cell_style['fill'] = MEDIUM_VALUE_FILL
+            styles.apply(cell, **cell_style)
         
-        # 保存文件（处理权限问题）
+        # 保存文件（先保存到临时文件再替换原文件，处理权限问题）
+        from workbook_journal import atomic_save
         max_save_retries = 3
         for attempt in range(max_save_retries):
             try:
-                wb.save(excel_file_path)
+                atomic_save(wb, excel_file_path)
                 break
             except PermissionError as e:
                 if attempt < max_save_retries - 1:
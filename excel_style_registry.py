@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Excel样式登记
+生成统计表和数据行时，原来每个单元格都新建 Font/Border/Side/Alignment/PatternFill 对象，
+或 copy.copy 模板单元格（如 ws.cell(51, 5)）的样式，每次赋值 openpyxl 都要在工作簿样式表中查找一次。
+这里按工作簿登记样式：
+- 每种样式组合（单元格原样式 + 从模板复制的属性 + 指定的属性）只构建一次，
+  记下它在工作簿样式表中的下标组合（StyleArray），之后直接赋给单元格
+- 样式对象只在模块中创建一次，相同样式在样式表中始终是同一条记录
+结果与逐个属性赋值完全相同。
+"""
+
+import copy
+import weakref
+
+from openpyxl.styles import Alignment, Border, Side
+
+# 常用样式（只创建一次）
+THIN_SIDE = Side(style='thin', color='000000')
+THIN_BORDER = Border(left=THIN_SIDE, right=THIN_SIDE, top=THIN_SIDE, bottom=THIN_SIDE)
+CENTER_ALIGNMENT = Alignment(horizontal='center', vertical='center')
+
+STYLE_ATTRS = ('font', 'fill', 'border', 'alignment', 'number_format', 'protection')
+
+
+def _style_key(cell):
+    # 没有设置过样式的单元格（包括合并区域中的单元格）_style 为 None
+    return tuple(cell._style) if cell._style is not None else None
+
+
+class StyleRegistry:
+    """一个工作簿的样式登记表"""
+
+    def __init__(self):
+        self._styles = {}   # (原样式, 模板样式, 复制的属性, 指定的属性) -> StyleArray
+
+    def apply(self, cell, template=None, copy_attrs=(), **attrs):
+        """
+        设置单元格样式
+
+        Args:
+            cell: 目标单元格
+            template: 模板单元格
+            copy_attrs: 从模板复制的属性，如 ('font', 'fill')
+            **attrs: 指定的属性（font、fill、border、alignment、number_format、protection），
+                     在复制模板属性之后设置
+        """
+        key = (_style_key(cell),
+               _style_key(template) if template is not None and copy_attrs else None,
+               tuple(copy_attrs),
+               tuple(sorted(attrs.items())))
+        style = self._styles.get(key)
+        if style is None:
+            for name in copy_attrs:
+                setattr(cell, name, copy.copy(getattr(template, name)))
+            for name, value in attrs.items():
+                if name not in STYLE_ATTRS:
+                    raise ValueError(f'未知的样式属性: {name}')
+                setattr(cell, name, value)
+            style = self._styles[key] = copy.copy(cell._style)
+        else:
+            cell._style = copy.copy(style)
+        return cell
+
+    def __len__(self):
+        return len(self._styles)
+
+
+_registries = weakref.WeakKeyDictionary()
+
+
+def get_style_registry(wb):
+    """获取工作簿的样式登记表（随工作簿释放）"""
+    registry = _registries.get(wb)
+    if registry is None:
+        registry = _registries[wb] = StyleRegistry()
+    return registry
@@ -4,27 +4,16 @@
 智能提取水数据 - 处理当前月份数据不完整的情况
 """
 
-import openpyxl
-from datetime import datetime, timedelta
+from billing_cycle import get_cycle_totals, BILLING_CYCLE_CONFIG
 
-def find_column_by_name(ws, header_row, search_terms):
-    """在表头行中查找列"""
-    for col in range(1, ws.max_column + 1):
-        header_val = ws.cell(header_row, col).value
-        if header_val:
-            header_str = str(header_val).strip()
-            for term in search_terms:
-                if term in header_str:
-                    return col
-    return None
-
-def extract_monthly_data_smart(year, month, data_file="excel_exports/石滩供水服务部每日总供水情况.xlsx"):
+def extract_monthly_data_smart(year, month, data_file=BILLING_CYCLE_CONFIG['data_file']):
     """
     智能提取指定月份的数据
     
     逻辑：
     1. 理想时间范围：上月25日 - 本月24日
     2. 实际时间范围：上月25日 - 数据源中的最后可用日期
+    合计来自 billing_cycle 的抄表周期统计（周期内24日之后没有数据，两种范围的合计相同）
     
     Args:
         year: 年份
@@ -38,51 +27,23 @@ def extract_monthly_data_smart(year, month, data_file="excel_exports/石滩供
     print(f"[Smart Extracting Data] {year}年{month}月")
     print(f"{'='*100}")
     
-    # 计算理想的开始日期
-    if month == 1:
-        start_date = datetime(year - 1, 12, 25)
-    else:
-        start_date = datetime(year, month - 1, 25)
-    
-    # 计算理想的结束日期
-    ideal_end_date = datetime(year, month, 24)
-    
-    # 加载数据文件
-    print(f"\n[Loading] {data_file}")
-    wb = openpyxl.load_workbook(data_file, data_only=True)
-    ws = wb.worksheets[2]  # 第3个工作表
-    
-    header_row = 4
-    date_col = 1
-    data_start_row = 5
+    cycle = get_cycle_totals(year, month, data_file)
+    start_date = cycle['start_date']
+    ideal_end_date = cycle['ideal_end_date']
+    actual_end_date = cycle['end_date']
+    last_available_date = cycle['last_available_date']
+    is_partial = cycle['is_partial']
     
     # 查找数据源中的最后可用日期
     print(f"\n[Finding Last Available Date]...")
-    last_available_date = None
-    last_available_row = None
-    
-    for row in range(ws.max_row, data_start_row - 1, -1):
-        date_val = ws.cell(row, date_col).value
-        if isinstance(date_val, datetime):
-            last_available_date = date_val
-            last_available_row = row
-            break
-    
     if last_available_date:
-        print(f"  Last available date in data source: {last_available_date.strftime('%Y-%m-%d')} (Row {last_available_row})")
+        print(f"  Last available date in data source: {last_available_date.strftime('%Y-%m-%d')}")
     else:
         raise Exception("No valid date found in data source")
     
-    # 确定实际的结束日期
-    # 如果理想结束日期超过最后可用日期，使用最后可用日期
-    if ideal_end_date > last_available_date:
-        actual_end_date = last_available_date
+    if is_partial:
         print(f"  [INFO] Ideal end date ({ideal_end_date.strftime('%Y-%m-%d')}) is beyond available data")
         print(f"  [INFO] Using last available date: {actual_end_date.strftime('%Y-%m-%d')}")
-        is_partial = True
-    else:
-        actual_end_date = ideal_end_date
-        is_partial = False
     
     # 检查开始日期是否在数据源范围内
     if start_date > last_available_date:
@@ -99,61 +60,21 @@ def extract_monthly_data_smart(year, month, data_file="excel_exports/石滩供
         print(f"  Status: [COMPLETE] Full month data available")
     print(f"  Days: {(actual_end_date - start_date).days + 1}")
     
-    # 更新列映射
     print(f"\n[Column Mapping]")
-    column_mapping = {
-        "荔新大道": find_column_by_name(ws, header_row, ["荔新大道", "荔新"]),
-        "宁西2总表": find_column_by_name(ws, header_row, ["宁西2总表", "宁西2"]),
-        "如丰大道600监控表": find_column_by_name(ws, header_row, ["如丰大道600", "如丰大道"]),
-        "新城大道医院NB": find_column_by_name(ws, header_row, ["新城大道医院NB", "新城大道医院", "新城大道"]),
-        "三棵树600监控表": find_column_by_name(ws, header_row, ["三棵树600", "三棵树", "三棵竹600"]),
-    }
-    
-    for name, col in column_mapping.items():
-        if col:
-            header_val = ws.cell(header_row, col).value
-            print(f"  {name:20s} -> Column {col:2d} ({header_val})")
+    for name, col_idx in cycle['columns'].items():
+        if col_idx is not None:
+            print(f"  {name:20s} -> Column {col_idx + 1:2d} ({cycle['headers'][name]})")
         else:
             print(f"  {name:20s} -> NOT FOUND!")
     
-    # 查找日期范围内的数据
-    print(f"\n[Searching Data Rows]...")
-    matched_rows = []
-    
-    for row in range(data_start_row, ws.max_row + 1):
-        date_val = ws.cell(row, date_col).value
-        
-        if isinstance(date_val, datetime):
-            if start_date <= date_val <= actual_end_date:
-                matched_rows.append(row)
-    
-    print(f"  [OK] Found {len(matched_rows)} rows")
-    
-    if matched_rows:
-        print(f"  First row: {matched_rows[0]} - {ws.cell(matched_rows[0], date_col).value.strftime('%Y-%m-%d')}")
-        print(f"  Last row: {matched_rows[-1]} - {ws.cell(matched_rows[-1], date_col).value.strftime('%Y-%m-%d')}")
+    print(f"\n[Data Rows] Found {cycle['days']} rows")
     
-    # 计算总和
-    print(f"\n[Calculating Totals]...")
-    totals = {}
-    
-    for name, col in column_mapping.items():
-        if col is None:
-            totals[name] = 0
+    print(f"\n[Totals]")
+    for name, total in cycle['totals'].items():
+        if cycle['columns'][name] is None:
             print(f"  {name:20s} -> Column not found, set to 0")
-            continue
-        
-        total = 0
-        valid_count = 0
-        
-        for row in matched_rows:
-            val = ws.cell(row, col).value
-            if val and isinstance(val, (int, float)):
-                total += val
-                valid_count += 1
-        
-        totals[name] = total
-        print(f"  {name:20s} -> {total:15,.0f} (from {valid_count} valid values)")
+        else:
+            print(f"  {name:20s} -> {total:15,.0f} (from {cycle['counts'][name]} valid values)")
     
     return {
         "year": year,
@@ -162,9 +83,9 @@ def extract_monthly_data_smart(year, month, data_file="excel_exports/石滩供
         "end_date": actual_end_date.strftime('%Y-%m-%d'),
         "ideal_end_date": ideal_end_date.strftime('%Y-%m-%d'),
         "is_partial": is_partial,
-        "days": len(matched_rows),
-        "expected_days": (ideal_end_date - start_date).days + 1,
-        "totals": totals
+        "days": cycle['days'],
+        "expected_days": cycle['expected_days'],
+        "totals": cycle['totals']
     }
 
 def main():
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量取数计划
+对比Excel中已有的 (日期, 水表) 单元格和期望的日期窗口，只获取缺失或空白的单元格：
+1. 读取窗口内各水表列的现有数值，找出空白单元格
+2. 写入日志中上次获取后未保存成功的数值、响应缓存中已有（且未过期）的数值直接使用，不再请求接口
+3. 剩余缺失的日期按接口允许的最大天数合并成最少的请求窗口，每个窗口只请求其中缺数的水表
+4. 获取的数据通过 DailyUpdatePipeline 在一次加载/保存中写入Excel（同时重算派生列）
+重复执行或部分成功后重试时，已写入的数据不会再次获取
+"""
+
+from datetime import datetime, timedelta
+
+from specific_excel_writer import SpecificExcelWriter
+from water_session_pool import get_session_pool
+from water_response_cache import get_response_cache
+from integrated_excel_updater import extract_meter_values
+from daily_update_pipeline import DailyUpdatePipeline, replay_journal
+from workbook_journal import WriteJournal
+
+# 计划配置
+PLANNER_CONFIG = {
+    'lookback_days': 7,         # 默认检查截至昨天的最近天数
+    'max_window_days': 31       # 单次请求的最大天数
+}
+
+# 水表ID -> 系统名称（与 SpecificExcelWriter.meter_mapping 的键一致）
+METER_NAMES = {
+    '1261181000263': '荔新大道DN1200流量计',
+    '1261181000300': '新城大道医院DN800流量计',
+    '1262330402331': '宁西总表DN1200',
+    '2190066': '三江新总表DN800（2190066）',
+    '2190493': '沙庄总表',
+    '2501200108': '2501200108',
+    '2520005': '如丰大道600监控表',
+    '2520006': '三棵树600监控表'
+}
+
+
+def _date_list(start_date, end_date):
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    return [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+
+
+def _is_blank(value):
+    return value is None or (isinstance(value, str) and value.strip() == '')
+
+
+def find_missing_cells(start_date, end_date, writer=None):
+    """
+    找出窗口内Excel中缺失或空白的 (日期, 水表) 单元格
+
+    Returns:
+        dict: {日期字符串: [缺数的水表ID, ...]}，不缺数的日期不包含在内
+    """
+    writer = writer or SpecificExcelWriter()
+    existing = writer.get_existing_meter_values(start_date, end_date)
+
+    missing = {}
+    for date_str in _date_list(start_date, end_date):
+        row = existing.get(date_str, {})
+        meter_ids = [meter_id for meter_id, name in METER_NAMES.items() if _is_blank(row.get(name))]
+        if meter_ids:
+            missing[date_str] = meter_ids
+    return missing
+
+
+def plan_fetches(missing, max_window_days=None):
+    """
+    把缺失单元格合并成最少的接口请求
+
+    贪心覆盖：从最早的缺数日期开始，每个窗口尽量覆盖 max_window_days 天，
+    窗口内请求的水表为其中所有缺数水表的并集。
+
+    Returns:
+        list: [{'start', 'end', 'meter_ids', 'dates'}, ...]
+    """
+    max_window_days = max_window_days or PLANNER_CONFIG['max_window_days']
+
+    plans = []
+    for date_str in sorted(missing):
+        current = plans[-1] if plans else None
+        if current:
+            window_end = datetime.strptime(current['start'], '%Y-%m-%d') + timedelta(days=max_window_days - 1)
+            if date_str <= window_end.strftime('%Y-%m-%d'):
+                current['end'] = date_str
+                current['dates'].append(date_str)
+                current['meter_ids'].update(missing[date_str])
+                continue
+        plans.append({'start': date_str, 'end': date_str, 'dates': [date_str], 'meter_ids': set(missing[date_str])})
+
+    for plan in plans:
+        plan['meter_ids'] = [meter_id for meter_id in METER_NAMES if meter_id in plan['meter_ids']]
+    return plans
+
+
+def fill_from_journal(missing, writer):
+    """
+    用写入日志中未保存的数值（上次已获取但保存失败）填充缺失单元格
+
+    Returns:
+        tuple: (已填充的数据 {日期: {水表系统名称: 数值}}, 仍缺失的 {日期: [水表ID]})
+    """
+    pending = WriteJournal(writer.excel_path).pending()[1]
+    filled = {}
+    remaining = {}
+    for date_str, meter_ids in missing.items():
+        values = pending.get(date_str, {})
+        for meter_id in meter_ids:
+            value = values.get(METER_NAMES[meter_id])
+            if not _is_blank(value):
+                filled.setdefault(date_str, {})[METER_NAMES[meter_id]] = value
+            else:
+                remaining.setdefault(date_str, []).append(meter_id)
+    return filled, remaining
+
+
+def fill_from_cache(missing):
+    """
+    用响应缓存中的数值填充缺失单元格
+
+    Returns:
+        tuple: (已填充的数据 {日期: {水表系统名称: 数值}}, 仍缺失的 {日期: [水表ID]})
+    """
+    cache = get_response_cache()
+    filled = {}
+    remaining = {}
+    for date_str, meter_ids in missing.items():
+        for meter_id in meter_ids:
+            hit, value = cache.get_value(meter_id, date_str)
+            if hit and not _is_blank(value):
+                filled.setdefault(date_str, {})[METER_NAMES[meter_id]] = float(value)
+            else:
+                remaining.setdefault(date_str, []).append(meter_id)
+    return filled, remaining
+
+
+def run_incremental_update(start_date=None, end_date=None):
+    """
+    只获取并写入窗口内缺失的数据
+
+    Args:
+        start_date: 开始日期字符串，默认为截至昨天的最近 lookback_days 天
+        end_date: 结束日期字符串，默认为昨天
+
+    Returns:
+        dict: {'success', 'message', 'updated_meters', 'planned_calls', 'missing_cells', 'remaining_cells', 'timings'}
+    """
+    if not end_date:
+        end_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    if not start_date:
+        start_date = (datetime.strptime(end_date, '%Y-%m-%d')
+                      - timedelta(days=PLANNER_CONFIG['lookback_days'] - 1)).strftime('%Y-%m-%d')
+
+    writer = SpecificExcelWriter()
+    # 先重放写入日志中未保存的记录（如上次等锁超时留下的数据），再计算缺失单元格
+    replay_journal(writer=writer)
+    missing = find_missing_cells(start_date, end_date, writer)
+    missing_cells = sum(len(meter_ids) for meter_ids in missing.values())
+    print(f"[INFO] {start_date} ~ {end_date} 共缺失 {missing_cells} 个单元格")
+
+    if not missing:
+        return {
+            'success': True,
+            'message': 'Excel中的数据已完整，无需获取',
+            'updated_meters': 0,
+            'planned_calls': 0,
+            'missing_cells': 0,
+            'remaining_cells': 0
+        }
+
+    data_by_date, remaining = fill_from_journal(missing, writer)
+    if data_by_date:
+        print(f"[INFO] 写入日志中有 {sum(len(v) for v in data_by_date.values())} 个未保存的数值，直接重放")
+    cached, remaining = fill_from_cache(remaining)
+    for date_str, values in cached.items():
+        data_by_date.setdefault(date_str, {}).update(values)
+    plans = plan_fetches(remaining)
+    print(f"[INFO] 缓存命中 {sum(len(v) for v in cached.values())} 个，计划请求 {len(plans)} 次")
+
+    pool = get_session_pool()
+    failed_calls = 0
+    for plan in plans:
+        print(f"[INFO] 请求 {plan['start']} ~ {plan['end']}，水表 {len(plan['meter_ids'])} 个")
+        data = pool.fetch_water_yield(plan['start'], plan['end'], meter_ids=plan['meter_ids'])
+        if not data or not isinstance(data.get('rows'), list):
+            print(f"[WARNING] {plan['start']} ~ {plan['end']} 获取失败")
+            failed_calls += 1
+            continue
+
+        for date_str in plan['dates']:
+            wanted = {METER_NAMES[meter_id] for meter_id in remaining[date_str]}
+            values = extract_meter_values(data['rows'], date_str, log=lambda message: None)
+            for name, value in values.items():
+                if name in wanted and value is not None:
+                    data_by_date.setdefault(date_str, {})[name] = value
+
+    updated_meters = sum(len(values) for values in data_by_date.values())
+    remaining_cells = missing_cells - updated_meters
+
+    timings = {}
+    if data_by_date:
+        # 一次加载：写入、重算派生列、保存一次
+        pipeline = DailyUpdatePipeline(writer=writer)
+        result = pipeline.write(data_by_date)
+        timings = pipeline.timings
+        if not result['success']:
+            return {
+                'success': False,
+                'error': 'Excel文件更新失败',
+                'planned_calls': len(plans),
+                'missing_cells': missing_cells,
+                'timings': timings
+            }
+
+    if failed_calls and not data_by_date:
+        return {
+            'success': False,
+            'error': f'{failed_calls}次请求全部失败',
+            'planned_calls': len(plans),
+            'missing_cells': missing_cells
+        }
+
+    message = f'补齐 {updated_meters} 个单元格'
+    if remaining_cells:
+        message += f'，仍有 {remaining_cells} 个单元格暂无数据'
+    print(f"[SUCCESS] {message}")
+    return {
+        'success': True,
+        'message': message,
+        'updated_meters': updated_meters,
+        'planned_calls': len(plans),
+        'missing_cells': missing_cells,
+        'remaining_cells': remaining_cells,
+        'timings': timings
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    outcome = run_incremental_update(*sys.argv[1:3])
+    sys.exit(0 if outcome['success'] else 1)
@@ -4,17 +4,18 @@
 强制获取真实数据 - 必须成功获取指定日期的真实水表数据
 """
 
-import requests
 import json
-import hashlib
 import time
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 import random
 
-def md5_hash(text):
-    """计算MD5哈希值"""
-    return hashlib.md5(text.encode('utf-8')).hexdigest()
+from water_session_pool import get_session_pool, format_node_ids
+
+METER_IDS = [
+    '1261181000263', '1261181000300', '1262330402331', '2190066',
+    '2190493', '2501200108', '2520005', '2520006'
+]
 
 def force_get_real_data(target_date):
     """强制获取指定日期的真实数据 - 多种方法尝试直到成功"""
@@ -52,152 +53,88 @@ def force_get_real_data(target_date):
 def try_strategy(target_date, strategy):
     """尝试不同的策略获取数据"""
     
-    session = requests.Session()
-    
-    # 登录
-    if not login_to_system(session):
+    # 登录（会话池内已登录时直接复用，不会为每个策略重新登录）
+    if not login_to_system():
         return None
     
     if strategy == "single_day_query":
-        return single_day_api_call(session, target_date)
+        return single_day_api_call(target_date)
     
     elif strategy == "range_query_small":
         # 小范围查询：目标日期前后1天
         target_dt = datetime.strptime(target_date, '%Y-%m-%d')
         start_date = (target_dt - timedelta(days=1)).strftime('%Y-%m-%d')
         end_date = (target_dt + timedelta(days=1)).strftime('%Y-%m-%d')
-        return range_api_call(session, start_date, end_date, target_date)
+        return range_api_call(start_date, end_date, target_date)
     
     elif strategy == "range_query_medium":
         # 中等范围查询：目标日期前后3天
         target_dt = datetime.strptime(target_date, '%Y-%m-%d')
         start_date = (target_dt - timedelta(days=3)).strftime('%Y-%m-%d')
         end_date = (target_dt + timedelta(days=3)).strftime('%Y-%m-%d')
-        return range_api_call(session, start_date, end_date, target_date)
+        return range_api_call(start_date, end_date, target_date)
     
     elif strategy == "range_query_large":
         # 大范围查询：目标日期前后7天
         target_dt = datetime.strptime(target_date, '%Y-%m-%d')
         start_date = (target_dt - timedelta(days=7)).strftime('%Y-%m-%d')
         end_date = (target_dt + timedelta(days=7)).strftime('%Y-%m-%d')
-        return range_api_call(session, start_date, end_date, target_date)
+        return range_api_call(start_date, end_date, target_date)
     
     elif strategy == "different_api_params":
         # 尝试不同的API参数组合
-        return try_different_params(session, target_date)
+        return try_different_params(target_date)
     
     elif strategy == "retry_with_delay":
         # 重试策略：多次尝试，每次间隔随机延迟
-        return retry_with_random_delay(session, target_date)
+        return retry_with_random_delay(target_date)
     
     elif strategy == "browser_simulation":
         # 模拟浏览器行为
-        return browser_like_request(session, target_date)
+        return browser_like_request(target_date)
     
     elif strategy == "direct_page_scraping":
         # 直接抓取网页数据
-        return direct_page_scraping(session, target_date)
+        return direct_page_scraping(target_date)
     
     return None
 
-def login_to_system(session):
-    """登录到水务系统"""
-    try:
-        login_url = "http://axwater.dmas.cn/login.aspx"
-        login_page = session.get(login_url)
-        
-        soup = BeautifulSoup(login_page.text, 'html.parser')
-        form = soup.find('form')
-        
-        form_data = {}
-        if form:
-            for input_elem in form.find_all('input'):
-                name = input_elem.get('name')
-                value = input_elem.get('value', '')
-                if name:
-                    form_data[name] = value
-        
-        username = "13509288500"
-        password = "288500"
-        form_data['user'] = username
-        form_data['pwd'] = md5_hash(password)
-        
-        login_response = session.post(login_url, data=form_data)
-        
-        if 'window.location' in login_response.text:
-            print("✅ 登录成功")
-            return True
-        else:
-            print("❌ 登录失败")
-            return False
-            
-    except Exception as e:
-        print(f"❌ 登录异常: {e}")
+def login_to_system():
+    """登录到水务系统（通过共享会话池）"""
+    if get_session_pool().warm_up():
+        print("✅ 登录成功")
+        return True
+    print("❌ 登录失败")
+    return False
+
+def _has_target_value(json_data, target_date):
+    """检查接口数据中是否包含目标日期的真实数值"""
+    if not json_data or not json_data.get('rows'):
         return False
+    for row in json_data['rows']:
+        if target_date in row and isinstance(row[target_date], (int, float)):
+            return True
+    return False
 
-def single_day_api_call(session, target_date):
+def single_day_api_call(target_date):
     """单日API调用"""
     try:
-        report_url = "http://axwater.dmas.cn/reports/FluxRpt.aspx"
-        report_response = session.get(report_url)
-        
-        if report_response.status_code != 200:
-            return None
-        
-        # 水表ID
-        meter_ids = [
-            '1261181000263', '1261181000300', '1262330402331', '2190066',
-            '2190493', '2501200108', '2520005', '2520006'
-        ]
-        
-        formatted_node_ids = "'" + "','".join(meter_ids) + "'"
-        
-        # 获取ASP.NET状态
-        report_soup = BeautifulSoup(report_response.text, 'html.parser')
-        viewstate = report_soup.find('input', {'name': '__VIEWSTATE'})
-        eventvalidation = report_soup.find('input', {'name': '__EVENTVALIDATION'})
-        
-        api_url = "http://axwater.dmas.cn/reports/ashx/getRptWaterYield.ashx"
         api_params = {
-            'nodeId': formatted_node_ids,
+            'nodeId': format_node_ids(METER_IDS),
             'startDate': target_date,
             'endDate': target_date,
             'rptType': 'day'
         }
         
-        if viewstate:
-            api_params['__VIEWSTATE'] = viewstate.get('value', '')
-        if eventvalidation:
-            api_params['__EVENTVALIDATION'] = eventvalidation.get('value', '')
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            'X-Requested-With': 'XMLHttpRequest',
-            'Referer': report_url
-        }
+        # 附带缓存的ASP.NET状态（__VIEWSTATE/__EVENTVALIDATION）
+        json_data = get_session_pool().post_report(api_params, include_form_state=True)
         
-        api_response = session.post(api_url, data=api_params, headers=headers)
-        
-        print(f"📡 API响应: {api_response.status_code}, 长度: {len(api_response.text)}")
-        
-        if api_response.status_code == 200 and len(api_response.text.strip()) > 0:
-            try:
-                json_data = json.loads(api_response.text)
-                if 'rows' in json_data and len(json_data['rows']) > 0:
-                    # 检查是否包含目标日期的数据
-                    for row in json_data['rows']:
-                        if target_date in row and isinstance(row[target_date], (int, float)):
-                            return {
-                                'success': True,
-                                'data': json_data,
-                                'source': 'force_real_data_single_day'
-                            }
-                return None
-            except json.JSONDecodeError:
-                return None
+        if _has_target_value(json_data, target_date):
+            return {
+                'success': True,
+                'data': json_data,
+                'source': 'force_real_data_single_day'
+            }
         
         return None
         
@@ -205,64 +142,27 @@ def single_day_api_call(session, target_date):
         print(f"❌ 单日查询异常: {e}")
         return None
 
-def range_api_call(session, start_date, end_date, target_date):
+def range_api_call(start_date, end_date, target_date):
     """范围API调用"""
     try:
         print(f"📅 范围查询: {start_date} ~ {end_date}")
         
-        report_url = "http://axwater.dmas.cn/reports/FluxRpt.aspx"
-        report_response = session.get(report_url)
-        
-        meter_ids = [
-            '1261181000263', '1261181000300', '1262330402331', '2190066',
-            '2190493', '2501200108', '2520005', '2520006'
-        ]
-        
-        formatted_node_ids = "'" + "','".join(meter_ids) + "'"
-        
-        report_soup = BeautifulSoup(report_response.text, 'html.parser')
-        viewstate = report_soup.find('input', {'name': '__VIEWSTATE'})
-        eventvalidation = report_soup.find('input', {'name': '__EVENTVALIDATION'})
-        
-        api_url = "http://axwater.dmas.cn/reports/ashx/getRptWaterYield.ashx"
         api_params = {
-            'nodeId': formatted_node_ids,
+            'nodeId': format_node_ids(METER_IDS),
             'startDate': start_date,
             'endDate': end_date,
             'rptType': 'day'
         }
         
-        if viewstate:
-            api_params['__VIEWSTATE'] = viewstate.get('value', '')
-        if eventvalidation:
-            api_params['__EVENTVALIDATION'] = eventvalidation.get('value', '')
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            'X-Requested-With': 'XMLHttpRequest',
-            'Referer': report_url
-        }
+        json_data = get_session_pool().post_report(api_params, include_form_state=True)
         
-        api_response = session.post(api_url, data=api_params, headers=headers)
-        
-        if api_response.status_code == 200 and len(api_response.text.strip()) > 0:
-            try:
-                json_data = json.loads(api_response.text)
-                if 'rows' in json_data and len(json_data['rows']) > 0:
-                    # 检查是否包含目标日期
-                    for row in json_data['rows']:
-                        if target_date in row and isinstance(row[target_date], (int, float)):
-                            print(f"✅ 在范围数据中找到 {target_date} 的真实数据！")
-                            return {
-                                'success': True,
-                                'data': json_data,
-                                'source': f'force_real_data_range_{start_date}_{end_date}'
-                            }
-                return None
-            except json.JSONDecodeError:
-                return None
+        if _has_target_value(json_data, target_date):
+            print(f"✅ 在范围数据中找到 {target_date} 的真实数据！")
+            return {
+                'success': True,
+                'data': json_data,
+                'source': f'force_real_data_range_{start_date}_{end_date}'
+            }
         
         return None
         
@@ -270,7 +170,7 @@ def range_api_call(session, start_date, end_date, target_date):
         print(f"❌ 范围查询异常: {e}")
         return None
 
-def try_different_params(session, target_date):
+def try_different_params(target_date):
     """尝试不同的参数组合"""
     print("🔧 尝试不同的API参数组合...")
     
@@ -279,59 +179,37 @@ def try_different_params(session, target_date):
     
     for rpt_type in rpt_types:
         print(f"  🔄 尝试 rptType: {rpt_type}")
-        result = single_day_with_rpt_type(session, target_date, rpt_type)
+        result = single_day_with_rpt_type(target_date, rpt_type)
         if result:
             return result
     
     return None
 
-def single_day_with_rpt_type(session, target_date, rpt_type):
+def single_day_with_rpt_type(target_date, rpt_type):
     """使用指定的rptType进行单日查询"""
     try:
-        report_url = "http://axwater.dmas.cn/reports/FluxRpt.aspx"
-        report_response = session.get(report_url)
-        
-        meter_ids = [
-            '1261181000263', '1261181000300', '1262330402331', '2190066',
-            '2190493', '2501200108', '2520005', '2520006'
-        ]
-        
-        formatted_node_ids = "'" + "','".join(meter_ids) + "'"
-        
-        api_url = "http://axwater.dmas.cn/reports/ashx/getRptWaterYield.ashx"
         api_params = {
-            'nodeId': formatted_node_ids,
+            'nodeId': format_node_ids(METER_IDS),
             'startDate': target_date,
             'endDate': target_date,
             'rptType': rpt_type
         }
         
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        }
-        
-        api_response = session.post(api_url, data=api_params, headers=headers)
+        json_data = get_session_pool().post_report(api_params)
         
-        if api_response.status_code == 200 and len(api_response.text.strip()) > 0:
-            try:
-                json_data = json.loads(api_response.text)
-                if 'rows' in json_data and len(json_data['rows']) > 0:
-                    return {
-                        'success': True,
-                        'data': json_data,
-                        'source': f'force_real_data_rptType_{rpt_type}'
-                    }
-            except json.JSONDecodeError:
-                pass
+        if json_data and json_data.get('rows'):
+            return {
+                'success': True,
+                'data': json_data,
+                'source': f'force_real_data_rptType_{rpt_type}'
+            }
         
         return None
         
     except Exception:
         return None
 
-def retry_with_random_delay(session, target_date):
+def retry_with_random_delay(target_date):
     """重试策略：多次尝试，随机延迟"""
     print("⏱️ 使用重试策略...")
     
@@ -340,37 +218,39 @@ def retry_with_random_delay(session, target_date):
         print(f"  🔄 第 {attempt + 1} 次尝试，延迟 {delay:.1f} 秒...")
         time.sleep(delay)
         
-        result = single_day_api_call(session, target_date)
+        result = single_day_api_call(target_date)
         if result:
             return result
     
     return None
 
-def browser_like_request(session, target_date):
+def browser_like_request(target_date):
     """模拟浏览器行为"""
     print("🌐 模拟浏览器行为...")
     
     try:
-        # 先访问主页面
-        main_url = "http://axwater.dmas.cn/frmMain.aspx"
-        session.get(main_url)
-        time.sleep(1)
-        
-        # 再访问报表页面
-        report_url = "http://axwater.dmas.cn/reports/FluxRpt.aspx"
-        session.get(report_url)
-        time.sleep(1)
+        # 会话池登录时已依次访问过主页面和报表页面，这里换一个新会话重新走一遍
+        get_session_pool().invalidate()
         
         # 然后进行API调用
-        return single_day_api_call(session, target_date)
+        return single_day_api_call(target_date)
         
     except Exception:
         return None
 
-def direct_page_scraping(session, target_date):
+def direct_page_scraping(target_date):
     """直接抓取网页表格数据"""
     print("🕷️ 直接抓取网页表格数据...")
     
+    try:
+        with get_session_pool().session() as pooled:
+            return _scrape_report_page(pooled.session, target_date)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return None
+
+def _scrape_report_page(session, target_date):
+    """提交报表页面表单并解析返回的表格"""
     try:
         # 构建报表页面URL，带查询参数
         report_url = "http://axwater.dmas.cn/reports/FluxRpt.aspx"
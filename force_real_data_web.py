@@ -4,17 +4,18 @@
 集成到Web应用的强制获取真实数据功能
 """
 
-import requests
 import json
-import hashlib
 import time
-from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
 import random
 
-def md5_hash(text):
-    """计算MD5哈希值"""
-    return hashlib.md5(text.encode('utf-8')).hexdigest()
+from water_session_pool import get_session_pool
+from water_response_cache import get_response_cache
+
+METER_IDS = [
+    '1261181000263', '1261181000300', '1262330402331', '2190066',
+    '2190493', '2501200108', '2520005', '2520006'
+]
 
 def force_get_real_data_for_web(target_date):
     """为Web应用强制获取指定日期的真实数据"""
@@ -45,160 +46,70 @@ def force_get_real_data_for_web(target_date):
     return create_real_data_structure(target_date)
 
 def try_direct_api_with_retry(target_date, max_retries=3):
-    """直接API调用，多次重试"""
+    """直接API调用，多次重试（复用会话池中的登录会话，过期时由会话池自动重新登录）"""
     
     for attempt in range(max_retries):
         print(f"  [RETRY] API重试 {attempt + 1}/{max_retries}")
         
-        session = requests.Session()
-        
-        # 登录
-        if not login_to_system(session):
-            continue
-        
         # 尝试获取数据
-        result = fetch_data_from_api(session, target_date)
+        result = fetch_data_from_api(target_date)
         if result and result.get('success'):
             return result
         
         # 随机延迟后重试
-        time.sleep(random.uniform(2, 5))
+        if attempt < max_retries - 1:
+            time.sleep(random.uniform(2, 5))
     
     return None
 
 
 
 def get_from_existing_data_files(target_date):
-    """从现有数据文件中获取"""
-    
-    import glob
-    import os
+    """从本地响应缓存中获取（缓存首次建立时会导入现有的数据文件）"""
     
     try:
-        data_files = (glob.glob("*COMPLETE_8_METERS*.json") + 
-                     glob.glob("WEB_COMPLETE*.json") +
-                     glob.glob("REAL_*.json"))
+        data = get_response_cache().get_date(target_date)
         
-        for filename in sorted(data_files, key=lambda x: os.path.getmtime(x), reverse=True):
-            print(f"  [CHECK] 检查文件: {filename}")
-            
-            try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                if 'data' in data and 'rows' in data['data']:
-                    # 检查是否有这个日期的数据（只要key存在就返回）
-                    has_date = False
-                    for row in data['data']['rows']:
-                        if isinstance(row, dict) and target_date in row:
-                            has_date = True
-                            break
-                    
-                    if has_date:
-                        print(f"  [FOUND] 在 {filename} 中找到 {target_date} 的数据！")
-                        return {
-                            'success': True,
-                            'data': data['data'],
-                            'source': f'existing_file_{filename}',
-                            'target_date': target_date
-                        }
-            except Exception as e:
-                print(f"  [WARNING] 读取 {filename} 失败: {e}")
-                continue
+        if data:
+            print(f"  [FOUND] 在本地缓存中找到 {target_date} 的数据！({data['total']}个水表)")
+            return {
+                'success': True,
+                'data': data,
+                'source': 'response_cache',
+                'target_date': target_date
+            }
         
         return None
         
     except Exception as e:
-        print(f"[ERROR] 检查现有文件异常: {e}")
+        print(f"[ERROR] 检查本地缓存异常: {e}")
         return None
 
-def login_to_system(session):
-    """登录到水务系统"""
-    try:
-        login_url = "http://axwater.dmas.cn/login.aspx"
-        login_page = session.get(login_url, timeout=30)
-        
-        soup = BeautifulSoup(login_page.text, 'html.parser')
-        form = soup.find('form')
-        
-        form_data = {}
-        if form:
-            for input_elem in form.find_all('input'):
-                name = input_elem.get('name')
-                value = input_elem.get('value', '')
-                if name:
-                    form_data[name] = value
-        
-        username = "13509288500"
-        password = "288500"
-        form_data['user'] = username
-        form_data['pwd'] = md5_hash(password)
-        
-        login_response = session.post(login_url, data=form_data, timeout=30)
-        
-        if 'window.location' in login_response.text:
-            # 手动访问主页面
-            main_url = "http://axwater.dmas.cn/frmMain.aspx"
-            session.get(main_url, timeout=30)
-            return True
-        
-        return False
-        
-    except Exception as e:
-        print(f"  [ERROR] 登录异常: {e}")
+def login_to_system():
+    """登录到水务系统（通过共享会话池，已登录时直接复用）"""
+    return get_session_pool().warm_up()
+
+def _find_target_date(json_data, target_date):
+    """检查接口数据中是否包含目标日期的真实数值"""
+    if not json_data or not json_data.get('rows'):
         return False
+    for row in json_data['rows']:
+        if target_date in row and isinstance(row[target_date], (int, float)):
+            return True
+    return False
 
-def fetch_data_from_api(session, target_date):
+def fetch_data_from_api(target_date):
     """从API获取数据"""
     try:
-        report_url = "http://axwater.dmas.cn/reports/FluxRpt.aspx"
-        report_response = session.get(report_url, timeout=10)
-        
-        if report_response.status_code != 200:
-            return None
-        
-        meter_ids = [
-            '1261181000263', '1261181000300', '1262330402331', '2190066',
-            '2190493', '2501200108', '2520005', '2520006'
-        ]
-        
-        formatted_node_ids = "'" + "','".join(meter_ids) + "'"
-        
-        api_url = "http://axwater.dmas.cn/reports/ashx/getRptWaterYield.ashx"
-        api_params = {
-            'nodeId': formatted_node_ids,
-            'startDate': target_date,
-            'endDate': target_date,
-            'meterType': '-1',
-            'statisticsType': 'flux',
-            'type': 'dayRpt'
-        }
+        json_data = get_session_pool().fetch_water_yield(target_date, target_date, meter_ids=METER_IDS)
         
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            'X-Requested-With': 'XMLHttpRequest',
-            'Referer': report_url
-        }
-        
-        api_response = session.post(api_url, data=api_params, headers=headers, timeout=10)
-        
-        if api_response.status_code == 200 and len(api_response.text.strip()) > 0:
-            try:
-                json_data = json.loads(api_response.text)
-                if 'rows' in json_data and len(json_data['rows']) > 0:
-                    # 检查是否包含目标日期的真实数据
-                    for row in json_data['rows']:
-                        if target_date in row and isinstance(row[target_date], (int, float)):
-                            return {
-                                'success': True,
-                                'data': json_data,
-                                'source': 'force_api_direct',
-                                'target_date': target_date
-                            }
-            except json.JSONDecodeError:
-                pass
+        if _find_target_date(json_data, target_date):
+            return {
+                'success': True,
+                'data': json_data,
+                'source': 'force_api_direct',
+                'target_date': target_date
+            }
         
         return None
         
@@ -206,52 +117,18 @@ def fetch_data_from_api(session, target_date):
         print(f"  [ERROR] API调用异常: {e}")
         return None
 
-def fetch_data_from_api_range(session, start_date, end_date, target_date):
+def fetch_data_from_api_range(start_date, end_date, target_date):
     """范围API调用"""
     try:
-        report_url = "http://axwater.dmas.cn/reports/FluxRpt.aspx"
-        report_response = session.get(report_url, timeout=10)
-        
-        meter_ids = [
-            '1261181000263', '1261181000300', '1262330402331', '2190066',
-            '2190493', '2501200108', '2520005', '2520006'
-        ]
-        
-        formatted_node_ids = "'" + "','".join(meter_ids) + "'"
-        
-        api_url = "http://axwater.dmas.cn/reports/ashx/getRptWaterYield.ashx"
-        api_params = {
-            'nodeId': formatted_node_ids,
-            'startDate': start_date,
-            'endDate': end_date,
-            'meterType': '-1',
-            'statisticsType': 'flux',
-            'type': 'dayRpt'
-        }
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        }
-        
-        api_response = session.post(api_url, data=api_params, headers=headers, timeout=10)
-        
-        if api_response.status_code == 200 and len(api_response.text.strip()) > 0:
-            try:
-                json_data = json.loads(api_response.text)
-                if 'rows' in json_data and len(json_data['rows']) > 0:
-                    # 检查是否包含目标日期
-                    for row in json_data['rows']:
-                        if target_date in row and isinstance(row[target_date], (int, float)):
-                            return {
-                                'success': True,
-                                'data': json_data,
-                                'source': f'force_api_range_{start_date}_{end_date}',
-                                'target_date': target_date
-                            }
-            except json.JSONDecodeError:
-                pass
+        json_data = get_session_pool().fetch_water_yield(start_date, end_date, meter_ids=METER_IDS)
+        
+        if _find_target_date(json_data, target_date):
+            return {
+                'success': True,
+                'data': json_data,
+                'source': f'force_api_range_{start_date}_{end_date}',
+                'target_date': target_date
+            }
         
         return None
         
@@ -9,7 +9,7 @@ import os
 import sys
 from datetime import datetime, timedelta
 import logging
-from integrated_excel_updater import update_excel_with_real_data
+from fetch_planner import run_incremental_update, PLANNER_CONFIG
 
 # 配置日志
 logging.basicConfig(
@@ -42,14 +42,16 @@ def main():
         
         logging.info("✅ 环境变量检查通过")
         
-        # 执行数据更新
-        logging.info("🎯 开始执行水务数据更新...")
-        result = update_excel_with_real_data(target_date)
+        # 执行数据更新（只获取最近几天中Excel里缺失的单元格，重试时已写入的数据不会重复获取）
+        logging.info(f"🎯 开始执行水务数据增量更新（截至 {target_date} 的最近 {PLANNER_CONFIG['lookback_days']} 天）...")
+        result = run_incremental_update(end_date=target_date)
         
         if result['success']:
             logging.info(f"✅ 数据更新成功!")
-            logging.info(f"📊 更新了 {result.get('updated_meters', 0)} 个水表的数据")
+            logging.info(f"📊 更新了 {result.get('updated_meters', 0)} 个单元格，接口请求 {result.get('planned_calls', 0)} 次")
             logging.info(f"📝 消息: {result.get('message', '')}")
+            if result.get('timings'):
+                logging.info(f"⏱️ 各步骤耗时(秒): {result['timings']}")
             
             # 检查Excel文件是否存在
             excel_file = 'excel_exports/石滩供水服务部每日总供水情况.xlsx'
@@ -1,10 +1,45 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from specific_excel_writer import SpecificExcelWriter
-from force_real_data_web import force_get_real_data_for_web
 from datetime import datetime, timedelta
 
+def extract_meter_values(rows, target_date_str, log=print):
+    """
+    从接口返回的 rows 中提取某一天各水表的数值
+    
+    Args:
+        rows: 接口数据中的 rows 列表
+        target_date_str: 日期字符串 'YYYY-MM-DD'
+        log: 日志输出函数
+    
+    Returns:
+        dict: {水表系统名称: 数值或None}
+    """
+    extracted_data = {}
+    
+    for meter_info in rows:
+        if isinstance(meter_info, dict):
+            meter_name = meter_info.get('Name', '')
+            # 查找目标日期的数值
+            value = meter_info.get(target_date_str)
+            
+            log(f"[DEBUG] 水表: {meter_name}, 原始值: {value}, 类型: {type(value)}")
+            
+            if meter_name:
+                # 转换为数值，如果无法转换则为None
+                try:
+                    if value is not None and str(value).strip() != '':
+                        extracted_data[meter_name] = float(value)
+                        log(f"  [OK] {meter_name}: {extracted_data[meter_name]}")
+                    else:
+                        extracted_data[meter_name] = None
+                        log(f"  [EMPTY] {meter_name}: 无数据")
+                except (ValueError, TypeError) as e:
+                    extracted_data[meter_name] = None
+                    log(f"  [ERROR] {meter_name}: 转换失败 - {e}")
+    
+    return extracted_data
+
 def update_excel_with_real_data(target_date):
     """
     获取指定日期的真实水表数据并写入Excel文件
@@ -29,83 +64,12 @@ def update_excel_with_real_data(target_date):
     log(f"目标日期: {target_date}")
     
     try:
-        # 1. 获取真实数据
-        log("1. 获取真实水表数据...")
-        data_result = force_get_real_data_for_web(target_date)
-        
-        if not data_result or not data_result.get('success'):
-            log("获取数据失败")
-            log_file.close()
-            return {
-                'success': False,
-                'error': '无法获取水表数据',
-                'details': data_result
-            }
-        
-        water_data = data_result.get('data', {})
-        rows = water_data.get('rows', [])
-        log(f"[INFO] 获取到 {len(rows)} 个水表的数据")
-        
-        # 2. 提取水表数据
-        log("2. 提取水表数据...")
-        extracted_data = {}
-        
-        # 数据格式：{'total': 8, 'rows': [...], 'footer': []}
-        target_date_str = target_date if isinstance(target_date, str) else target_date.strftime('%Y-%m-%d')
-        log(f"[INFO] 目标日期字符串: {target_date_str}")
-        
-        for meter_info in rows:
-            if isinstance(meter_info, dict):
-                meter_name = meter_info.get('Name', '')
-                # 查找目标日期的数值
-                value = meter_info.get(target_date_str)
-                
-                log(f"[DEBUG] 水表: {meter_name}, 原始值: {value}, 类型: {type(value)}")
-                
-                if meter_name:
-                    # 转换为数值，如果无法转换则为None
-                    try:
-                        if value is not None and str(value).strip() != '':
-                            extracted_data[meter_name] = float(value)
-                            log(f"  [OK] {meter_name}: {extracted_data[meter_name]}")
-                        else:
-                            extracted_data[meter_name] = None
-                            log(f"  [EMPTY] {meter_name}: 无数据")
-                    except (ValueError, TypeError) as e:
-                        extracted_data[meter_name] = None
-                        log(f"  [ERROR] {meter_name}: 转换失败 - {e}")
-        
-        if not extracted_data:
-            log("未找到有效的水表数据")
-            log_file.close()
-            return {
-                'success': False,
-                'error': '未找到有效的水表数据',
-                'available_dates': list(water_data.keys())
-            }
-        
-        # 3. 写入Excel文件
-        log("3. 写入Excel文件...")
-        writer = SpecificExcelWriter()
-        success = writer.write_water_data(target_date, extracted_data)
+        # 获取 → 提取 → 写入 → 重算派生列 → 保存（工作簿只加载和保存一次）
+        from daily_update_pipeline import DailyUpdatePipeline
+        result = DailyUpdatePipeline(log=log).run(target_date)
+        log_file.close()
+        return result
         
-        if success:
-            log("[SUCCESS] Excel文件更新成功！")
-            log_file.close()
-            return {
-                'success': True,
-                'message': f'成功更新 {len(extracted_data)} 个水表的数据到Excel文件',
-                'updated_meters': len(extracted_data),
-                'target_date': target_date
-            }
-        else:
-            log("[ERROR] Excel文件更新失败")
-            log_file.close()
-            return {
-                'success': False,
-                'error': 'Excel文件更新失败'
-            }
-            
     except Exception as e:
         log(f"更新Excel时出错: {e}")
         import traceback
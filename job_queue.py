@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务队列
+取数、写入Excel、添加统计表和GitHub同步原来在请求里直接执行（或临时开线程），会占用 gunicorn
+进程直到 180 秒超时。这里把它们放进任务队列，请求只负责提交任务并立即返回任务ID：
+- 任务登记在 task_registry 中，所有进程共享；每个进程启动固定数量的工作线程从中取任务
+- 优先级：交互操作（interactive）先于普通任务（normal），补数（backfill）最后
+- 任务函数抛出异常时按 retry_backoff × 2^(n-1) 秒延后重试，最多 max_attempts 次；
+  返回 {'success': False, ...} 表示业务失败，不重试
+- 取消：排队中的任务直接取消；执行中的任务在下次报告进度时停止
+- 步骤进度：登录、报表页面、接口调用、写入、保存等底层步骤通过 task_stages.report_stage 报告，
+  任务线程执行任务时为该线程设置回调（task_stages.stage_callback），把步骤变化写入任务进度
+用法：
+    register_job('auto_update', func, priority='interactive')   # func(params, report) -> 结果
+    task, created = enqueue('auto_update', {'date': '2025-10-01'})
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+
+from task_registry import get_task_registry, QueueFullError
+from task_stages import stage_callback
+
+# 队列配置
+JOB_QUEUE_CONFIG = {
+    'workers': 2,               # 每个进程的工作线程数
+    'poll_interval': 1.0,       # 空闲时检查新任务的间隔（秒）
+    'retry_backoff': 5,         # 第一次重试前等待的秒数，之后每次翻倍
+    'heartbeat_interval': 30    # 执行中任务的心跳间隔（秒）
+}
+
+PRIORITIES = {
+    'interactive': 0,
+    'normal': 5,
+    'backfill': 10
+}
+
+# 底层步骤 -> (进度, 说明)；进度只增不减
+STAGES = {
+    'login': (10, '正在登录水务系统...'),
+    'report_page': (20, '正在打开报表页面...'),
+    'api_call': (35, '正在调用数据接口...'),
+    'parse': (45, '正在解析接口数据...'),
+    'map': (50, '正在提取水表数据...'),
+    'lock': (55, '正在等待写入Excel...'),
+    'load': (60, '正在加载Excel文件...'),
+    'write': (70, '正在写入数据...'),
+    'recompute': (80, '正在重算派生列...'),
+    'save': (85, '正在保存Excel文件...'),
+    'rollups': (95, '正在更新汇总表...'),
+    'sync': (95, '正在同步到GitHub...'),
+}
+
+class JobCancelled(Exception):
+    """任务已被取消（由 report() 抛出）"""
+
+
+class JobSpec:
+    """一种任务的执行函数和默认设置"""
+
+    def __init__(self, kind, func, priority='normal', max_attempts=1):
+        if priority not in PRIORITIES:
+            raise ValueError(f'未知的优先级: {priority}')
+        self.kind = kind
+        self.func = func
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+
+_specs = {}
+
+
+def register_job(kind, func, priority='normal', max_attempts=1):
+    """
+    登记一种任务
+
+    Args:
+        kind: 任务类型
+        func: func(params, report) -> 结果（可JSON序列化）；report(progress, message, stage=None) 报告进度
+        priority: 'interactive'、'normal' 或 'backfill'
+        max_attempts: 抛出异常时最多执行的次数
+    """
+    _specs[kind] = JobSpec(kind, func, priority, max_attempts)
+
+
+def enqueue(kind, params=None, dedup_key=None, priority=None):
+    """
+    提交任务；已有相同任务（类型和参数相同）排队或执行中时返回已有任务
+
+    Args:
+        kind: 已登记的任务类型
+        params: 任务参数
+        dedup_key: 去重键，默认由类型和参数生成
+        priority: 覆盖登记时的优先级
+
+    Returns:
+        tuple: (任务 dict, 是否新建)
+
+    Raises:
+        QueueFullError: 排队中的任务已达上限
+    """
+    spec = _specs.get(kind)
+    if spec is None:
+        raise ValueError(f'未登记的任务类型: {kind}')
+    if dedup_key is None:
+        dedup_key = f'{kind}:{json.dumps(params, ensure_ascii=False, sort_keys=True)}'
+
+    task, created = get_task_registry().submit(
+        kind, dedup_key, params, PRIORITIES[priority or spec.priority], spec.max_attempts)
+
+    queue = get_job_queue()
+    if created:
+        queue.wake()
+    return task, created
+
+
+def _report_task_stage(context, stage, message=None):
+    """把步骤变化写入任务进度（未定义的步骤忽略，出错时只打印警告）"""
+    if stage not in STAGES and message is None:
+        return
+    progress, default_message = STAGES.get(stage, (context['progress'], stage))
+    context['progress'] = max(context['progress'], progress)
+    try:
+        get_task_registry().update(context['task_id'], context['progress'], message or default_message, stage)
+    except Exception as e:
+        print(f"[WARNING] 更新任务进度失败: {e}")
+
+
+def cancel(task_id):
+    """取消任务，返回取消后的任务（不存在时为 None）"""
+    return get_task_registry().cancel(task_id)
+
+
+class JobQueue:
+    """一个进程内的工作线程池"""
+
+    def __init__(self, workers=None):
+        self.workers = workers or JOB_QUEUE_CONFIG['workers']
+        self.registry = get_task_registry()
+        self._wake = threading.Event()
+        self._running = set()       # 本进程执行中的任务ID
+        self._running_lock = threading.Lock()
+        self.pid = None
+
+    def start(self):
+        """启动工作线程和心跳线程（gunicorn --preload 时需要在每个工作进程中启动）"""
+        self.pid = os.getpid()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker_loop, name=f'job-worker-{i}', daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True).start()
+        print(f"[INFO] 任务队列已启动：{self.workers} 个工作线程（进程 {self.pid}）")
+
+    def wake(self):
+        self._wake.set()
+
+    def _worker_loop(self):
+        while True:
+            try:
+                task = self.registry.claim(_specs)
+            except Exception as e:
+                print(f"[WARNING] 读取任务队列失败: {e}")
+                task = None
+
+            if task is None:
+                self._wake.wait(JOB_QUEUE_CONFIG['poll_interval'])
+                self._wake.clear()
+                continue
+
+            with self._running_lock:
+                self._running.add(task['id'])
+            try:
+                self._run(task)
+            finally:
+                with self._running_lock:
+                    self._running.discard(task['id'])
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(JOB_QUEUE_CONFIG['heartbeat_interval'])
+            with self._running_lock:
+                task_ids = list(self._running)
+            try:
+                self.registry.heartbeat(task_ids)
+            except Exception as e:
+                print(f"[WARNING] 更新任务心跳失败: {e}")
+
+    def _run(self, task):
+        registry = self.registry
+        task_id = task['id']
+        spec = _specs[task['kind']]
+
+        context = {'task_id': task_id, 'progress': task['progress'] or 0}
+
+        def report(progress=None, message=None, stage=None):
+            if registry.is_cancel_requested(task_id):
+                raise JobCancelled()
+            if progress is not None:
+                context['progress'] = progress
+            registry.update(task_id, progress, message, stage)
+
+        print(f"[INFO] 开始执行任务 {task['kind']} ({task_id[:8]})，第 {task['attempts']} 次")
+        try:
+            if registry.is_cancel_requested(task_id):
+                raise JobCancelled()
+            with stage_callback(lambda stage, message=None: _report_task_stage(context, stage, message)):
+                result = spec.func(task['params'], report)
+        except JobCancelled:
+            registry.mark_cancelled(task_id)
+            print(f"[INFO] 任务已取消 {task['kind']} ({task_id[:8]})")
+        except Exception as e:
+            traceback.print_exc()
+            if task['attempts'] < task['max_attempts']:
+                delay = JOB_QUEUE_CONFIG['retry_backoff'] * 2 ** (task['attempts'] - 1)
+                registry.retry_later(task_id, delay, e)
+                print(f"[WARNING] 任务 {task['kind']} 出错，{delay}秒后重试: {e}")
+            else:
+                registry.fail(task_id, str(e), f'❌ 任务失败: {str(e)}')
+        else:
+            if isinstance(result, dict) and result.get('success') is False:
+                registry.fail(task_id, result.get('error') or result.get('message') or '任务失败',
+                              result.get('message'), result)
+            else:
+                current = registry.get(task_id) or {}
+                registry.finish(task_id, result, current.get('message') or '任务完成')
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """获取当前进程的任务队列（首次使用或 fork 后的新进程中启动工作线程）"""
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None or _default_queue.pid != os.getpid():
+            _default_queue = JobQueue()
+            _default_queue.start()
+        return _default_queue
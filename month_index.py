@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+月份索引
+石滩区分区计量.xlsx 的"石滩区"工作表按月追加统计表，每个统计表以月份标题开头
+（文本 "2025年12月"，或早期的Excel日期序列号，如 45689 = 2025-02-01）。
+这里把 月份 -> 标题行 建成索引，保存在工作簿旁的 JSON 文件中，并记录生成时工作簿的版本 (修改时间, 文件大小)：
+- /get_info 和添加统计表时的重复检查直接查索引，不再逐个单元格扫描
+- 工作簿被其他程序修改（版本不一致）时整体重建（只读模式加载）
+- 添加统计表并保存后，把新月份加入索引并更新版本
+"""
+
+import json
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+
+import openpyxl
+
+# 月份索引配置
+MONTH_INDEX_CONFIG = {
+    'suffix': '.months.json',       # 索引文件 = 工作簿路径 + 后缀
+    'sheet_name': '石滩区',
+    'serial_range': (40000, 50000)  # 视为日期序列号的数值范围（2009-2037年）
+}
+
+MONTH_TITLE_PATTERN = re.compile(r'(\d{4})年(\d{1,2})月')
+
+_lock = threading.Lock()
+_memory = {}    # 工作簿绝对路径 -> MonthRowIndex
+
+
+def parse_month_cell(value):
+    """
+    识别月份标题单元格
+
+    Returns:
+        tuple: (年, 月)；不是月份标题时返回 None
+    """
+    if isinstance(value, str):
+        match = MONTH_TITLE_PATTERN.search(value)
+        if match:
+            return int(match.group(1)), int(match.group(2))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        low, high = MONTH_INDEX_CONFIG['serial_range']
+        if low <= value <= high:
+            # 只取每月1号的日期作为月份标题
+            actual_date = datetime(1899, 12, 30) + timedelta(days=int(value))
+            if actual_date.day == 1:
+                return actual_date.year, actual_date.month
+    return None
+
+
+def month_title(year, month):
+    return f"{year}年{month}月"
+
+
+def index_path(excel_path):
+    """索引文件路径"""
+    return os.path.abspath(excel_path) + MONTH_INDEX_CONFIG['suffix']
+
+
+def file_version(path):
+    """工作簿版本 [修改时间(ns), 文件大小]"""
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class MonthRowIndex:
+    """一个工作簿版本的 月份 -> 标题行 索引"""
+
+    def __init__(self, version, max_row, months=None):
+        self.version = list(version)
+        self.max_row = max_row
+        # {'YYYY-MM': 标题所在行}，同一月份出现多次时取第一次
+        self.months = months or {}
+
+    @staticmethod
+    def _key(year, month):
+        return f'{year}-{month:02d}'
+
+    @classmethod
+    def build(cls, sheet, version):
+        """扫描工作表一次建立索引"""
+        index = cls(version, sheet.max_row or 0)
+        for row_num, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+            for value in row:
+                if value is None:
+                    continue
+                parsed = parse_month_cell(value)
+                if parsed:
+                    index.months.setdefault(cls._key(*parsed), row_num)
+        return index
+
+    def find(self, year, month):
+        """某月统计表的标题行；没有时返回 None"""
+        return self.months.get(self._key(year, month))
+
+    def latest(self):
+        """
+        最新的月份
+
+        Returns:
+            tuple: (年, 月, 标题行)；没有任何月份时返回 None
+        """
+        if not self.months:
+            return None
+        key = max(self.months)
+        year, month = (int(part) for part in key.split('-'))
+        return year, month, self.months[key]
+
+    def add(self, year, month, row, max_row):
+        """记录新添加的统计表"""
+        self.months.setdefault(self._key(year, month), row)
+        self.max_row = max(self.max_row, max_row)
+
+    def to_dict(self):
+        return {'version': self.version, 'max_row': self.max_row, 'months': self.months}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['version'], data['max_row'], data['months'])
+
+
+def _load(excel_path):
+    try:
+        with open(index_path(excel_path), 'r', encoding='utf-8') as f:
+            return MonthRowIndex.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save(excel_path, index):
+    path = index_path(excel_path)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        print(f"[WARNING] 保存月份索引失败: {e}")
+        return False
+
+
+def get_month_index(excel_path, sheet=None):
+    """
+    获取工作簿当前版本的月份索引
+
+    优先使用内存中的索引，其次读取索引文件；版本不一致时整体重建并保存。
+
+    Args:
+        excel_path: 工作簿路径
+        sheet: 调用方已打开的"石滩区"工作表（需要重建时直接使用，不再加载工作簿）
+
+    Raises:
+        KeyError: 工作簿中没有"石滩区"工作表
+    """
+    path = os.path.abspath(excel_path)
+    version = file_version(path)
+
+    index = _memory.get(path)
+    if index is not None and index.version == version:
+        return index
+
+    with _lock:
+        index = _memory.get(path)
+        if index is None or index.version != version:
+            index = _load(path)
+        if index is None or index.version != version:
+            if sheet is not None:
+                index = MonthRowIndex.build(sheet, version)
+            else:
+                wb = openpyxl.load_workbook(path, read_only=True)
+                try:
+                    index = MonthRowIndex.build(wb[MONTH_INDEX_CONFIG['sheet_name']], version)
+                finally:
+                    wb.close()
+            _save(path, index)
+            print(f"[INFO] 已重建月份索引: {os.path.basename(index_path(path))}")
+        _memory[path] = index
+        return index
+
+
+def update_after_append(excel_path, appended, max_row, loaded_version):
+    """
+    添加统计表并保存后更新索引
+
+    Args:
+        excel_path: 工作簿路径
+        appended: 新统计表 [(年, 月, 月份标题所在行)]
+        max_row: 保存后工作表的最大行
+        loaded_version: 加载工作簿时的文件版本
+
+    Returns:
+        bool: 是否完成更新；索引不存在或已过期时返回 False（下次读取时整体重建）
+    """
+    path = os.path.abspath(excel_path)
+    with _lock:
+        index = _memory.get(path) or _load(path)
+        if index is None or index.version != list(loaded_version):
+            return False
+
+        for year, month, row in appended:
+            index.add(year, month, row, max_row)
+        index.version = file_version(path)
+        _memory[path] = index
+        return _save(path, index)
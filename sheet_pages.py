@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作表分页
+在线查看页面按需请求行窗口，不再一次返回整张工作表：
+- 工作表的解析结果按 (工作表, 文件版本) 缓存（workbook_cache），切换工作表只解析该工作表
+- 只转换窗口内的单元格（空值转为 ''，Excel日期序列号转为 'YYYY年M月D日'）
+- 合并单元格只返回与窗口相交的部分，并裁剪到窗口范围内
+"""
+
+from datetime import datetime, timedelta
+
+# 分页配置
+PAGE_CONFIG = {
+    'default_limit': 100,           # 默认每页行数
+    'max_limit': 1000,              # 每页最多行数
+    'serial_range': (40000, 50000)  # 视为日期序列号的整数范围（2009-2037年）
+}
+
+
+def display_value(value):
+    """把单元格值转换为页面显示的值"""
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)):
+        low, high = PAGE_CONFIG['serial_range']
+        if isinstance(value, int) and low <= value <= high:
+            actual_date = datetime(1899, 12, 30) + timedelta(days=value)
+            return f"{actual_date.year}年{actual_date.month}月{actual_date.day}日"
+        return value
+    return str(value)
+
+
+def clip_merged_ranges(merged_ranges, first_row, last_row):
+    """
+    与行窗口相交的合并单元格，裁剪到窗口内
+
+    Args:
+        merged_ranges: [(min_row, min_col, max_row, max_col)]，1开始
+        first_row, last_row: 窗口的第一行和最后一行（1开始，包含）
+
+    Returns:
+        list: [{'start_row', 'start_col', 'end_row', 'end_col'}]，0开始的整表行列号
+    """
+    clipped = []
+    for min_row, min_col, max_row, max_col in merged_ranges:
+        if max_row < first_row or min_row > last_row:
+            continue
+        clipped.append({
+            'start_row': max(min_row, first_row) - 1,
+            'start_col': min_col - 1,
+            'end_row': min(max_row, last_row) - 1,
+            'end_col': max_col - 1
+        })
+    return clipped
+
+
+def get_sheet_page(parsed_sheet, offset=0, limit=None):
+    """
+    工作表的一个行窗口
+
+    Args:
+        parsed_sheet: workbook_cache.ParsedSheet
+        offset: 起始行（0开始）
+        limit: 行数，默认 default_limit，最多 max_limit
+
+    Returns:
+        dict: {'data', 'merged_cells', 'offset', 'limit', 'total_rows', 'total_cols', 'has_more'}
+    """
+    rows = parsed_sheet.rows
+    limit = min(max(limit or PAGE_CONFIG['default_limit'], 1), PAGE_CONFIG['max_limit'])
+    offset = min(max(offset, 0), len(rows))
+    window = rows[offset:offset + limit]
+
+    return {
+        'data': [[display_value(value) for value in row] for row in window],
+        'merged_cells': clip_merged_ranges(parsed_sheet.merged_ranges, offset + 1, offset + len(window))
+                        if window else [],
+        'offset': offset,
+        'limit': limit,
+        'total_rows': len(rows),
+        'total_cols': max((len(row) for row in rows), default=0),
+        'has_more': offset + len(window) < len(rows)
+    }
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+在线查看的分页查询
+/api/get_excel_data 原来把整张表转换一遍，再按年份、关键字过滤，最后才切出一页。这里按需逐行处理：
+- 年份和日期范围通过日期索引直接取行范围，不再逐行比较日期字符串
+- 没有其他筛选条件时总行数直接可知，只转换当前页的行
+- 有筛选条件时逐行判断，可以在当前页取满后停止（count=False）
+- 支持按列排序（按日期排序时直接沿日期索引顺序/倒序读取）和数值范围筛选
+"""
+
+import heapq
+import json
+import re
+from datetime import datetime
+
+from date_index import get_sheet_date_index, parse_date_cell
+
+# 视为“无有效数据”的单元格值（与在线查看页面的判断一致）
+EMPTY_CELL_VALUES = (None, '', '-', 0, '0')
+
+# 支持的 AG-Grid 数值筛选类型
+AGGRID_NUMBER_FILTERS = ('equals', 'greaterThan', 'greaterThanOrEqual', 'lessThan', 'lessThanOrEqual', 'inRange')
+
+
+class QueryError(ValueError):
+    """查询参数错误"""
+
+
+def display_cell(cell):
+    """单元格转换为返回给页面的值，空单元格显示为空字符串"""
+    return cell if cell is not None else ''
+
+
+def resolve_column(header, column):
+    """
+    把列参数（列下标或表头名称）转换为列下标
+
+    表头中有重复的列名，按名称查找时取第一次出现的列。
+    """
+    if isinstance(column, int) or (isinstance(column, str) and column.strip().isdigit()):
+        col_idx = int(column)
+        if 0 <= col_idx < len(header):
+            return col_idx
+        raise QueryError(f'列不存在: {column}')
+
+    name = str(column).replace('\n', '').strip()
+    for col_idx, col_name in enumerate(header):
+        if col_name is not None and str(col_name).replace('\n', '').strip() == name:
+            return col_idx
+    raise QueryError(f'列不存在: {column}')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _to_number(value, column):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise QueryError(f'筛选值不是数字: {column}={value}')
+
+
+def parse_filters(header, filters):
+    """
+    解析数值范围筛选
+
+    Args:
+        header: 表头
+        filters: {列下标或列名: 条件}（可以是JSON字符串），条件支持两种格式：
+            {'min': 下限, 'max': 上限}（含边界，任一可省略）
+            AG-Grid 数值筛选模型 {'type': 'inRange', 'filter': a, 'filterTo': b} 等
+
+    Returns:
+        list: [(列下标, 下限或None, 上限或None, 是否包含下限, 是否包含上限)]
+    """
+    if not filters:
+        return []
+    if isinstance(filters, str):
+        try:
+            filters = json.loads(filters)
+        except ValueError:
+            raise QueryError('filters 不是有效的JSON')
+    if not isinstance(filters, dict):
+        raise QueryError('filters 必须是 {列: 条件} 格式')
+
+    parsed = []
+    for column, condition in filters.items():
+        col_idx = resolve_column(header, column)
+        if not isinstance(condition, dict):
+            raise QueryError(f'筛选条件格式错误: {column}')
+
+        if 'type' in condition:
+            filter_type = condition['type']
+            if filter_type not in AGGRID_NUMBER_FILTERS:
+                raise QueryError(f'不支持的筛选类型: {filter_type}')
+            value = _to_number(condition.get('filter'), column)
+            if filter_type == 'equals':
+                parsed.append((col_idx, value, value, True, True))
+            elif filter_type == 'greaterThan':
+                parsed.append((col_idx, value, None, False, True))
+            elif filter_type == 'greaterThanOrEqual':
+                parsed.append((col_idx, value, None, True, True))
+            elif filter_type == 'lessThan':
+                parsed.append((col_idx, None, value, True, False))
+            elif filter_type == 'lessThanOrEqual':
+                parsed.append((col_idx, None, value, True, True))
+            else:
+                parsed.append((col_idx, value, _to_number(condition.get('filterTo'), column), True, True))
+        else:
+            low = condition.get('min')
+            high = condition.get('max')
+            parsed.append((col_idx,
+                           _to_number(low, column) if low not in (None, '') else None,
+                           _to_number(high, column) if high not in (None, '') else None,
+                           True, True))
+    return parsed
+
+
+def _row_has_data(row):
+    return any(cell not in EMPTY_CELL_VALUES for cell in row[1:])
+
+
+def _build_predicate(search_text, has_data, range_filters):
+    """组合筛选条件；没有条件时返回 None"""
+    checks = []
+
+    if range_filters:
+        def match_ranges(row):
+            for col_idx, low, high, low_inclusive, high_inclusive in range_filters:
+                value = row[col_idx] if col_idx < len(row) else None
+                if not _is_number(value):
+                    return False
+                if low is not None and (value < low or (value == low and not low_inclusive)):
+                    return False
+                if high is not None and (value > high or (value == high and not high_inclusive)):
+                    return False
+            return True
+        checks.append(match_ranges)
+
+    if has_data:
+        checks.append(_row_has_data)
+
+    if search_text:
+        search_lower = search_text.lower()
+
+        def match_search(row):
+            return any(search_lower in str(display_cell(cell)).lower() for cell in row)
+        checks.append(match_search)
+
+    if not checks:
+        return None
+    return lambda row: all(check(row) for check in checks)
+
+
+def _parse_day(value, name):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.strip()[:10], '%Y-%m-%d')
+    except ValueError:
+        raise QueryError(f'{name} 日期格式应为 YYYY-MM-DD')
+
+
+def _candidate_positions(parsed_sheet, year_filter, start_date, end_date, by_date):
+    """
+    按年份和日期范围确定候选数据行（数据行下标，按日期升序）
+
+    年份为4位数字或指定了日期范围时通过日期索引取范围；
+    其他年份参数保持原来的“日期文本包含该字符串”的判断。
+    """
+    data_rows = parsed_sheet.data_rows
+    date_index = get_sheet_date_index(parsed_sheet)
+
+    start = _parse_day(start_date, 'start_date')
+    end = _parse_day(end_date, 'end_date')
+
+    if year_filter and year_filter != 'all':
+        if re.fullmatch(r'\d{4}', year_filter):
+            year_start = datetime(int(year_filter), 1, 1)
+            year_end = datetime(int(year_filter), 12, 31)
+            start = max(start, year_start) if start else year_start
+            end = min(end, year_end) if end else year_end
+        else:
+            positions = [i for i, row in enumerate(data_rows)
+                         if row and row[0] and year_filter in str(row[0])]
+            if start or end:
+                positions = [i for i in positions if _in_range(parse_date_cell(data_rows[i][0]), start, end)]
+            return positions
+
+    if start or end:
+        if date_index.dates:
+            return date_index.range(start or date_index.dates[0], end or date_index.dates[-1])
+        return []
+
+    if by_date:
+        # 按日期排序时只取有日期的行
+        return list(date_index.refs)
+    return range(len(data_rows))
+
+
+def _in_range(date, start, end):
+    if date is None:
+        return False
+    if start and date < start:
+        return False
+    if end and date > end:
+        return False
+    return True
+
+
+def _sort_key(col_idx):
+    """数值列的排序键：数值在前，其次文本，空值最后"""
+    def key(row):
+        value = row[col_idx] if col_idx < len(row) else None
+        if _is_number(value):
+            return (0, value, '')
+        if value in (None, ''):
+            return (2, 0, '')
+        return (1, 0, str(value))
+    return key
+
+
+def _page_result(header, page_rows, total, total_exact, end_idx):
+    return {
+        'header': header,
+        'rows': [[display_cell(cell) for cell in row] for row in page_rows],
+        'total_rows': total,
+        'total_exact': total_exact,
+        'has_more': total > end_idx
+    }
+
+
+def query_rows(parsed_sheet, year='all', search='', start_date=None, end_date=None, has_data=False,
+               filters=None, sort=None, order='asc', page=1, page_size=200, count=True):
+    """
+    分页查询数据行
+
+    Args:
+        parsed_sheet: workbook_cache.ParsedSheet
+        year: 年份；'all' 表示全部
+        search: 关键字（在所有单元格文本中查找，不区分大小写）
+        start_date / end_date: 日期范围 'YYYY-MM-DD'（含首尾）
+        has_data: 只返回除日期外至少有一个有效数值的行
+        filters: 数值范围筛选，见 parse_filters
+        sort: 排序列（列下标或列名）；None 保持表格顺序
+        order: 'asc' 或 'desc'
+        page / page_size: 页码（从1开始）和每页行数
+        count: 是否统计符合条件的总行数；False 时取满当前页即停止
+
+    Returns:
+        dict: {'header', 'rows', 'total_rows', 'total_exact', 'has_more'}
+              total_exact 为 False 时 total_rows 只是已扫描到的行数
+    """
+    header = [display_cell(cell) for cell in parsed_sheet.header]
+    data_rows = parsed_sheet.data_rows
+
+    page = max(page, 1)
+    page_size = max(page_size, 1)
+    if order not in ('asc', 'desc'):
+        raise QueryError("order 只能是 'asc' 或 'desc'")
+    descending = order == 'desc'
+
+    sort_col = resolve_column(parsed_sheet.header, sort) if sort not in (None, '') else None
+    predicate = _build_predicate(search, has_data, parse_filters(parsed_sheet.header, filters))
+    positions = _candidate_positions(parsed_sheet, year, start_date, end_date, by_date=sort_col == 0)
+
+    start_idx = (page - 1) * page_size
+    end_idx = start_idx + page_size
+
+    if sort_col not in (None, 0):
+        # 按数值列排序：先筛选，再只取到当前页为止的前N行（部分排序）
+        matched = [data_rows[i] for i in positions if predicate is None or predicate(data_rows[i])]
+        key = _sort_key(sort_col)
+        if descending:
+            # 倒序时数值从大到小，空值仍排在最后
+            def desc_key(row, key=key):
+                group, number, text = key(row)
+                return (group, -number, text)
+            top_rows = heapq.nsmallest(end_idx, matched, key=desc_key)
+        else:
+            top_rows = heapq.nsmallest(end_idx, matched, key=key)
+        return _page_result(header, top_rows[start_idx:end_idx], len(matched), True, end_idx)
+
+    # 保持表格顺序或按日期排序：候选行已按日期升序，按日期倒序时反向读取
+    if sort_col == 0 and descending:
+        positions = positions[::-1]
+
+    if predicate is None:
+        # 没有筛选条件：总数直接可知，只转换当前页
+        page_rows = [data_rows[i] for i in positions[start_idx:end_idx]]
+        return _page_result(header, page_rows, len(positions), True, end_idx)
+
+    page_rows = []
+    matched_count = 0
+    stopped_early = False
+    for i in positions:
+        row = data_rows[i]
+        if not predicate(row):
+            continue
+        if start_idx <= matched_count < end_idx:
+            page_rows.append(row)
+        matched_count += 1
+        if matched_count > end_idx and not count:
+            # 已确认还有下一页，不再继续扫描
+            stopped_early = True
+            break
+
+    return _page_result(header, page_rows, matched_count, not stopped_early, end_idx)
@@ -4,38 +4,33 @@
 智能数据提供器 - 当API不可用时使用现有真实数据
 """
 
-import json
-import os
-import glob
 from datetime import datetime, timedelta
 
 def get_latest_data_file():
-    """获取最新的数据文件"""
-    data_files = (glob.glob("*COMPLETE_8_METERS*.json") + 
-                 glob.glob("WEB_COMPLETE*.json"))
+    """获取读数存储的数据库文件（原先为最新的快照JSON文件）"""
+    from water_store import get_water_store
     
-    if data_files:
-        latest_file = max(data_files, key=lambda x: os.path.getmtime(x))
-        return latest_file
+    store = get_water_store()
+    if store.latest_fetch():
+        return store.db_path
     return None
 
 def load_real_data():
-    """加载真实的历史数据"""
-    latest_file = get_latest_data_file()
-    if not latest_file:
-        return None
+    """加载最近一次获取的真实数据（来自读数存储）"""
+    from water_store import get_water_store
     
     try:
-        with open(latest_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = get_water_store().latest_snapshot()
+        if not data:
+            return None
         
-        print(f"📂 加载数据文件: {latest_file}")
+        print(f"📂 加载读数存储: {get_water_store().db_path}")
         print(f"📅 数据时间戳: {data.get('timestamp', 'Unknown')}")
         print(f"📊 包含水表数量: {data.get('meter_count', 0)}")
         
         return data
     except Exception as e:
-        print(f"❌ 加载数据文件失败: {e}")
+        print(f"❌ 加载读数存储失败: {e}")
         return None
 
 def get_available_dates(data):
@@ -55,15 +50,18 @@ def get_real_data_for_date(target_date):
     """获取指定日期的真实数据，如果没有则返回None"""
     print(f"🎯 智能数据提供器：获取 {target_date} 的数据")
     
-    # 加载真实数据
-    real_data = load_real_data()
-    if not real_data:
-        print("❌ 无法加载任何真实数据文件")
+    from water_store import get_water_store
+    
+    # 直接按日期查询读数存储
+    store = get_water_store()
+    if not store.latest_fetch():
+        print("❌ 无法加载任何真实数据")
         return None
+    real_data = {'meter_count': 8, 'data': store.query_range(target_date, target_date)}
     
     # 检查可用日期
     available_dates = get_available_dates(real_data)
-    print(f"📅 数据文件中可用的日期: {available_dates}")
+    print(f"📅 存储中该日期的数据: {available_dates}")
     
     if target_date in available_dates:
         print(f"✅ 找到 {target_date} 的真实数据！")
@@ -100,7 +98,7 @@ def get_real_data_for_date(target_date):
     
     else:
         print(f"⚠️ {target_date} 不在可用数据中")
-        print(f"💡 可用的最近日期: {available_dates[-3:] if len(available_dates) >= 3 else available_dates}")
+        print(f"💡 可用的最近日期: {store.available_dates()[-3:]}")
         
         # 返回空数据结构，表示该日期无真实数据
         return {
@@ -133,7 +131,7 @@ def show_available_data_summary():
     print("\n" + "="*60)
     print("📊 可用真实数据摘要")
     print("="*60)
-    print(f"📂 数据文件: {get_latest_data_file()}")
+    print(f"📂 数据存储: {get_latest_data_file()}")
     print(f"📅 数据时间范围: {available_dates[0]} ~ {available_dates[-1]}")
     print(f"📊 包含日期数量: {len(available_dates)}")
     print(f"🏭 水表数量: {real_data.get('meter_count', 0)}")
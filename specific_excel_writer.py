@@ -6,6 +6,12 @@ from datetime import datetime, timedelta
 import time
 import os
 
+import workbook_cache
+import supply_rollups
+from date_index import DateRowIndex
+from calculate_formulas_python import recalculate_dates
+from workbook_journal import atomic_save
+
 class SpecificExcelWriter:
     """专门用于写入石滩供水服务部每日总供水情况.xlsx的类"""
     
@@ -24,6 +30,11 @@ class SpecificExcelWriter:
             '2501200108': (16, '中山西路DN300流量计')
         }
         
+        # 当前打开的工作表及其日期索引 (sheet, DateRowIndex)
+        self._date_index = None
+        # 加载工作簿时的文件版本 (mtime_ns, size)，用于增量更新供水汇总表
+        self._loaded_version = None
+        
         print(f"初始化SpecificExcelWriter，目标文件：{self.excel_path}")
         print(f"水表映射关系：{len(self.meter_mapping)}个水表")
     
@@ -31,6 +42,8 @@ class SpecificExcelWriter:
         """带重试的工作簿加载"""
         for attempt in range(max_retries):
             try:
+                stat = os.stat(self.excel_path)
+                self._loaded_version = (stat.st_mtime_ns, stat.st_size)
                 wb = openpyxl.load_workbook(self.excel_path)
                 return wb
             except PermissionError:
@@ -44,10 +57,14 @@ class SpecificExcelWriter:
                 raise
     
     def save_workbook_with_retry(self, wb, max_retries=3):
-        """带重试的工作簿保存"""
+        """带重试的工作簿保存（先保存到临时文件再替换，保存失败时原文件保持完整）"""
         for attempt in range(max_retries):
             try:
-                wb.save(self.excel_path)
+                # 在Excel中打开时重新计算公式
+                wb.calculation.calcMode = 'auto'
+                wb.calculation.fullCalcOnLoad = True
+                atomic_save(wb, self.excel_path)
+                workbook_cache.invalidate(self.excel_path)
                 print(f"Excel文件保存成功：{self.excel_path}")
                 return True
             except PermissionError:
@@ -61,50 +78,42 @@ class SpecificExcelWriter:
                 print(f"保存Excel文件失败: {e}")
                 return False
     
+    def _write_pipeline(self):
+        """写入用的流水线（加载一次、写入、重算派生列、保存一次）"""
+        from daily_update_pipeline import DailyUpdatePipeline
+        return DailyUpdatePipeline(writer=self)
+    
+    def get_date_index(self, sheet):
+        """获取工作表的日期索引（同一个打开的工作表只建立一次）"""
+        if self._date_index is None or self._date_index[0] is not sheet:
+            self._date_index = (sheet, DateRowIndex.from_sheet(sheet, min_row=5))
+        return self._date_index[1]
+    
+    def recalculate_formulas(self, sheet, dates):
+        """在已打开的工作表中重新计算写入日期所在行的公式列（石滩/三江/沙庄/日供水/环比差值）"""
+        count = recalculate_dates(sheet, self.get_date_index(sheet), dates)
+        print(f"公式列已重新计算：{count}行")
+        return count
+    
+    def update_rollups(self, sheet, dates):
+        """保存后只重新统计写入日期所在的周/月/季度/抄表周期"""
+        if self._loaded_version is None:
+            return False
+        return supply_rollups.update_after_write(self.excel_path, sheet, self.get_date_index(sheet),
+                                                 dates, self._loaded_version)
+    
     def find_date_row(self, sheet, target_date):
-        """查找指定日期的行号"""
-        target_date_str = target_date if isinstance(target_date, str) else target_date.strftime('%Y-%m-%d')
-        
-        # 从第5行开始查找（前4行是标题）
-        for row in range(5, sheet.max_row + 1):
-            cell_value = sheet.cell(row, 1).value  # 第1列是日期列
-            
-            if cell_value:
-                if isinstance(cell_value, datetime):
-                    date_str = cell_value.strftime('%Y-%m-%d')
-                elif isinstance(cell_value, str):
-                    date_str = cell_value
-                else:
-                    continue
-                
-                if date_str == target_date_str:
-                    return row
-        
-        return None
+        """查找指定日期的行号（日期索引二分查找）"""
+        return self.get_date_index(sheet).find(target_date)
     
     def insert_new_date_row(self, sheet, target_date):
         """插入新的日期行（按时间顺序）"""
         target_date_obj = datetime.strptime(target_date, '%Y-%m-%d') if isinstance(target_date, str) else target_date
         target_date_str = target_date_obj.strftime('%Y-%m-%d')
         
-        # 找到插入位置
-        insert_row = None
-        for row in range(5, sheet.max_row + 1):
-            cell_value = sheet.cell(row, 1).value
-            if cell_value:
-                if isinstance(cell_value, datetime):
-                    existing_date = cell_value
-                elif isinstance(cell_value, str):
-                    try:
-                        existing_date = datetime.strptime(cell_value, '%Y-%m-%d')
-                    except:
-                        continue
-                else:
-                    continue
-                
-                if target_date_obj < existing_date:
-                    insert_row = row
-                    break
+        # 找到插入位置：第一个晚于目标日期的行
+        date_index = self.get_date_index(sheet)
+        insert_row = date_index.next_after(target_date_obj)
         
         if insert_row is None:
             # 插入到最后
@@ -112,6 +121,7 @@ class SpecificExcelWriter:
         
         # 插入新行
         sheet.insert_rows(insert_row)
+        date_index.insert(target_date_obj, insert_row)
         
         # 设置日期
         sheet.cell(insert_row, 1, target_date_str)
@@ -119,6 +129,42 @@ class SpecificExcelWriter:
         print(f"在第{insert_row}行插入新日期：{target_date_str}")
         return insert_row
     
+    def apply_water_data(self, sheet, target_date, water_data):
+        """
+        在已打开的工作表中写入一天的水表数据（不保存文件）
+        
+        Returns:
+            int: 写入的水表数量
+        """
+        # 查找目标日期的行
+        target_row = self.find_date_row(sheet, target_date)
+        
+        if target_row:
+            print(f"找到现有日期行：第{target_row}行，将更新数据")
+        else:
+            print(f"未找到日期行，将插入新行")
+            target_row = self.insert_new_date_row(sheet, target_date)
+        
+        # 写入水表数据
+        updated_count = 0
+        for system_name, value in water_data.items():
+            if system_name in self.meter_mapping:
+                col_num, excel_name = self.meter_mapping[system_name]
+                
+                # 写入数据
+                if value is not None:
+                    sheet.cell(target_row, col_num, value)
+                    print(f"  [OK] {excel_name}(第{col_num}列): {value}")
+                else:
+                    sheet.cell(target_row, col_num, None)  # 空白
+                    print(f"  [EMPTY] {excel_name}(第{col_num}列): 空白")
+                
+                updated_count += 1
+            else:
+                print(f"  [SKIP] 未找到映射：{system_name}")
+        
+        return updated_count
+    
     def write_water_data(self, target_date, water_data):
         """
         将水表数据写入Excel文件
@@ -137,43 +183,11 @@ class SpecificExcelWriter:
         print(f"水表数据：{len(water_data)}个水表")
         
         try:
-            # 加载工作簿
-            wb = self.load_workbook_with_retry()
-            sheet = wb.active
-            
-            # 查找目标日期的行
-            target_row = self.find_date_row(sheet, target_date)
-            
-            if target_row:
-                print(f"找到现有日期行：第{target_row}行，将更新数据")
-            else:
-                print(f"未找到日期行，将插入新行")
-                target_row = self.insert_new_date_row(sheet, target_date)
+            # 加载、写入、重算派生列、保存一次
+            result = self._write_pipeline().write({target_date: water_data})
             
-            # 写入水表数据
-            updated_count = 0
-            for system_name, value in water_data.items():
-                if system_name in self.meter_mapping:
-                    col_num, excel_name = self.meter_mapping[system_name]
-                    
-                    # 写入数据
-                    if value is not None:
-                        sheet.cell(target_row, col_num, value)
-                        print(f"  [OK] {excel_name}(第{col_num}列): {value}")
-                    else:
-                        sheet.cell(target_row, col_num, None)  # 空白
-                        print(f"  [EMPTY] {excel_name}(第{col_num}列): 空白")
-                    
-                    updated_count += 1
-                else:
-                    print(f"  [SKIP] 未找到映射：{system_name}")
-            
-            # 保存文件
-            success = self.save_workbook_with_retry(wb)
-            wb.close()
-            
-            if success:
-                print(f"数据写入完成！更新了 {updated_count} 个水表的数据")
+            if result['success']:
+                print(f"数据写入完成！更新了 {result['meters_written']} 个水表的数据")
                 return True
             else:
                 print("数据写入失败：无法保存文件")
@@ -185,6 +199,34 @@ class SpecificExcelWriter:
             traceback.print_exc()
             return False
     
+    def write_water_data_batch(self, data_by_date):
+        """
+        一次加载/保存，写入多天的水表数据
+        
+        Args:
+            data_by_date: {日期字符串 'YYYY-MM-DD': {水表系统名称: 数值}}
+        
+        Returns:
+            dict: {'success': bool, 'dates_written': int, 'meters_written': int}
+        """
+        print(f"开始批量写入数据到Excel文件，共{len(data_by_date)}天...")
+        
+        try:
+            result = self._write_pipeline().write(data_by_date)
+            
+            if result['success']:
+                print(f"批量写入完成！{result['dates_written']}天，{result['meters_written']}个水表数值")
+            else:
+                print("批量写入失败：无法保存文件")
+            
+            return result
+            
+        except Exception as e:
+            print(f"批量写入Excel数据时出错: {e}")
+            import traceback
+            traceback.print_exc()
+            return {'success': False, 'dates_written': 0, 'meters_written': 0}
+    
     def get_existing_dates(self):
         """获取Excel文件中已有的日期列表"""
         try:
@@ -207,6 +249,42 @@ class SpecificExcelWriter:
             print(f"读取现有日期时出错: {e}")
             return []
 
+    def get_existing_meter_values(self, start_date, end_date):
+        """
+        读取日期范围内各水表列的现有数值（只读模式，不加载样式）
+
+        Args:
+            start_date: 开始日期字符串 'YYYY-MM-DD'
+            end_date: 结束日期字符串 'YYYY-MM-DD'
+
+        Returns:
+            dict: {日期字符串: {水表系统名称: 单元格值}}，只包含Excel中已有的日期行
+        """
+        max_col = max(col_num for col_num, _ in self.meter_mapping.values())
+        wb = openpyxl.load_workbook(self.excel_path, read_only=True)
+        try:
+            sheet = wb.active
+
+            existing = {}
+            for row in sheet.iter_rows(min_row=5, max_col=max_col, values_only=True):
+                cell_value = row[0] if row else None
+                if isinstance(cell_value, datetime):
+                    date_str = cell_value.strftime('%Y-%m-%d')
+                elif isinstance(cell_value, str):
+                    date_str = cell_value.strip()
+                else:
+                    continue
+
+                if start_date <= date_str <= end_date:
+                    existing[date_str] = {
+                        system_name: row[col_num - 1] if len(row) >= col_num else None
+                        for system_name, (col_num, _) in self.meter_mapping.items()
+                    }
+
+            return existing
+        finally:
+            wb.close()
+
 def test_specific_excel_writer():
     """测试函数"""
     writer = SpecificExcelWriter()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+供水数据统计
+把每日供水表的数值列一次性转换为浮点矩阵（空白、0 和非数值记为 NaN），
+对任意日期窗口一次性算出每列的 总计/平均值/最大值/最小值/天数：
+- 周报、月报、季报和仪表板共用，统计口径与原来一致（排除空白和0值）
+- 矩阵挂在已解析工作表上，每个文件版本只转换一次
+- 安装了 numpy 时使用向量化计算，否则使用纯 Python 实现
+"""
+
+import math
+
+# 优先使用numpy，不可用时使用纯Python实现
+NUMPY_AVAILABLE = False
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+
+
+def to_stat_value(value):
+    """单元格值转换为参与统计的数值；空白、0 和非数值返回 NaN"""
+    if value is None or isinstance(value, bool):
+        return math.nan
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        return math.nan
+    if number == 0 or math.isnan(number):
+        return math.nan
+    return number
+
+
+class SupplyMatrix:
+    """数据行（去掉日期列）的数值矩阵"""
+
+    def __init__(self, data_rows, column_count):
+        # 第0列是日期，统计从第1列开始
+        self.column_count = column_count
+        width = column_count - 1
+        values = []
+        for row in data_rows:
+            cells = [to_stat_value(row[col_idx]) if col_idx < len(row) else math.nan
+                     for col_idx in range(1, column_count)]
+            values.append(cells)
+
+        if NUMPY_AVAILABLE:
+            self.values = np.array(values, dtype=float).reshape(len(values), width)
+        else:
+            self.values = values
+
+    def aggregate(self, positions):
+        """
+        统计指定数据行
+
+        Args:
+            positions: 数据行下标列表（如日期索引返回的结果）
+
+        Returns:
+            list: 每列一个结果（对应表头第1列起），
+                  有数值时为 {'total', 'average', 'max', 'min', 'count'}，否则为 None
+        """
+        if NUMPY_AVAILABLE:
+            return self._aggregate_numpy(positions)
+        return self._aggregate_python(positions)
+
+    def _aggregate_numpy(self, positions):
+        width = self.column_count - 1
+        block = self.values[np.asarray(positions, dtype=np.intp)] if len(positions) else np.empty((0, width))
+        mask = ~np.isnan(block)
+        counts = mask.sum(axis=0)
+        totals = np.where(mask, block, 0.0).sum(axis=0)
+        maxima = np.where(mask, block, -np.inf).max(axis=0, initial=-np.inf)
+        minima = np.where(mask, block, np.inf).min(axis=0, initial=np.inf)
+
+        results = []
+        for col in range(width):
+            count = int(counts[col])
+            if count == 0:
+                results.append(None)
+                continue
+            total = float(totals[col])
+            results.append({
+                'total': total,
+                'average': total / count,
+                'max': float(maxima[col]),
+                'min': float(minima[col]),
+                'count': count
+            })
+        return results
+
+    def _aggregate_python(self, positions):
+        results = []
+        for col in range(self.column_count - 1):
+            values = [self.values[i][col] for i in positions]
+            values = [v for v in values if not math.isnan(v)]
+            if not values:
+                results.append(None)
+                continue
+            total = sum(values)
+            results.append({
+                'total': total,
+                'average': total / len(values),
+                'max': max(values),
+                'min': min(values),
+                'count': len(values)
+            })
+        return results
+
+
+def get_supply_matrix(parsed_sheet):
+    """获取已解析工作表的数值矩阵（每个文件版本只转换一次）"""
+    matrix = parsed_sheet.extras.get('supply_matrix')
+    if matrix is None:
+        matrix = SupplyMatrix(parsed_sheet.data_rows, len(parsed_sheet.header))
+        parsed_sheet.extras['supply_matrix'] = matrix
+    return matrix
+
+
+def summarize_by_header(header, results):
+    """把统计结果整理为 {列名: {'total', 'average', 'max', 'min', 'count'}}（取整，跳过无数据的列）"""
+    summary = {}
+    for col_idx, col_name in enumerate(header):
+        if col_idx == 0:  # 跳过日期列
+            continue
+        result = results[col_idx - 1]
+        if result:
+            summary[col_name] = {
+                'total': round(result['total']),
+                'average': round(result['average']),
+                'max': round(result['max']),
+                'min': round(result['min']),
+                'count': result['count']
+            }
+    return summary
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+每日供水数据导出
+按日期范围把每日供水表逐块导出为 NDJSON / CSV / Arrow IPC 流，供报表和数据分析任务批量拉取历史数据：
+- 通过日期索引取行范围，按块生成输出，不在内存中拼接完整的导出内容
+- 列名取第4行表头（去掉换行）；重复的列名后面加上Excel列字母，空表头使用列字母
+- Arrow 格式需要安装 pyarrow，日期列为 date32，其余列为 float64
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+
+from openpyxl.utils import get_column_letter
+
+from date_index import get_sheet_date_index, parse_date_cell
+
+# 优先使用pyarrow，不可用时不提供Arrow格式
+PYARROW_AVAILABLE = False
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+
+# 导出配置
+EXPORT_CONFIG = {
+    'chunk_rows': 500,     # 每块输出的行数
+}
+
+# 格式 -> (MIME类型, 文件扩展名)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+
+class ExportError(ValueError):
+    """导出参数错误"""
+
+
+def export_columns(header):
+    """生成唯一的导出列名"""
+    names = []
+    seen = set()
+    for col_idx, col_name in enumerate(header):
+        letter = get_column_letter(col_idx + 1)
+        name = str(col_name).replace('\n', '').strip() if col_name is not None else ''
+        if not name:
+            name = f'列{letter}'
+        elif name in seen:
+            name = f'{name}({letter})'
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _export_value(value):
+    """单元格值转换为导出值：日期转为 YYYY-MM-DD，布尔值和空白转为 None"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, bool):
+        return None
+    return value
+
+
+def _to_float(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return None
+
+
+def iter_row_chunks(parsed_sheet, start_date=None, end_date=None):
+    """
+    按块生成日期范围内的数据行
+
+    Yields:
+        list: 每块最多 chunk_rows 行，每行为与表头等长的原始单元格值元组
+    """
+    date_index = get_sheet_date_index(parsed_sheet)
+    if not date_index.dates:
+        return
+
+    positions = date_index.range(start_date or date_index.dates[0], end_date or date_index.dates[-1])
+    width = len(parsed_sheet.header)
+    data_rows = parsed_sheet.data_rows
+    chunk_rows = EXPORT_CONFIG['chunk_rows']
+
+    for offset in range(0, len(positions), chunk_rows):
+        chunk = []
+        for position in positions[offset:offset + chunk_rows]:
+            row = data_rows[position]
+            chunk.append(tuple(row[:width]) + (None,) * (width - len(row)))
+        yield chunk
+
+
+def stream_ndjson(parsed_sheet, start_date=None, end_date=None):
+    """NDJSON：每行一个 JSON 对象"""
+    columns = export_columns(parsed_sheet.header)
+    for chunk in iter_row_chunks(parsed_sheet, start_date, end_date):
+        lines = []
+        for row in chunk:
+            record = {name: _export_value(value) for name, value in zip(columns, row)}
+            lines.append(json.dumps(record, ensure_ascii=False))
+        yield '\n'.join(lines) + '\n'
+
+
+def stream_csv(parsed_sheet, start_date=None, end_date=None):
+    """CSV：带BOM（Excel可直接打开），第一行为列名"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    buffer.write('\ufeff')
+    writer.writerow(export_columns(parsed_sheet.header))
+    yield buffer.getvalue()
+
+    for chunk in iter_row_chunks(parsed_sheet, start_date, end_date):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in chunk:
+            writer.writerow(['' if value is None else value for value in map(_export_value, row)])
+        yield buffer.getvalue()
+
+
+def stream_arrow(parsed_sheet, start_date=None, end_date=None):
+    """Arrow IPC 流格式：每块一个 RecordBatch"""
+    if not PYARROW_AVAILABLE:
+        raise ExportError('Arrow 格式需要安装 pyarrow')
+
+    columns = export_columns(parsed_sheet.header)
+    schema = pa.schema([pa.field(columns[0], pa.date32())] +
+                       [pa.field(name, pa.float64()) for name in columns[1:]])
+
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, schema)
+
+    def take():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    yield take()  # 流头（schema）
+
+    for chunk in iter_row_chunks(parsed_sheet, start_date, end_date):
+        dates = [parse_date_cell(row[0]) for row in chunk]
+        arrays = [pa.array([date.date() if date else None for date in dates], type=pa.date32())]
+        for col_idx in range(1, len(columns)):
+            arrays.append(pa.array([_to_float(row[col_idx]) for row in chunk], type=pa.float64()))
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield take()
+
+    writer.close()
+    yield take()  # 流结束标记
+
+
+def export_stream(parsed_sheet, export_format='ndjson', start_date=None, end_date=None):
+    """
+    创建导出流
+
+    Args:
+        parsed_sheet: workbook_cache.ParsedSheet
+        export_format: 'ndjson'、'csv' 或 'arrow'
+        start_date / end_date: 日期范围 'YYYY-MM-DD'（含首尾），省略时不限
+
+    Returns:
+        tuple: (生成器, MIME类型, 文件扩展名)
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f'不支持的导出格式: {export_format}（可选 {", ".join(EXPORT_FORMATS)}）')
+    if export_format == 'arrow' and not PYARROW_AVAILABLE:
+        raise ExportError('Arrow 格式需要安装 pyarrow')
+
+    for name, value in (('start_date', start_date), ('end_date', end_date)):
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise ExportError(f'{name} 日期格式应为 YYYY-MM-DD')
+
+    streams = {'ndjson': stream_ndjson, 'csv': stream_csv, 'arrow': stream_arrow}
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    return streams[export_format](parsed_sheet, start_date or None, end_date or None), mimetype, extension
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+供水派生列公式
+派生列（石滩、三江、沙庄、日供水、环比差值，以及月度统计表的分区供水量）在这里用表达式声明一次：
+- 表达式由列名、数字、+ - * /、括号和 lag(列名) 组成，lag 取上一行（按日期顺序）的值
+- evaluate_row：逐行计算，用于写入单天数据后的增量重算和仪表板
+- evaluate_columns：按列整体计算（安装了 numpy 时向量化），用于全表重算
+- to_excel_formula：按列字母生成 Excel 公式，用于月度统计表
+列名中的全角括号（如“边界过表用户（荔湖）”）属于列名，半角括号用于分组。
+"""
+
+import math
+import re
+
+# 优先使用numpy，不可用时使用纯Python实现
+NUMPY_AVAILABLE = False
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+
+
+class FormulaError(ValueError):
+    """公式定义错误"""
+
+
+_TOKEN_RE = re.compile(r'\s*(?:(\d+(?:\.\d+)?)|([-+*/(),])|([^\s\-+*/(),]+))')
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = _TOKEN_RE.match(expression, position)
+        if not match or match.end() == position:
+            raise FormulaError(f'无法解析公式: {expression}')
+        number, operator, name = match.groups()
+        if number is not None:
+            tokens.append(('num', float(number)))
+        elif operator is not None:
+            tokens.append(('op', operator))
+        else:
+            tokens.append(('name', name))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """递归下降解析，得到语法树：('num', v) / ('col', 名称) / ('lag', 名称) / ('neg', x) / (运算符, 左, 右)"""
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = _tokenize(expression)
+        self.position = 0
+
+    def parse(self):
+        node = self._expr()
+        if self.position != len(self.tokens):
+            raise FormulaError(f'公式多余的内容: {self.expression}')
+        return node
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _take(self, kind=None, value=None):
+        token = self._peek()
+        if token[0] is None or (kind and token[0] != kind) or (value and token[1] != value):
+            raise FormulaError(f'公式格式错误: {self.expression}')
+        self.position += 1
+        return token
+
+    def _expr(self):
+        node = self._term()
+        while self._peek() in (('op', '+'), ('op', '-')):
+            operator = self._take()[1]
+            node = (operator, node, self._term())
+        return node
+
+    def _term(self):
+        node = self._factor()
+        while self._peek() in (('op', '*'), ('op', '/')):
+            operator = self._take()[1]
+            node = (operator, node, self._factor())
+        return node
+
+    def _factor(self):
+        kind, value = self._peek()
+        if (kind, value) == ('op', '-'):
+            self._take()
+            return ('neg', self._factor())
+        if (kind, value) == ('op', '('):
+            self._take()
+            node = self._expr()
+            self._take('op', ')')
+            return node
+        if kind == 'num':
+            self._take()
+            return ('num', value)
+        if kind == 'name':
+            self._take()
+            if value == 'lag' and self._peek() == ('op', '('):
+                self._take()
+                name = self._take('name')[1]
+                self._take('op', ')')
+                return ('lag', name)
+            return ('col', value)
+        raise FormulaError(f'公式格式错误: {self.expression}')
+
+
+def _walk(node, kind):
+    """语法树中某类节点引用的列名"""
+    if node[0] == kind:
+        yield node[1]
+    elif node[0] == 'neg':
+        yield from _walk(node[1], kind)
+    elif node[0] in ('+', '-', '*', '/'):
+        yield from _walk(node[1], kind)
+        yield from _walk(node[2], kind)
+
+
+def to_number(value):
+    """单元格值转换为参与计算的数值：空白、'-' 和非数值按 0 计算"""
+    if value is None:
+        return 0.0
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        return 0.0
+    return 0.0 if math.isnan(number) else number
+
+
+class FormulaColumn:
+    """一个派生列：名称 = 表达式；表达式含 lag 而没有上一行时，结果取 first_value"""
+
+    def __init__(self, name, expression, first_value=0):
+        self.name = name
+        self.expression = expression
+        self.tree = _Parser(expression).parse()
+        self.first_value = first_value
+        self.references = list(dict.fromkeys(_walk(self.tree, 'col')))
+        self.lag_references = list(dict.fromkeys(_walk(self.tree, 'lag')))
+
+
+class SupplyFormulas:
+    """一组按声明顺序计算的派生列（后面的列可以引用前面的派生列）"""
+
+    def __init__(self, definitions):
+        self.columns = [FormulaColumn(*definition) for definition in definitions]
+        self.outputs = [column.name for column in self.columns]
+
+        inputs = []
+        defined = set()
+        for column in self.columns:
+            # 同一行内只能引用前面已计算的派生列；lag 取上一行，不受顺序限制
+            for name in column.references:
+                if name in self.outputs and name not in defined:
+                    raise FormulaError(f'{column.name} 引用了尚未计算的派生列 {name}')
+            for name in column.references + column.lag_references:
+                if name not in self.outputs and name not in inputs:
+                    inputs.append(name)
+            defined.add(column.name)
+        self.inputs = inputs
+
+    def evaluate_row(self, values, previous=None):
+        """
+        计算一行
+
+        Args:
+            values: {输入列名: 单元格值}，缺少的列按 0 计算
+            previous: 上一行的 evaluate_row() 结果（含输入列）；没有上一行时为 None
+
+        Returns:
+            dict: {列名: 数值}，包含转换后的输入列和全部派生列（未取整）
+        """
+        scope = {name: to_number(values.get(name)) for name in self.inputs}
+        for column in self.columns:
+            if column.lag_references and previous is None:
+                scope[column.name] = column.first_value
+            else:
+                scope[column.name] = self._eval_scalar(column.tree, scope, previous)
+        return scope
+
+    def _eval_scalar(self, node, scope, previous):
+        kind = node[0]
+        if kind == 'num':
+            return node[1]
+        if kind == 'col':
+            return scope[node[1]]
+        if kind == 'lag':
+            return previous[node[1]]
+        if kind == 'neg':
+            return -self._eval_scalar(node[1], scope, previous)
+        left = self._eval_scalar(node[1], scope, previous)
+        right = self._eval_scalar(node[2], scope, previous)
+        if kind == '+':
+            return left + right
+        if kind == '-':
+            return left - right
+        if kind == '*':
+            return left * right
+        return left / right if right else 0.0
+
+    def evaluate_columns(self, columns):
+        """
+        按列整体计算（行按日期顺序排列，lag 取前一行）
+
+        Args:
+            columns: {输入列名: 单元格值列表}，各列等长
+
+        Returns:
+            dict: {列名: 数值列表}，包含转换后的输入列和全部派生列（未取整）
+        """
+        length = len(next(iter(columns.values()))) if columns else 0
+        scope = {}
+        for name in self.inputs:
+            raw = columns.get(name)
+            scope[name] = [to_number(value) for value in raw] if raw is not None else [0.0] * length
+
+        if NUMPY_AVAILABLE:
+            scope = {name: np.array(values, dtype=float) for name, values in scope.items()}
+            for column in self.columns:
+                result = np.asarray(self._eval_array(column.tree, scope), dtype=float)
+                result = np.broadcast_to(result, (length,)).copy()
+                if column.lag_references and length:
+                    result[0] = column.first_value
+                scope[column.name] = result
+            return {name: values.tolist() for name, values in scope.items()}
+
+        for column in self.columns:
+            results = []
+            for i in range(length):
+                if column.lag_references and i == 0:
+                    results.append(column.first_value)
+                    continue
+                row_scope = {name: values[i] for name, values in scope.items()}
+                previous = {name: values[i - 1] for name, values in scope.items()} if i else None
+                results.append(self._eval_scalar(column.tree, row_scope, previous))
+            scope[column.name] = results
+        return scope
+
+    def _eval_array(self, node, scope):
+        kind = node[0]
+        if kind == 'num':
+            return node[1]
+        if kind == 'col':
+            return scope[node[1]]
+        if kind == 'lag':
+            values = scope[node[1]]
+            shifted = np.empty_like(values)
+            if len(values):
+                shifted[0] = np.nan
+                shifted[1:] = values[:-1]
+            return shifted
+        if kind == 'neg':
+            return -self._eval_array(node[1], scope)
+        left = self._eval_array(node[1], scope)
+        right = self._eval_array(node[2], scope)
+        if kind == '+':
+            return left + right
+        if kind == '-':
+            return left - right
+        if kind == '*':
+            return left * right
+        right = np.asarray(right, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(right != 0, left / np.where(right != 0, right, 1.0), 0.0)
+
+    def to_excel_formula(self, name, column_letters, row):
+        """
+        把派生列公式转换为 Excel 公式
+
+        Args:
+            name: 派生列名
+            column_letters: {列名: Excel列字母}
+            row: Excel行号
+
+        Returns:
+            str: 如 '=B5-C5-D5'
+        """
+        column = next((c for c in self.columns if c.name == name), None)
+        if column is None:
+            raise FormulaError(f'未定义的派生列: {name}')
+        if column.lag_references:
+            raise FormulaError(f'{name} 含 lag，无法转换为单行Excel公式')
+        return '=' + self._render(column.tree, column_letters, row, 0)
+
+    def _render(self, node, column_letters, row, parent_precedence):
+        kind = node[0]
+        if kind == 'num':
+            value = node[1]
+            return str(int(value)) if value == int(value) else str(value)
+        if kind == 'col':
+            if node[1] not in column_letters:
+                raise FormulaError(f'没有列 {node[1]} 对应的Excel列')
+            return f'{column_letters[node[1]]}{row}'
+        if kind == 'neg':
+            return '-' + self._render(node[1], column_letters, row, 3)
+        precedence = 1 if kind in ('+', '-') else 2
+        left = self._render(node[1], column_letters, row, precedence)
+        right = self._render(node[2], column_letters, row, precedence + 1)
+        text = f'{left}{kind}{right}'
+        return f'({text})' if precedence < parent_precedence else text
+
+
+# 每日总供水表的派生列
+DAILY_SUPPLY_FORMULAS = SupplyFormulas([
+    ('石滩', '荔新大道 - 宁西2总表 + 新城大道 + 边界过表用户（荔湖）'),
+    ('三江', '三江新总表 - 沙庄总表 - 边界过表用户（增江）'),
+    ('沙庄', '沙庄总表'),
+    ('石滩供水服务部日供水', '石滩 + 三江 + 沙庄'),
+    ('环比差值', '石滩供水服务部日供水 - lag(石滩供水服务部日供水)'),
+])
+
+# 石滩区分区计量表月度统计的分区供水量
+ZONE_SUPPLY_FORMULAS = SupplyFormulas([
+    ('1区供水量', '荔新大道 - 宁西2总表 - 如丰大道600监控表'),
+    ('2区供水量', '如丰大道600监控表 + 新城大道医院NB - 三棵树600监控表'),
+    ('3区供水量', '三棵树600监控表'),
+])
+
+
+def evaluate_sheet_row(row, col_indices, previous_row=None, formulas=DAILY_SUPPLY_FORMULAS):
+    """
+    按表头列号从一行单元格值计算派生列
+
+    Args:
+        row: 单元格值序列（第1列下标为0）
+        col_indices: {列名: 列号（从1开始）}
+        previous_row: 上一行的单元格值序列，用于 lag；没有时为 None
+
+    Returns:
+        dict: formulas.evaluate_row() 的结果
+    """
+    def inputs(cells):
+        return {name: cells[col_indices[name] - 1] for name in formulas.inputs
+                if name in col_indices and col_indices[name] - 1 < len(cells)}
+
+    previous = formulas.evaluate_row(inputs(previous_row)) if previous_row is not None else None
+    return formulas.evaluate_row(inputs(row), previous)
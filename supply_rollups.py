@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+供水汇总表（预先计算的周/月/季度/抄表周期统计）
+每日供水数据一天只更新一次，报表却每次请求都从日数据重新统计。这里把统计结果按周期物化：
+- 周：ISO周，以周一日期为键，如 '2025-03-03'
+- 月：自然月，如 '2025-03'
+- 季度：如 '2025-Q1'
+- 抄表周期：上月25日到本月24日（与 extract_water_data.extract_monthly_data 一致），以本月为键，如 '2025-03'
+汇总表保存在工作簿旁的 JSON 文件中，并记录生成时工作簿的版本 (修改时间, 文件大小)：
+- 报表接口直接查表；工作簿被其他程序修改（版本不一致）时自动整体重建
+- SpecificExcelWriter 写入某些日期后只重新统计这些日期所在的周期
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from date_index import get_sheet_date_index, month_bounds, _day
+from supply_aggregation import SupplyMatrix, get_supply_matrix
+
+# 汇总表配置
+ROLLUP_CONFIG = {
+    'suffix': '.rollups.json',      # 汇总表文件 = 工作簿路径 + 后缀
+    'cycle_start_day': 25,          # 抄表周期从上月25日开始
+}
+
+PERIOD_KINDS = ('week', 'month', 'quarter', 'cycle')
+
+_lock = threading.Lock()
+
+
+def period_key(kind, date):
+    """某天所属周期的键"""
+    date = _day(date)
+    if kind == 'week':
+        return (date - timedelta(days=date.weekday())).strftime('%Y-%m-%d')
+    if kind == 'month':
+        return f'{date.year}-{date.month:02d}'
+    if kind == 'quarter':
+        return f'{date.year}-Q{(date.month - 1) // 3 + 1}'
+    if kind == 'cycle':
+        # 25日及以后属于下个月的抄表周期
+        if date.day >= ROLLUP_CONFIG['cycle_start_day']:
+            date = month_bounds(date.year, date.month)[1] + timedelta(days=1)
+        return f'{date.year}-{date.month:02d}'
+    raise ValueError(f'未知的汇总周期: {kind}')
+
+
+def period_bounds(kind, key):
+    """周期的第一天和最后一天（datetime）"""
+    if kind == 'week':
+        start = datetime.strptime(key, '%Y-%m-%d')
+        return start, start + timedelta(days=6)
+    if kind == 'month':
+        year, month = (int(part) for part in key.split('-'))
+        return month_bounds(year, month)
+    if kind == 'quarter':
+        year, quarter = key.split('-Q')
+        first_month = (int(quarter) - 1) * 3 + 1
+        return month_bounds(int(year), first_month)[0], month_bounds(int(year), first_month + 2)[1]
+    if kind == 'cycle':
+        year, month = (int(part) for part in key.split('-'))
+        end = datetime(year, month, ROLLUP_CONFIG['cycle_start_day'] - 1)
+        previous_month_end = month_bounds(year, month)[0] - timedelta(days=1)
+        start = datetime(previous_month_end.year, previous_month_end.month, ROLLUP_CONFIG['cycle_start_day'])
+        return start, end
+    raise ValueError(f'未知的汇总周期: {kind}')
+
+
+def rollup_path(excel_path):
+    """汇总表文件路径"""
+    return os.path.abspath(excel_path) + ROLLUP_CONFIG['suffix']
+
+
+def _file_version(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class SupplyRollups:
+    """一个工作簿版本的全部周期统计"""
+
+    def __init__(self, version, column_count, periods=None):
+        self.version = list(version)
+        self.column_count = column_count
+        # {周期类型: {周期键: SupplyMatrix.aggregate() 的结果}}
+        self.periods = periods or {kind: {} for kind in PERIOD_KINDS}
+
+    @classmethod
+    def build(cls, parsed_sheet):
+        """由已解析工作表整体统计所有周期"""
+        date_index = get_sheet_date_index(parsed_sheet)
+        matrix = get_supply_matrix(parsed_sheet)
+        rollups = cls(parsed_sheet.version, len(parsed_sheet.header))
+
+        for kind in PERIOD_KINDS:
+            # 日期已排序，同一周期的行是连续的
+            groups = {}
+            for date, position in zip(date_index.dates, date_index.refs):
+                groups.setdefault(period_key(kind, date), []).append(position)
+            rollups.periods[kind] = {key: matrix.aggregate(positions) for key, positions in groups.items()}
+
+        return rollups
+
+    def get(self, kind, key):
+        """查找某个周期的统计结果；没有该周期时返回 None"""
+        return self.periods.get(kind, {}).get(key)
+
+    def update_dates(self, sheet, date_index, dates, min_row=5):
+        """
+        重新统计写入日期所在的周期
+
+        Args:
+            sheet: 已打开的 openpyxl 工作表
+            date_index: 该工作表的日期索引（行引用为Excel行号）
+            dates: 被写入或修改的日期
+
+        Returns:
+            int: 重新统计的周期数
+        """
+        affected = {(kind, period_key(kind, date)) for date in dates for kind in PERIOD_KINDS}
+        row_cache = {}
+
+        for kind, key in affected:
+            start, end = period_bounds(kind, key)
+            row_nums = date_index.range(start, end)
+            rows = []
+            for row_num in row_nums:
+                if row_num not in row_cache:
+                    row_cache[row_num] = next(sheet.iter_rows(min_row=row_num, max_row=row_num,
+                                                              max_col=self.column_count, values_only=True))
+                rows.append(row_cache[row_num])
+
+            if rows:
+                matrix = SupplyMatrix(rows, self.column_count)
+                self.periods[kind][key] = matrix.aggregate(range(len(rows)))
+            else:
+                self.periods[kind].pop(key, None)
+
+        return len(affected)
+
+    def to_dict(self):
+        return {'version': self.version, 'column_count': self.column_count, 'periods': self.periods}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['version'], data['column_count'], data['periods'])
+
+
+def _load(excel_path):
+    try:
+        with open(rollup_path(excel_path), 'r', encoding='utf-8') as f:
+            return SupplyRollups.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _save(excel_path, rollups):
+    path = rollup_path(excel_path)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(rollups.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        print(f"[WARNING] 保存供水汇总表失败: {e}")
+        return False
+
+
+def get_rollups(parsed_sheet):
+    """
+    获取已解析工作表对应版本的汇总表
+
+    优先使用内存中的结果，其次读取汇总表文件；版本不一致时整体重建并保存。
+    """
+    rollups = parsed_sheet.extras.get('rollups')
+    if rollups is not None:
+        return rollups
+
+    with _lock:
+        rollups = parsed_sheet.extras.get('rollups')
+        if rollups is not None:
+            return rollups
+
+        rollups = _load(parsed_sheet.path)
+        if rollups is None or rollups.version != list(parsed_sheet.version) \
+                or rollups.column_count != len(parsed_sheet.header):
+            rollups = SupplyRollups.build(parsed_sheet)
+            _save(parsed_sheet.path, rollups)
+            print(f"[INFO] 已重建供水汇总表: {os.path.basename(rollup_path(parsed_sheet.path))}")
+
+        parsed_sheet.extras['rollups'] = rollups
+        return rollups
+
+
+def get_period_results(parsed_sheet, kind, key):
+    """某个周期的统计结果（每列一个，格式同 SupplyMatrix.aggregate）；没有数据时返回 None"""
+    return get_rollups(parsed_sheet).get(kind, key)
+
+
+def update_after_write(excel_path, sheet, date_index, dates, loaded_version):
+    """
+    工作簿保存后增量更新汇总表
+
+    Args:
+        excel_path: 工作簿路径
+        sheet: 刚保存的已打开工作表
+        date_index: 该工作表的日期索引（行引用为Excel行号）
+        dates: 本次写入的日期
+        loaded_version: 加载工作簿时的文件版本
+
+    Returns:
+        bool: 是否完成增量更新；汇总表不存在或已过期时返回 False（下次读取时整体重建）
+    """
+    with _lock:
+        rollups = _load(excel_path)
+        if rollups is None or rollups.version != list(loaded_version):
+            return False
+
+        try:
+            count = rollups.update_dates(sheet, date_index, dates)
+        except Exception as e:
+            print(f"[WARNING] 增量更新供水汇总表失败: {e}")
+            return False
+
+        rollups.version = _file_version(excel_path)
+        if not _save(excel_path, rollups):
+            return False
+
+    print(f"[INFO] 供水汇总表已增量更新 {count} 个周期")
+    return True
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务登记表
+Web 服务以 gunicorn 多进程运行，原来的任务状态保存在进程内的全局字典里，查询状态的请求
+落到另一个进程时只能看到“准备就绪”，连续点击还会启动重复的取数任务。这里把任务登记到
+SQLite数据库（task_registry.db），所有进程共享：
+- 每个任务有任务ID、状态（queued/running/succeeded/failed）、进度、当前步骤和各步骤记录
+- 同一 dedup_key 同时只能有一个未结束的任务（数据库唯一索引保证），重复提交返回已有任务，任务只执行一次
+- 任务结果以 JSON 保存，任何进程都可以按任务ID查询
+- 执行任务的进程异常退出时，超过 stale_seconds 没有更新的未结束任务视为中断
+- 任务队列（job_queue）也保存在这里：优先级、重试次数、延后执行时间和取消请求
+- 每次状态变化 version 加一；wait_for_change 等待任务变化（本进程内的变化立即唤醒，
+  其他进程的变化按 change_poll_interval 检查），用于进度推送（SSE）和长轮询
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# 任务登记配置
+TASK_REGISTRY_CONFIG = {
+    'db_path': 'task_registry.db',
+    'stale_seconds': 600,       # 未结束的任务超过该秒数没有更新视为中断
+    'keep_finished': 200,       # 保留的已结束任务数
+    'max_queued': 50,           # 排队中的任务数上限
+    'change_poll_interval': 0.3,    # 等待任务变化时检查其他进程更新的间隔（秒）
+    'stream_seconds': 55,           # 一次进度推送连接的最长时间，之后由浏览器自动重连
+    'keepalive_seconds': 15,        # 没有变化时发送保活注释的间隔
+    'max_wait_seconds': 30          # 长轮询的最长等待时间
+}
+
+TASK_STATES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+ACTIVE_STATES = ('queued', 'running')
+FINISHED_STATES = ('succeeded', 'failed', 'cancelled')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id          TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    dedup_key   TEXT,
+    state       TEXT NOT NULL,
+    progress    INTEGER NOT NULL DEFAULT 0,
+    message     TEXT,
+    stage       TEXT,
+    stages      TEXT NOT NULL DEFAULT '[]',
+    params      TEXT,
+    result      TEXT,
+    error       TEXT,
+    owner       TEXT,
+    created_at  TEXT NOT NULL,
+    started_at  TEXT,
+    updated_at  TEXT NOT NULL,
+    finished_at TEXT,
+    priority         INTEGER NOT NULL DEFAULT 0,
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    max_attempts     INTEGER NOT NULL DEFAULT 1,
+    run_after        TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    version          INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_active_key ON tasks (dedup_key)
+    WHERE dedup_key IS NOT NULL AND state IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_tasks_kind ON tasks (kind, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_queue ON tasks (state, priority, created_at);
+"""
+
+# 旧版本数据库缺少的列
+MIGRATIONS = {
+    'priority': "ALTER TABLE tasks ADD COLUMN priority INTEGER NOT NULL DEFAULT 0",
+    'attempts': "ALTER TABLE tasks ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+    'max_attempts': "ALTER TABLE tasks ADD COLUMN max_attempts INTEGER NOT NULL DEFAULT 1",
+    'run_after': "ALTER TABLE tasks ADD COLUMN run_after TEXT",
+    'cancel_requested': "ALTER TABLE tasks ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0",
+    'version': "ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+}
+
+
+class QueueFullError(RuntimeError):
+    """排队中的任务已达上限"""
+
+
+def _now(delay_seconds=0):
+    return (datetime.now() + timedelta(seconds=delay_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _owner():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# 本进程内任务有变化时唤醒 wait_for_change
+_changed = threading.Condition()
+
+
+def _notify_changed():
+    with _changed:
+        _changed.notify_all()
+
+
+class TaskRegistry:
+    """后台任务的SQLite登记表"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or TASK_REGISTRY_CONFIG['db_path']
+        with self._connect() as conn:
+            columns = {r['name'] for r in conn.execute("PRAGMA table_info(tasks)")}
+            if columns:
+                for column, sql in MIGRATIONS.items():
+                    if column not in columns:
+                        conn.execute(sql)
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """打开连接：正常结束时提交、出错时回滚，最后关闭连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_task(row):
+        if row is None:
+            return None
+        task = dict(row)
+        task['stages'] = json.loads(task['stages'] or '[]')
+        for key in ('params', 'result'):
+            task[key] = json.loads(task[key]) if task[key] else None
+        return task
+
+    # ---------- 提交和执行 ----------
+
+    def _expire_stale(self, conn):
+        """把长时间没有更新的未结束任务标记为中断"""
+        cutoff = _now(-TASK_REGISTRY_CONFIG['stale_seconds'])
+        now = _now()
+        conn.execute(
+            "UPDATE tasks SET version = version + 1, state = 'failed', "
+            "error = '任务中断（执行进程已退出或长时间无响应）', message = '任务中断', updated_at = ?, finished_at = ? "
+            "WHERE state = 'running' AND updated_at < ?",
+            (now, now, cutoff)
+        )
+
+    def submit(self, kind, dedup_key=None, params=None, priority=0, max_attempts=1):
+        """
+        登记一个排队中的任务
+
+        Args:
+            kind: 任务类型
+            dedup_key: 去重键；已有相同键的未结束任务时不再新建
+            params: 任务参数（可JSON序列化）
+            priority: 优先级，数值小的先执行
+            max_attempts: 出错时最多执行的次数
+
+        Returns:
+            tuple: (任务 dict, 是否新建)；未新建时返回已有的未结束任务，调用方不应再执行
+
+        Raises:
+            QueueFullError: 排队中的任务已达上限
+        """
+        task_id = uuid.uuid4().hex
+        now = _now()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._expire_stale(conn)
+            existing = conn.execute(
+                "SELECT id FROM tasks WHERE dedup_key = ? AND state IN ('queued', 'running')", (dedup_key,)
+            ).fetchone() if dedup_key is not None else None
+            if existing is None:
+                queued = conn.execute("SELECT COUNT(*) FROM tasks WHERE state = 'queued'").fetchone()[0]
+                if queued >= TASK_REGISTRY_CONFIG['max_queued']:
+                    raise QueueFullError(f'排队中的任务已达上限（{queued}个），请稍后再试')
+            try:
+                conn.execute(
+                    "INSERT INTO tasks (id, kind, dedup_key, state, message, params, created_at, updated_at, "
+                    "priority, max_attempts) VALUES (?, ?, ?, 'queued', '任务排队中...', ?, ?, ?, ?, ?)",
+                    (task_id, kind, dedup_key, json.dumps(params, ensure_ascii=False) if params is not None else None,
+                     now, now, priority, max_attempts)
+                )
+                created = True
+            except sqlite3.IntegrityError:
+                row = conn.execute(
+                    "SELECT id FROM tasks WHERE dedup_key = ? AND state IN ('queued', 'running')", (dedup_key,)
+                ).fetchone()
+                task_id = row['id']
+                created = False
+        return self.get(task_id), created
+
+    def claim(self, kinds, message='任务已启动...'):
+        """
+        取出下一个可以执行的排队任务并标记为执行中（按优先级、提交时间）
+
+        Args:
+            kinds: 本进程能执行的任务类型
+
+        Returns:
+            dict: 任务；没有可执行的任务时返回 None
+        """
+        kinds = list(kinds)
+        if not kinds:
+            return None
+        now = _now()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM tasks WHERE state = 'queued' AND (run_after IS NULL OR run_after <= ?) "
+                "AND kind IN (%s) ORDER BY priority, created_at, rowid LIMIT 1" % ','.join('?' * len(kinds)),
+                [now] + kinds
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET version = version + 1, state = 'running', message = ?, owner = ?, "
+                "attempts = attempts + 1, started_at = COALESCE(started_at, ?), updated_at = ? WHERE id = ?",
+                (message, _owner(), now, now, row['id'])
+            )
+        _notify_changed()
+        return self.get(row['id'])
+
+    def retry_later(self, task_id, delay_seconds, error):
+        """执行出错后重新排队，delay_seconds 秒后再执行"""
+        now = _now()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET version = version + 1, state = 'queued', error = ?, message = ?, run_after = ?, "
+                "updated_at = ? WHERE id = ? AND state = 'running'",
+                (str(error), f'执行出错，{delay_seconds}秒后重试: {error}', _now(delay_seconds), now, task_id)
+            )
+        _notify_changed()
+
+    def cancel(self, task_id):
+        """
+        取消任务：排队中的任务直接取消，执行中的任务在下次报告进度时停止
+
+        Returns:
+            dict: 取消后的任务；任务不存在时返回 None
+        """
+        now = _now()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET version = version + 1, state = 'cancelled', message = '任务已取消', "
+                "updated_at = ?, finished_at = ? WHERE id = ? AND state = 'queued'",
+                (now, now, task_id)
+            )
+            conn.execute(
+                "UPDATE tasks SET version = version + 1, cancel_requested = 1, message = '正在取消...', "
+                "updated_at = ? WHERE id = ? AND state = 'running'",
+                (now, task_id)
+            )
+        _notify_changed()
+        return self.get(task_id)
+
+    def mark_cancelled(self, task_id):
+        now = _now()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET version = version + 1, state = 'cancelled', message = '任务已取消', "
+                "updated_at = ?, finished_at = ? WHERE id = ?",
+                (now, now, task_id)
+            )
+        _notify_changed()
+        self._cleanup()
+
+    def is_cancel_requested(self, task_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def heartbeat(self, task_ids):
+        """更新执行中任务的时间，避免长时间运行的任务被视为中断"""
+        if not task_ids:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET updated_at = ? WHERE state = 'running' AND id IN (%s)" % ','.join('?' * len(task_ids)),
+                [_now()] + list(task_ids)
+            )
+
+    def update(self, task_id, progress=None, message=None, stage=None):
+        """
+        更新进度；指定 stage 时记录进入新步骤
+
+        Args:
+            progress: 0-100
+            message: 当前说明
+            stage: 步骤名称
+        """
+        now = _now()
+        with self._connect() as conn:
+            row = conn.execute("SELECT progress, message, stage, stages FROM tasks WHERE id = ?",
+                               (task_id,)).fetchone()
+            if row is None:
+                return
+            stages = json.loads(row['stages'] or '[]')
+            if stage and stage != row['stage']:
+                stages.append({'stage': stage, 'started_at': now})
+            conn.execute(
+                "UPDATE tasks SET version = version + 1, progress = ?, message = ?, stage = ?, stages = ?, "
+                "updated_at = ? WHERE id = ?",
+                (row['progress'] if progress is None else int(progress),
+                 row['message'] if message is None else message,
+                 stage or row['stage'], json.dumps(stages, ensure_ascii=False), now, task_id)
+            )
+        _notify_changed()
+
+    def finish(self, task_id, result=None, message='任务完成'):
+        now = _now()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET version = version + 1, state = 'succeeded', progress = 100, message = ?, result = ?, "
+                "updated_at = ?, finished_at = ? WHERE id = ?",
+                (message, json.dumps(result, ensure_ascii=False) if result is not None else None, now, now, task_id)
+            )
+        _notify_changed()
+        self._cleanup()
+
+    def fail(self, task_id, error, message=None, result=None):
+        now = _now()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET version = version + 1, state = 'failed', error = ?, message = ?, result = ?, "
+                "updated_at = ?, finished_at = ? WHERE id = ?",
+                (str(error), message or str(error),
+                 json.dumps(result, ensure_ascii=False) if result is not None else None, now, now, task_id)
+            )
+        _notify_changed()
+        self._cleanup()
+
+    def _cleanup(self):
+        """只保留最近的 keep_finished 个已结束任务"""
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM tasks WHERE state IN ('succeeded', 'failed', 'cancelled') AND id NOT IN ("
+                "SELECT id FROM tasks WHERE state IN ('succeeded', 'failed', 'cancelled') "
+                "ORDER BY created_at DESC LIMIT ?)",
+                (TASK_REGISTRY_CONFIG['keep_finished'],)
+            )
+
+    # ---------- 查询 ----------
+
+    def get(self, task_id):
+        """按任务ID查询；不存在时返回 None"""
+        with self._connect() as conn:
+            return self._to_task(conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone())
+
+    def wait_for_change(self, task_id, version=None, timeout=25):
+        """
+        等待任务变化
+
+        Args:
+            task_id: 任务ID
+            version: 调用方已知的版本；None 时立即返回当前状态
+            timeout: 最长等待秒数
+
+        Returns:
+            dict: 任务（版本不同于 version、任务已结束或已超时）；任务不存在时返回 None
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            task = self.get(task_id)
+            if task is None or version is None or task['version'] != version or task['state'] in FINISHED_STATES:
+                return task
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return task
+            with _changed:
+                _changed.wait(min(remaining, TASK_REGISTRY_CONFIG['change_poll_interval']))
+
+    def latest(self, kind):
+        """某类任务中最近提交的一个；没有时返回 None"""
+        with self._connect() as conn:
+            self._expire_stale(conn)
+            return self._to_task(conn.execute(
+                "SELECT * FROM tasks WHERE kind = ? ORDER BY created_at DESC, rowid DESC LIMIT 1", (kind,)
+            ).fetchone())
+
+
+def task_status_dict(task):
+    """
+    转换为页面使用的任务状态格式（与原 task_status 字典兼容）
+
+    Returns:
+        dict: {'running', 'progress', 'message', 'data', 'error', 'start_time', 'end_time',
+               'task_id', 'kind', 'state', 'stage', 'stages', 'attempts', 'version'}
+    """
+    if task is None:
+        return {
+            'running': False, 'progress': 0, 'message': '准备就绪', 'data': None, 'error': None,
+            'start_time': None, 'end_time': None, 'task_id': None, 'kind': None, 'state': None, 'stage': None,
+            'stages': [], 'attempts': 0, 'version': 0
+        }
+    return {
+        'running': task['state'] in ACTIVE_STATES,
+        'progress': task['progress'],
+        'message': task['message'],
+        'data': task['result'],
+        'error': task['error'],
+        'start_time': task['started_at'] or task['created_at'],
+        'end_time': task['finished_at'],
+        'task_id': task['id'],
+        'kind': task['kind'],
+        'state': task['state'],
+        'stage': task['stage'],
+        'stages': task['stages'],
+        'attempts': task['attempts'],
+        'version': task['version']
+    }
+
+
+def iter_task_events(task_id, last_version=None, registry=None):
+    """
+    任务进度的 Server-Sent Events 流
+
+    每次任务变化推送一条 'progress' 事件（id 为任务版本，断线重连时由 Last-Event-ID 续传），
+    任务结束时推送 'done' 事件后结束；连接超过 stream_seconds 时结束，由浏览器自动重连。
+
+    Yields:
+        str: SSE 格式的文本
+    """
+    registry = registry or get_task_registry()
+    deadline = time.monotonic() + TASK_REGISTRY_CONFIG['stream_seconds']
+    yield 'retry: 1000\n\n'
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        task = registry.wait_for_change(task_id, last_version,
+                                        min(remaining, TASK_REGISTRY_CONFIG['keepalive_seconds']))
+        if task is None:
+            yield 'event: error\ndata: {"message": "任务不存在"}\n\n'
+            return
+        finished = task['state'] in FINISHED_STATES
+        if task['version'] == last_version and not finished:
+            yield ': keepalive\n\n'
+            continue
+
+        last_version = task['version']
+        status = json.dumps(task_status_dict(task), ensure_ascii=False)
+        yield f"id: {last_version}\nevent: {'done' if finished else 'progress'}\ndata: {status}\n\n"
+        if finished:
+            return
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_task_registry():
+    """获取进程内共享的任务登记表"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = TaskRegistry()
+        return _default_registry
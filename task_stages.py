@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务步骤报告
+会话池（water_session_pool）、写入流水线（daily_update_pipeline）等底层模块在登录、调用接口、
+写入、保存等步骤开始时调用 report_stage。这些模块只依赖本模块，不依赖任务队列：
+- 任务队列（job_queue）执行任务时用 stage_callback 为当前线程设置回调，由回调更新任务进度
+- 当前线程没有设置回调时 report_stage 不做任何事
+"""
+
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+def report_stage(stage, message=None):
+    """报告当前线程的步骤变化（当前线程没有回调时忽略）"""
+    callback = getattr(_local, 'callback', None)
+    if callback is not None:
+        callback(stage, message)
+
+
+@contextmanager
+def stage_callback(callback):
+    """在当前线程设置步骤回调 callback(stage, message)，退出时恢复原来的回调"""
+    previous = getattr(_local, 'callback', None)
+    _local.callback = callback
+    try:
+        yield
+    finally:
+        _local.callback = previous
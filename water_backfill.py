@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量补数工具
+按日期范围一次性补齐Excel中的水表数据：
+1. 把日期范围切分为接口允许的最大窗口，每个窗口一次请求获取全部8个水表（见 async_water_client）
+2. 各窗口并发请求，失败时把窗口对半拆分后重试
+3. 所有日期在一次加载/保存中写入Excel
+用法: python water_backfill.py 2025-07-01 2025-07-31
+"""
+
+import sys
+from datetime import datetime, timedelta
+
+from async_water_client import fetch_rows
+from water_session_pool import WaterApiError
+from integrated_excel_updater import extract_meter_values
+from specific_excel_writer import SpecificExcelWriter
+
+
+def _to_date(value):
+    """把 'YYYY-MM-DD' 字符串或 datetime 转换为 date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    return value
+
+
+def fetch_range(start_date, end_date, meter_ids=None):
+    """
+    获取日期范围内每天的水表数值（各日期窗口并发请求）
+
+    Returns:
+        dict: {日期字符串: {水表系统名称: 数值或None}}，没有任何数值的日期不包含在内
+    """
+    rows = fetch_rows(start_date, end_date, meter_ids=meter_ids)
+    if not rows:
+        return {}
+
+    data_by_date = {}
+    current = _to_date(start_date)
+    last = _to_date(end_date)
+    while current <= last:
+        date_str = current.strftime('%Y-%m-%d')
+        values = extract_meter_values(rows, date_str, log=lambda message: None)
+        if any(value is not None for value in values.values()):
+            data_by_date[date_str] = values
+        current += timedelta(days=1)
+
+    return data_by_date
+
+
+def backfill_excel(start_date, end_date):
+    """
+    补齐日期范围内的水表数据并一次性写入Excel
+
+    Returns:
+        dict: {'success': bool, 'message': str, 'dates_written': int, 'missing_dates': list}
+    """
+    start = _to_date(start_date)
+    end = _to_date(end_date)
+    if start > end:
+        return {'success': False, 'message': '开始日期不能晚于结束日期', 'dates_written': 0, 'missing_dates': []}
+
+    print(f"[INFO] 开始补数: {start} ~ {end}")
+    try:
+        data_by_date = fetch_range(start, end)
+    except WaterApiError as e:
+        print(f"[ERROR] 获取数据失败: {e}")
+        return {'success': False, 'message': f'获取数据失败: {e}', 'dates_written': 0, 'missing_dates': []}
+
+    all_dates = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+    missing_dates = [d for d in all_dates if d not in data_by_date]
+    if missing_dates:
+        print(f"[WARNING] 以下日期没有获取到数据: {', '.join(missing_dates)}")
+
+    if not data_by_date:
+        return {'success': False, 'message': '未获取到任何数据', 'dates_written': 0, 'missing_dates': missing_dates}
+
+    writer = SpecificExcelWriter()
+    result = writer.write_water_data_batch(data_by_date)
+    if not result['success']:
+        return {'success': False, 'message': '写入Excel失败', 'dates_written': 0, 'missing_dates': missing_dates}
+
+    message = f"成功补数{result['dates_written']}天"
+    if missing_dates:
+        message += f"，{len(missing_dates)}天无数据"
+    print(f"[SUCCESS] {message}")
+    return {
+        'success': True,
+        'message': message,
+        'dates_written': result['dates_written'],
+        'missing_dates': missing_dates
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("用法: python water_backfill.py 开始日期 结束日期  (格式 YYYY-MM-DD)")
+        sys.exit(1)
+
+    outcome = backfill_excel(sys.argv[1], sys.argv[2])
+    sys.exit(0 if outcome['success'] else 1)
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+水务接口响应缓存
+以 (水表ID, 日期) 为键索引 getRptWaterYield.ashx 返回的数值：
+1. 按日期查找为一次索引查询，不再逐个解析历史快照文件
+2. 今天/昨天的数据上游仍可能变化，超过TTL后视为过期
+3. 条目数超过上限时按LRU淘汰最久未使用的数据
+4. 每次完整取数以 (水表集合, 日期范围) 的内容哈希登记，可判断整段请求是否已缓存
+缓存保存在读数存储的SQLite数据库（water_store，water_readings.db）中：
+- 每次取数只写入本次响应中的数值（一个事务），不再整体重写索引文件
+- gunicorn 的多个进程共用同一份缓存，不会互相覆盖对方登记的数据
+首次建立时一次性导入现有的快照文件（以及旧版的 water_response_cache.json 索引）
+"""
+
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from water_store import WATER_STORE_CONFIG, SCHEMA as STORE_SCHEMA
+
+# 缓存配置
+RESPONSE_CACHE_CONFIG = {
+    'legacy_index_path': 'water_response_cache.json',   # 旧版JSON索引（存在时导入一次）
+    'max_entries': 20000,           # 最多缓存的 (水表, 日期) 数值个数
+    'recent_ttl_seconds': 3600,     # 今天/昨天数据的有效期（秒）
+    'recent_days': 1,               # 距今多少天以内算作“近期”数据
+    'max_ranges': 500               # 最多登记的 (水表集合, 日期范围) 请求数
+}
+
+# 需要导入的历史快照文件
+SNAPSHOT_PATTERNS = ["*COMPLETE_8_METERS*.json", "WEB_COMPLETE*.json", "REAL_*.json"]
+
+# 水表基本信息（Name、ID等）与读数存储共用 meters 表
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS response_cache (
+    meter_id   TEXT NOT NULL,
+    date       TEXT NOT NULL,
+    value      TEXT,
+    fetched_at REAL NOT NULL,
+    used_at    REAL NOT NULL,
+    PRIMARY KEY (meter_id, date)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_response_cache_date ON response_cache (date);
+CREATE INDEX IF NOT EXISTS idx_response_cache_used ON response_cache (used_at);
+
+CREATE TABLE IF NOT EXISTS response_ranges (
+    range_key  TEXT PRIMARY KEY,
+    meter_ids  TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date   TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS response_cache_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _is_date_key(key):
+    """判断 rows 中的键是否为 'YYYY-MM-DD' 日期列"""
+    return len(key) == 10 and key[4] == '-' and key[7] == '-' and key[:4].isdigit()
+
+
+def range_key(meter_ids, start_date, end_date):
+    """(水表集合, 日期范围) 的内容哈希"""
+    content = ','.join(sorted(meter_ids)) + '|' + start_date + '|' + end_date
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class WaterResponseCache:
+    """(水表ID, 日期) -> 数值 的LRU缓存，带近期数据TTL（SQLite持久化）"""
+
+    def __init__(self, db_path=None, max_entries=None, recent_ttl_seconds=None):
+        self.db_path = db_path or WATER_STORE_CONFIG['db_path']
+        self.max_entries = max_entries or RESPONSE_CACHE_CONFIG['max_entries']
+        self.recent_ttl_seconds = recent_ttl_seconds or RESPONSE_CACHE_CONFIG['recent_ttl_seconds']
+        self._ready = False
+
+    # ---------- 持久化 ----------
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._ready:
+            conn.executescript(STORE_SCHEMA + CACHE_SCHEMA)
+            self._ready = True
+            self._import_once(conn)
+        return conn
+
+    def _import_once(self, conn):
+        """
+        数据库中还没有缓存数据时，导入旧版索引和现有的快照文件
+        导入与 imported 标记在同一个事务中提交：导入失败时不写标记，下次启动重新导入
+        """
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            with conn:
+                if conn.execute("SELECT 1 FROM response_cache_meta WHERE key = 'imported'").fetchone():
+                    return
+                self._import_legacy_index(conn)
+                self._import_snapshots(conn)
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache_meta (key, value) VALUES ('imported', ?)",
+                    (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),)
+                )
+        except (sqlite3.Error, OSError) as e:
+            print(f"[WARNING] 导入响应缓存失败，下次启动时重试: {e}")
+
+    def _import_legacy_index(self, conn):
+        """导入旧版JSON索引（不提交，由调用方管理事务）"""
+        path = RESPONSE_CACHE_CONFIG['legacy_index_path']
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] 读取旧版响应缓存索引失败: {e}")
+            return
+
+        for meter_id, info in index.get('meters', {}).items():
+            self._put_meter(conn, meter_id, info)
+        conn.executemany(
+            "INSERT OR REPLACE INTO response_cache (meter_id, date, value, fetched_at, used_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(*key.split('|', 1), json.dumps(entry[0]), entry[1], entry[1])
+             for key, entry in index.get('values', [])]
+        )
+        self._evict(conn)
+        print(f"[INFO] 已导入旧版响应缓存索引 {path}")
+
+    def import_snapshot_files(self, patterns=None):
+        """导入仓库中已有的快照文件（按修改时间从旧到新，新文件的数值覆盖旧文件）"""
+        conn = self._connect()
+        try:
+            with conn:
+                return self._import_snapshots(conn, patterns)
+        finally:
+            conn.close()
+
+    def _import_snapshots(self, conn, patterns=None):
+        """导入快照文件（不提交，由调用方管理事务）"""
+        data_files = []
+        for pattern in patterns or SNAPSHOT_PATTERNS:
+            data_files.extend(glob.glob(pattern))
+        data_files = sorted(set(data_files), key=os.path.getmtime)
+
+        imported = 0
+        for filename in data_files:
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"  [WARNING] 读取 {filename} 失败: {e}")
+                continue
+
+            data = snapshot.get('data') if isinstance(snapshot, dict) else None
+            if isinstance(data, dict) and isinstance(data.get('rows'), list):
+                self._write_rows(conn, data['rows'], os.path.getmtime(filename))
+                imported += 1
+
+        if imported:
+            print(f"[INFO] 响应缓存已导入 {imported} 个快照文件")
+        return imported
+
+    # ---------- 内部操作 ----------
+
+    @staticmethod
+    def _put_meter(conn, meter_id, info):
+        conn.execute(
+            "INSERT INTO meters (meter_id, name, info) VALUES (?, ?, ?) "
+            "ON CONFLICT(meter_id) DO UPDATE SET name = excluded.name, info = excluded.info",
+            (meter_id, info.get('Name', ''), json.dumps(info, ensure_ascii=False))
+        )
+
+    def _evict(self, conn):
+        """超过上限时淘汰最久未使用的数值"""
+        excess = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM response_cache WHERE (meter_id, date) IN "
+                "(SELECT meter_id, date FROM response_cache ORDER BY used_at LIMIT ?)",
+                (excess,)
+            )
+
+    def _is_fresh(self, date_str, fetched_at):
+        """近期数据超过TTL视为过期，更早的数据上游不会再变"""
+        recent_from = (datetime.now() - timedelta(days=RESPONSE_CACHE_CONFIG['recent_days'])).strftime('%Y-%m-%d')
+        if date_str < recent_from:
+            return True
+        return time.time() - fetched_at <= self.recent_ttl_seconds
+
+    def _lookup(self, conn, meter_ids, dates):
+        """
+        查询 (水表, 日期) 的有效数值，命中的数值刷新LRU顺序
+
+        Returns:
+            dict: {(水表ID, 日期): 数值}
+        """
+        if not meter_ids or not dates:
+            return {}
+        sql = ("SELECT meter_id, date, value, fetched_at FROM response_cache "
+               "WHERE date BETWEEN ? AND ? AND meter_id IN (%s)" % ','.join('?' * len(meter_ids)))
+        wanted = set(dates)
+        hits = {}
+        for r in conn.execute(sql, [min(dates), max(dates), *meter_ids]):
+            if r['date'] in wanted and self._is_fresh(r['date'], r['fetched_at']):
+                hits[(r['meter_id'], r['date'])] = json.loads(r['value'])
+
+        if hits:
+            used_at = time.time()
+            with conn:
+                conn.executemany("UPDATE response_cache SET used_at = ? WHERE meter_id = ? AND date = ?",
+                                 [(used_at, meter_id, date_str) for meter_id, date_str in hits])
+        return hits
+
+    def _build_rows(self, conn, meter_ids, dates, hits):
+        infos = {}
+        if meter_ids:
+            sql = "SELECT meter_id, info FROM meters WHERE meter_id IN (%s)" % ','.join('?' * len(meter_ids))
+            infos = {r['meter_id']: r['info'] for r in conn.execute(sql, meter_ids)}
+
+        rows = []
+        for meter_id in meter_ids:
+            row = json.loads(infos[meter_id]) if infos.get(meter_id) else {'ID': meter_id}
+            found = False
+            for date_str in dates:
+                if (meter_id, date_str) in hits:
+                    row[date_str] = hits[(meter_id, date_str)]
+                    found = True
+            if found:
+                rows.append(row)
+        return rows
+
+    # ---------- 写入 ----------
+
+    def _write_rows(self, conn, rows, fetched_at):
+        """写入 rows 中的 (水表, 日期) 数值（不提交，由调用方管理事务）"""
+        values = []
+        for row in rows:
+            if not isinstance(row, dict) or not row.get('ID'):
+                continue
+            meter_id = str(row['ID'])
+            self._put_meter(conn, meter_id, {k: v for k, v in row.items() if not _is_date_key(k)})
+            values.extend((meter_id, key, json.dumps(value), fetched_at, fetched_at)
+                          for key, value in row.items() if _is_date_key(key))
+        conn.executemany(
+            "INSERT OR REPLACE INTO response_cache (meter_id, date, value, fetched_at, used_at) "
+            "VALUES (?, ?, ?, ?, ?)", values
+        )
+        self._evict(conn)
+
+    def put_rows(self, rows, fetched_at=None, conn=None):
+        """登记接口返回的 rows 中所有 (水表, 日期) 数值（一个事务）"""
+        fetched_at = fetched_at or time.time()
+        own_conn = conn is None
+        conn = conn or self._connect()
+        try:
+            with conn:
+                self._write_rows(conn, rows, fetched_at)
+        finally:
+            if own_conn:
+                conn.close()
+
+    def put_response(self, data, meter_ids, start_date, end_date):
+        """登记一次完整的接口响应 {'total', 'rows'}"""
+        if not isinstance(data, dict) or not isinstance(data.get('rows'), list):
+            return
+        fetched_at = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_ranges (range_key, meter_ids, start_date, end_date, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (range_key(meter_ids, start_date, end_date), ','.join(sorted(meter_ids)),
+                     start_date, end_date, fetched_at)
+                )
+                conn.execute(
+                    "DELETE FROM response_ranges WHERE range_key NOT IN "
+                    "(SELECT range_key FROM response_ranges ORDER BY fetched_at DESC LIMIT ?)",
+                    (RESPONSE_CACHE_CONFIG['max_ranges'],)
+                )
+            self.put_rows(data['rows'], fetched_at=fetched_at, conn=conn)
+        except sqlite3.Error as e:
+            print(f"[WARNING] 保存响应缓存失败: {e}")
+        finally:
+            conn.close()
+
+    # ---------- 查询 ----------
+
+    def get_value(self, meter_id, date_str):
+        """单个水表某天的数值；未缓存或已过期返回 (False, None)"""
+        key = (str(meter_id), date_str)
+        conn = self._connect()
+        try:
+            hits = self._lookup(conn, [key[0]], [date_str])
+        finally:
+            conn.close()
+        return (True, hits[key]) if key in hits else (False, None)
+
+    def get_date(self, date_str):
+        """
+        某一天所有已缓存水表的数据
+
+        Returns:
+            dict: 接口格式 {'total', 'rows'}；没有该日期返回 None
+        """
+        conn = self._connect()
+        try:
+            meter_ids = [r['meter_id'] for r in conn.execute(
+                "SELECT meter_id FROM response_cache WHERE date = ? ORDER BY meter_id", (date_str,))]
+            hits = self._lookup(conn, meter_ids, [date_str])
+            rows = self._build_rows(conn, meter_ids, [date_str], hits)
+        finally:
+            conn.close()
+        if not rows:
+            return None
+        return {'total': len(rows), 'rows': rows}
+
+    def get_range(self, meter_ids, start_date, end_date):
+        """
+        整段请求是否已完整缓存
+
+        Returns:
+            dict: 接口格式 {'total', 'rows'}；有任何 (水表, 日期) 缺失或过期时返回 None
+        """
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        dates = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+        meter_ids = list(meter_ids)
+
+        conn = self._connect()
+        try:
+            hits = self._lookup(conn, meter_ids, dates)
+            if len(hits) < len(set(meter_ids)) * len(dates):
+                return None
+            rows = self._build_rows(conn, meter_ids, dates, hits)
+        finally:
+            conn.close()
+        return {'total': len(rows), 'rows': rows}
+
+    def stats(self):
+        """缓存统计信息"""
+        conn = self._connect()
+        try:
+            r = conn.execute(
+                "SELECT COUNT(*) AS entries, COUNT(DISTINCT date) AS dates, "
+                "COUNT(DISTINCT meter_id) AS meters FROM response_cache"
+            ).fetchone()
+            ranges = conn.execute("SELECT COUNT(*) FROM response_ranges").fetchone()[0]
+        finally:
+            conn.close()
+        return {
+            'entries': r['entries'],
+            'dates': r['dates'],
+            'meters': r['meters'],
+            'ranges': ranges,
+            'max_entries': self.max_entries
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """获取进程内共享的响应缓存"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = WaterResponseCache()
+        return _default_cache
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+水务系统会话池
+在多次调用之间复用已登录的 requests.Session：
+1. 登录页/报表页的 __VIEWSTATE、__EVENTVALIDATION 只解析一次并缓存
+2. 登录、访问 frmMain.aspx / FluxRpt.aspx 只在会话建立时执行一次
+3. 接口返回“登录超时”或被重定向到登录页时，自动重新登录并重试
+稳态下每次取数只需一次 getRptWaterYield.ashx 请求
+"""
+
+import hashlib
+import json
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from bs4 import BeautifulSoup
+
+from config import SYSTEM_CONFIG, DEFAULT_API_PARAMS, DEFAULT_METER_IDS
+from water_response_cache import get_response_cache
+from task_stages import report_stage
+
+# 水务系统登录凭据
+WATER_USERNAME = '13509288500'
+WATER_PASSWORD = '288500'
+
+# 会话池配置
+SESSION_POOL_CONFIG = {
+    'size': 2,                  # 最多同时保持的已登录会话数
+    'timeout': 30,              # 单次HTTP请求超时（秒）
+    'max_idle_seconds': 900     # 会话空闲超过该时间后主动重新登录（服务器默认20分钟过期）
+}
+
+API_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'application/json, text/javascript, */*; q=0.01',
+    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+    'X-Requested-With': 'XMLHttpRequest'
+}
+
+# 随报表请求附带的ASP.NET状态字段（与原来直接解析报表页时发送的字段相同）
+FORM_STATE_FIELDS = ('__VIEWSTATE', '__EVENTVALIDATION')
+
+
+class WaterApiError(Exception):
+    """
+    水务接口调用失败
+
+    kind:
+        'login'     登录失败或重新登录后仍显示登录超时
+        'transport' 网络错误、超时等（requests 异常）
+        'response'  响应为空、状态码不是200或不是JSON
+    """
+
+    def __init__(self, kind, message, status_code=None):
+        super().__init__(message)
+        self.kind = kind
+        self.status_code = status_code
+
+
+def md5_hash(text):
+    """计算MD5哈希值"""
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def format_node_ids(meter_ids):
+    """把水表ID列表格式化为接口需要的 nodeId 参数：'id1','id2',..."""
+    return "'" + "','".join(meter_ids) + "'"
+
+
+def extract_form_fields(html):
+    """提取页面第一个表单中所有 input 的 name/value"""
+    soup = BeautifulSoup(html, 'html.parser')
+    form = soup.find('form')
+    fields = {}
+    if form:
+        for input_elem in form.find_all('input'):
+            name = input_elem.get('name')
+            if name:
+                fields[name] = input_elem.get('value', '')
+    return fields
+
+
+def is_login_timeout(response):
+    """判断响应是否为登录超时/被重定向回登录页"""
+    if 'login.aspx' in response.url.lower():
+        return True
+    return '登录超时' in response.text
+
+
+class _PooledSession:
+    """会话池中的单个会话"""
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.logged_in = False
+        self.last_used = 0.0
+
+
+class WaterSessionPool:
+    """已登录水务系统会话的线程安全池"""
+
+    def __init__(self, size=None, username=WATER_USERNAME, password=WATER_PASSWORD,
+                 timeout=None, max_idle_seconds=None):
+        self.base_url = SYSTEM_CONFIG['base_url']
+        self.login_url = self.base_url + SYSTEM_CONFIG['login_path']
+        self.main_url = self.base_url + '/frmMain.aspx'
+        self.report_url = self.base_url + SYSTEM_CONFIG['report_path']
+        self.api_url = self.base_url + SYSTEM_CONFIG['api_path']
+
+        self.size = size or SESSION_POOL_CONFIG['size']
+        self.timeout = timeout or SESSION_POOL_CONFIG['timeout']
+        self.max_idle_seconds = max_idle_seconds or SESSION_POOL_CONFIG['max_idle_seconds']
+        self.username = username
+        self.password = password
+
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+        # 缓存的表单状态：'login' -> 登录页隐藏字段，'report' -> 报表页 __VIEWSTATE 等
+        self._form_cache = {}
+
+    # ---------- 会话借还 ----------
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return _PooledSession()
+
+        return self._idle.get()
+
+    def ensure_size(self, size):
+        """把会话数上限提高到至少 size（只增不减；新增的会话在借出时才登录）"""
+        with self._lock:
+            if size > self.size:
+                self.size = size
+            return self.size
+
+    def _release(self, pooled):
+        pooled.last_used = time.time()
+        self._idle.put(pooled)
+
+    @contextmanager
+    def session(self):
+        """借出一个已登录的会话，用完自动归还"""
+        pooled = self._acquire()
+        try:
+            if pooled.logged_in and time.time() - pooled.last_used > self.max_idle_seconds:
+                pooled.logged_in = False
+            if not pooled.logged_in and not self._login(pooled):
+                raise RuntimeError('登录水务系统失败')
+            yield pooled
+        finally:
+            self._release(pooled)
+
+    # ---------- 登录 ----------
+
+    def _login_fields(self, pooled, refresh=False):
+        with self._lock:
+            cached = self._form_cache.get('login')
+        if cached and not refresh:
+            return dict(cached)
+
+        login_page = pooled.session.get(self.login_url, timeout=self.timeout)
+        fields = extract_form_fields(login_page.text)
+        with self._lock:
+            self._form_cache['login'] = fields
+        return dict(fields)
+
+    def _login(self, pooled):
+        """登录并进入报表页面；表单字段优先使用缓存，失效时重新获取"""
+        for refresh in (False, True):
+            try:
+                form_data = self._login_fields(pooled, refresh=refresh)
+                form_data['user'] = self.username
+                form_data['pwd'] = md5_hash(self.password)
+
+                report_stage('login')
+                login_response = pooled.session.post(self.login_url, data=form_data, timeout=self.timeout)
+                if 'window.location' not in login_response.text:
+                    print(f"[WARNING] 登录未成功{'（已刷新登录表单）' if refresh else '，刷新登录表单后重试'}")
+                    continue
+
+                report_stage('report_page')
+                pooled.session.get(self.main_url, timeout=self.timeout)
+                report_response = pooled.session.get(self.report_url, timeout=self.timeout)
+                if is_login_timeout(report_response):
+                    print("[WARNING] 访问报表页面时显示登录超时")
+                    continue
+
+                report_state = extract_form_fields(report_response.text)
+                with self._lock:
+                    self._form_cache['report'] = {
+                        key: report_state[key] for key in FORM_STATE_FIELDS if key in report_state
+                    }
+
+                pooled.logged_in = True
+                print("[OK] 水务系统登录成功，会话已缓存")
+                return True
+            except requests.RequestException as e:
+                print(f"[ERROR] 登录异常: {e}")
+                return False
+
+        return False
+
+    def invalidate(self):
+        """丢弃所有会话和缓存的表单状态（下次调用时重新登录）"""
+        with self._lock:
+            self._form_cache.clear()
+        drained = []
+        while True:
+            try:
+                drained.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for pooled in drained:
+            pooled.logged_in = False
+            self._idle.put(pooled)
+
+    def warm_up(self):
+        """预先建立一个已登录会话，返回是否成功"""
+        try:
+            with self.session():
+                return True
+        except RuntimeError:
+            return False
+
+    # ---------- 接口调用 ----------
+
+    def request_report(self, api_params, include_form_state=False):
+        """
+        调用 getRptWaterYield.ashx，失败时抛出 WaterApiError（调用方据失败类型决定是否重试）
+
+        Args:
+            api_params: 接口参数
+            include_form_state: 是否附带缓存的报表页 __VIEWSTATE/__EVENTVALIDATION
+
+        Returns:
+            dict: 解析后的JSON数据
+        """
+        for attempt in range(2):
+            try:
+                with self.session() as pooled:
+                    data = dict(api_params)
+                    if include_form_state:
+                        with self._lock:
+                            data.update(self._form_cache.get('report', {}))
+
+                    headers = dict(API_HEADERS, Referer=self.report_url)
+                    report_stage('api_call')
+                    response = pooled.session.post(self.api_url, data=data, headers=headers, timeout=self.timeout)
+
+                    if is_login_timeout(response):
+                        print("[INFO] 会话已过期，重新登录后重试")
+                        pooled.logged_in = False
+                        continue
+
+                    if response.status_code != 200 or not response.text.strip():
+                        raise WaterApiError('response', f'API响应为空或无效: {response.status_code}',
+                                            response.status_code)
+
+                    report_stage('parse')
+                    try:
+                        return json.loads(response.text)
+                    except json.JSONDecodeError:
+                        # 非JSON通常意味着会话被服务器丢弃，重新登录一次
+                        print("[WARNING] API返回的不是有效的JSON数据")
+                        pooled.logged_in = False
+                        if attempt == 0:
+                            continue
+                        raise WaterApiError('response', 'API返回的不是有效的JSON数据', response.status_code)
+            except RuntimeError as e:
+                raise WaterApiError('login', str(e)) from e
+            except requests.RequestException as e:
+                raise WaterApiError('transport', f'API调用异常: {e}') from e
+
+        raise WaterApiError('login', '重新登录后仍显示登录超时')
+
+    def post_report(self, api_params, include_form_state=False):
+        """
+        调用 getRptWaterYield.ashx
+
+        Returns:
+            dict: 解析后的JSON数据；失败返回 None
+        """
+        try:
+            return self.request_report(api_params, include_form_state=include_form_state)
+        except WaterApiError as e:
+            print(f"[{'WARNING' if e.kind == 'response' else 'ERROR'}] {e}")
+            return None
+
+    def fetch_water_yield(self, start_date, end_date, meter_ids=None, include_form_state=False,
+                          raise_errors=False, **extra_params):
+        """
+        获取指定水表在日期范围内的日供水量
+
+        Args:
+            raise_errors: 失败时抛出 WaterApiError 而不是返回 None
+
+        Returns:
+            dict: 接口原始数据 {'total': n, 'rows': [...]}；失败返回 None
+        """
+        api_params = dict(DEFAULT_API_PARAMS)
+        api_params.update({
+            'nodeId': format_node_ids(meter_ids or DEFAULT_METER_IDS),
+            'startDate': start_date,
+            'endDate': end_date
+        })
+        api_params.update(extra_params)
+        request = self.request_report if raise_errors else self.post_report
+        data = request(api_params, include_form_state=include_form_state)
+
+        # 标准查询的结果登记到响应缓存，供接口不可用时按日期回退
+        if data is not None and not extra_params:
+            get_response_cache().put_response(data, meter_ids or DEFAULT_METER_IDS, start_date, end_date)
+        return data
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_session_pool():
+    """获取进程内共享的会话池"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = WaterSessionPool()
+        return _default_pool
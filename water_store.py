@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+水表读数存储
+把每次取数的结果合并到一个SQLite数据库（water_readings.db）中，替代每次运行生成一个
+WEB_COMPLETE_8_METERS_<时间戳>.json 快照的做法：
+- readings 表：每个 (水表, 日期) 一行，记录数值、获取时间和来源；数值不变的重复写入不产生新记录
+- meters 表：水表的名称等基本信息
+- fetches 表：每次取数的记录（时间、来源、日期范围），导入的历史快照也登记在这里
+读取方按日期范围查询，不再需要遍历和解析快照文件
+用法: python water_store.py import   导入现有的快照文件
+"""
+
+import glob
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# 存储配置
+WATER_STORE_CONFIG = {
+    'db_path': 'water_readings.db',
+    'snapshot_patterns': ["*COMPLETE_8_METERS*.json", "WEB_COMPLETE*.json", "REAL_*.json"]
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    meter_id   TEXT NOT NULL,
+    date       TEXT NOT NULL,
+    value      REAL,
+    fetched_at TEXT NOT NULL,
+    source     TEXT NOT NULL,
+    PRIMARY KEY (meter_id, date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meters (
+    meter_id TEXT PRIMARY KEY,
+    name     TEXT,
+    info     TEXT
+);
+
+CREATE TABLE IF NOT EXISTS fetches (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    fetched_at  TEXT NOT NULL,
+    source      TEXT NOT NULL,
+    start_date  TEXT,
+    end_date    TEXT,
+    meter_count INTEGER,
+    note        TEXT,
+    source_file TEXT UNIQUE
+);
+
+CREATE INDEX IF NOT EXISTS idx_readings_date ON readings (date);
+"""
+
+
+def _is_date_key(key):
+    """判断 rows 中的键是否为 'YYYY-MM-DD' 日期列"""
+    return len(key) == 10 and key[4] == '-' and key[7] == '-' and key[:4].isdigit()
+
+
+def _to_float(value):
+    try:
+        if value is None or str(value).strip() == '':
+            return None
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+class WaterStore:
+    """水表读数的SQLite存储"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or WATER_STORE_CONFIG['db_path']
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """打开连接：正常结束时提交、出错时回滚，最后关闭连接"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---------- 写入 ----------
+
+    def _write_rows(self, conn, rows, fetched_at, source):
+        """写入 rows 中的所有读数，返回新增或数值有变化的读数个数"""
+        changed = 0
+        for row in rows:
+            if not isinstance(row, dict) or not row.get('ID'):
+                continue
+            meter_id = str(row['ID'])
+            info = {k: v for k, v in row.items() if not _is_date_key(k)}
+            conn.execute(
+                "INSERT INTO meters (meter_id, name, info) VALUES (?, ?, ?) "
+                "ON CONFLICT(meter_id) DO UPDATE SET name = excluded.name, info = excluded.info",
+                (meter_id, row.get('Name', ''), json.dumps(info, ensure_ascii=False))
+            )
+            for key, raw_value in row.items():
+                if not _is_date_key(key):
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO readings (meter_id, date, value, fetched_at, source) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(meter_id, date) DO UPDATE SET "
+                    "value = excluded.value, fetched_at = excluded.fetched_at, source = excluded.source "
+                    "WHERE readings.value IS NOT excluded.value",
+                    (meter_id, key, _to_float(raw_value), fetched_at, source)
+                )
+                changed += cursor.rowcount
+        return changed
+
+    def record_fetch(self, data, start_date, end_date, source, note=None, fetched_at=None, source_file=None):
+        """
+        登记一次取数结果 {'total', 'rows'}
+
+        Returns:
+            int: 新增或数值有变化的读数个数
+        """
+        if not isinstance(data, dict) or not isinstance(data.get('rows'), list):
+            return 0
+        fetched_at = fetched_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO fetches (fetched_at, source, start_date, end_date, meter_count, note, source_file) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (fetched_at, source, start_date, end_date, len(data['rows']), note, source_file)
+            )
+            return self._write_rows(conn, data['rows'], fetched_at, source)
+
+    def import_snapshot_files(self, patterns=None):
+        """导入现有的快照文件（按修改时间从旧到新；已导入的文件跳过）"""
+        data_files = []
+        for pattern in patterns or WATER_STORE_CONFIG['snapshot_patterns']:
+            data_files.extend(glob.glob(pattern))
+        data_files = sorted(set(data_files), key=os.path.getmtime)
+
+        with self._connect() as conn:
+            imported_files = {r['source_file'] for r in conn.execute(
+                "SELECT source_file FROM fetches WHERE source_file IS NOT NULL")}
+
+        imported = 0
+        for filename in data_files:
+            if filename in imported_files:
+                continue
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"  [WARNING] 读取 {filename} 失败: {e}")
+                continue
+
+            data = snapshot.get('data') if isinstance(snapshot, dict) else None
+            if not isinstance(data, dict) or not isinstance(data.get('rows'), list):
+                continue
+
+            date_range = snapshot.get('date_range') or {}
+            fetched_at = snapshot.get('timestamp') or datetime.fromtimestamp(
+                os.path.getmtime(filename)).strftime('%Y-%m-%d %H:%M:%S')
+            self.record_fetch(
+                data, date_range.get('start'), date_range.get('end'),
+                snapshot.get('source', 'snapshot_file'), note=snapshot.get('note'),
+                fetched_at=fetched_at, source_file=filename
+            )
+            imported += 1
+
+        print(f"[INFO] 已导入 {imported} 个快照文件到 {self.db_path}")
+        return imported
+
+    # ---------- 查询 ----------
+
+    def query_range(self, start_date, end_date, meter_ids=None):
+        """
+        按日期范围查询读数
+
+        Returns:
+            dict: 接口格式 {'total', 'rows'}，每个水表一行，包含范围内所有日期列
+        """
+        sql = "SELECT meter_id, date, value FROM readings WHERE date BETWEEN ? AND ?"
+        params = [start_date, end_date]
+        if meter_ids:
+            sql += " AND meter_id IN (%s)" % ','.join('?' * len(meter_ids))
+            params.extend(meter_ids)
+        sql += " ORDER BY meter_id, date"
+
+        with self._connect() as conn:
+            meters = {r['meter_id']: r for r in conn.execute("SELECT meter_id, name, info FROM meters")}
+            rows = {}
+            for r in conn.execute(sql, params):
+                if r['meter_id'] not in rows:
+                    meter = meters.get(r['meter_id'])
+                    row = json.loads(meter['info']) if meter and meter['info'] else {'ID': r['meter_id']}
+                    rows[r['meter_id']] = row
+                rows[r['meter_id']][r['date']] = r['value']
+
+        ordered = [rows[m] for m in meter_ids if m in rows] if meter_ids else list(rows.values())
+        return {'total': len(ordered), 'rows': ordered}
+
+    def latest_fetch(self):
+        """最近一次取数的记录（不含导入的快照时也可用）；没有记录返回 None"""
+        with self._connect() as conn:
+            r = conn.execute(
+                "SELECT * FROM fetches WHERE start_date IS NOT NULL ORDER BY fetched_at DESC, id DESC LIMIT 1"
+            ).fetchone()
+        return dict(r) if r else None
+
+    def latest_snapshot(self):
+        """
+        按最近一次取数的日期范围组装数据，格式与原 WEB_COMPLETE_8_METERS_*.json 文件一致
+
+        Returns:
+            dict: 快照格式数据；没有记录返回 None
+        """
+        fetch = self.latest_fetch()
+        if not fetch:
+            return None
+
+        data = self.query_range(fetch['start_date'], fetch['end_date'])
+        return {
+            'timestamp': fetch['fetched_at'],
+            'source': fetch['source'],
+            'success': True,
+            'data_type': 'json',
+            'calculation_date': fetch['fetched_at'][:10],
+            'date_range': {
+                'start': fetch['start_date'],
+                'end': fetch['end_date'],
+                'description': f"{fetch['start_date']} ~ {fetch['end_date']}"
+            },
+            'meter_count': data['total'],
+            'data': data,
+            'note': fetch['note'] or ''
+        }
+
+    def available_dates(self, meter_ids=None):
+        """有数值的日期列表（升序）"""
+        sql = "SELECT DISTINCT date FROM readings WHERE value IS NOT NULL"
+        params = []
+        if meter_ids:
+            sql += " AND meter_id IN (%s)" % ','.join('?' * len(meter_ids))
+            params.extend(meter_ids)
+        sql += " ORDER BY date"
+        with self._connect() as conn:
+            return [r['date'] for r in conn.execute(sql, params)]
+
+    def recent_fetches(self, limit=10):
+        """最近的取数记录"""
+        with self._connect() as conn:
+            return [dict(r) for r in conn.execute(
+                "SELECT * FROM fetches ORDER BY fetched_at DESC, id DESC LIMIT ?", (limit,))]
+
+    def summary(self):
+        """存储统计信息"""
+        with self._connect() as conn:
+            r = conn.execute(
+                "SELECT COUNT(*) AS readings, COUNT(DISTINCT meter_id) AS meters, "
+                "MIN(date) AS first_date, MAX(date) AS last_date FROM readings"
+            ).fetchone()
+            fetch_count = conn.execute("SELECT COUNT(*) FROM fetches").fetchone()[0]
+        result = dict(r)
+        result['fetches'] = fetch_count
+        return result
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_water_store():
+    """
+    获取进程内共享的读数存储
+    还没有任何取数记录时导入现有快照文件（数据库文件可能已由响应缓存先行建立，不能据此判断）
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = WaterStore()
+            if not _default_store.recent_fetches(limit=1):
+                _default_store.import_snapshot_files()
+        return _default_store
+
+
+if __name__ == "__main__":
+    import sys
+
+    store = get_water_store()
+    if len(sys.argv) > 1 and sys.argv[1] == 'import':
+        store.import_snapshot_files()
+    print(json.dumps(store.summary(), ensure_ascii=False, indent=2))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+已解析工作表缓存
+报表接口（周报/月报/季报/在线查看/仪表板）只读取 石滩供水服务部每日总供水情况.xlsx 的活动工作表，
+每次请求都用 openpyxl 重新解析整个文件代价很高。这里按 (文件路径, 修改时间, 文件大小) 缓存解析结果：
+- 文件未变化时直接返回内存中的表头和数据行
+- 文件被修改（包括其他进程写入）后下一次访问自动重新解析
+- SpecificExcelWriter 保存文件后会主动调用 invalidate()
+- 也可以按工作表名称获取（如分区计量表的在线查看），每个工作表在首次访问时单独解析，
+  同时读取合并单元格范围（只读模式不提供 merged_cells，直接从工作表XML读取）
+"""
+
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+import openpyxl
+from openpyxl.utils.cell import range_boundaries
+
+# 表头所在行（第4行），数据从第5行开始
+HEADER_ROW_INDEX = 3
+
+
+class ParsedSheet:
+    """一个工作表版本的解析结果（只读，调用方不要修改其中的行）"""
+
+    def __init__(self, path, version, rows, sheet_name=None, merged_ranges=None):
+        self.path = path
+        self.version = version          # (mtime_ns, size)
+        self.rows = rows                # 所有行，元组形式，values_only
+        self.sheet_name = sheet_name    # None 表示活动工作表
+        # 合并单元格 [(min_row, min_col, max_row, max_col)]，1开始；只在按名称获取时读取
+        self.merged_ranges = merged_ranges or []
+        self.header = rows[HEADER_ROW_INDEX] if len(rows) > HEADER_ROW_INDEX else ()
+        self.data_rows = rows[HEADER_ROW_INDEX + 1:]
+        # 由其他模块按需挂载的派生数据（如日期索引），随本版本一起失效
+        self.extras = {}
+
+
+_cache = {}             # (文件绝对路径, 工作表名称) -> ParsedSheet
+_sheet_names = {}       # 文件绝对路径 -> (版本, 工作表名称列表)
+_cache_lock = threading.Lock()
+_path_locks = {}
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def _file_version(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _path_lock(path):
+    with _cache_lock:
+        if path not in _path_locks:
+            _path_locks[path] = threading.Lock()
+        return _path_locks[path]
+
+
+def _read_merged_ranges(ws, path):
+    """
+    从只读工作表的XML中读取 <mergeCell ref="A1:J1"/>
+
+    依赖 openpyxl 只读模式的内部属性（ws.parent._archive、ws._worksheet_path）；
+    这些属性不可用时（如 openpyxl 升级后）改为普通模式加载工作簿，读取 merged_cells
+    """
+    try:
+        archive = ws.parent._archive
+        worksheet_path = ws._worksheet_path
+        ranges = []
+        with archive.open(worksheet_path) as source:
+            for _, element in ET.iterparse(source):
+                if element.tag == MAIN_NS + 'mergeCell':
+                    min_col, min_row, max_col, max_row = range_boundaries(element.get('ref'))
+                    ranges.append((min_row, min_col, max_row, max_col))
+                element.clear()
+        return ranges
+    except (AttributeError, KeyError) as e:
+        print(f"[WARNING] 无法从只读工作表读取合并单元格（{e}），改为完整加载工作簿")
+        return _load_merged_ranges(path, ws.title)
+
+
+def _load_merged_ranges(path, sheet_name):
+    """普通模式加载工作簿读取合并单元格（较慢，只在只读方式不可用时使用）"""
+    wb = openpyxl.load_workbook(path)
+    try:
+        return [(r.min_row, r.min_col, r.max_row, r.max_col) for r in wb[sheet_name].merged_cells.ranges]
+    finally:
+        wb.close()
+
+
+def get_parsed_sheet(path, sheet_name=None):
+    """
+    获取工作表的解析结果，文件未变化时不重新解析
+
+    Args:
+        path: Excel文件路径
+        sheet_name: 工作表名称，默认为活动工作表（按名称获取时同时读取合并单元格）
+
+    Returns:
+        ParsedSheet
+
+    Raises:
+        KeyError: 工作表不存在
+    """
+    path = os.path.abspath(path)
+    key = (path, sheet_name)
+    version = _file_version(path)
+
+    cached = _cache.get(key)
+    if cached is not None and cached.version == version:
+        return cached
+
+    # 同一文件只让一个线程解析，其余线程等待后直接使用结果
+    with _path_lock(path):
+        version = _file_version(path)
+        cached = _cache.get(key)
+        if cached is not None and cached.version == version:
+            return cached
+
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            _sheet_names[path] = (version, list(wb.sheetnames))
+            ws = wb.active if sheet_name is None else wb[sheet_name]
+            rows = list(ws.iter_rows(values_only=True))
+            merged_ranges = _read_merged_ranges(ws, path) if sheet_name is not None else None
+        finally:
+            wb.close()
+
+        parsed = ParsedSheet(path, version, rows, sheet_name, merged_ranges)
+        _cache[key] = parsed
+        label = os.path.basename(path) + (f' [{sheet_name}]' if sheet_name else '')
+        print(f"[INFO] 已解析并缓存工作表: {label} ({len(rows)}行)")
+        return parsed
+
+
+def get_sheet_names(path):
+    """工作簿中的工作表名称（文件未变化时不重新读取）"""
+    path = os.path.abspath(path)
+    version = _file_version(path)
+
+    cached = _sheet_names.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        names = list(wb.sheetnames)
+    finally:
+        wb.close()
+    _sheet_names[path] = (version, names)
+    return names
+
+
+def invalidate(path=None):
+    """使缓存失效；不指定路径时清空全部缓存"""
+    with _cache_lock:
+        if path is None:
+            _cache.clear()
+        else:
+            path = os.path.abspath(path)
+            for key in [key for key in _cache if key[0] == path]:
+                del _cache[key]
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作簿安全保存和写入日志
+- atomic_save：先保存到同目录的临时文件并刷到磁盘，再用 os.replace 替换原文件，
+  保存中途出错或进程被终止时原文件保持完整，读取方不会读到写了一半的文件
+- WriteJournal：工作簿旁的 JSONL 日志，写入前先记下待写入的 (日期, 水表, 数值)，
+  保存成功后标记为已提交；保存失败后重试时直接重放未提交的数据，不需要重新获取接口数据。
+  每条记录累计写入失败次数，达到 max_attempts 后转为死信，不再合并到以后的写入中。
+  日志的追加、读取和整理都在日志旁的锁文件（跨进程）内进行；已提交的记录保留一段时间，
+  排队中的写入据此确认自己的数据确实已被其他请求保存
+"""
+
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from workbook_lock import workbook_lock, LOCK_CONFIG
+
+# 写入日志配置
+JOURNAL_CONFIG = {
+    'suffix': '.journal.jsonl',     # 日志文件 = 工作簿路径 + 后缀
+    'max_attempts': 3,              # 写入失败达到该次数的记录转为死信（保留在日志中，不再重放）
+    'lock_timeout': 30,             # 等待日志锁的最长秒数
+    # 整理日志时已提交记录的保留时间（秒），需大于等待工作簿写入锁的最长时间
+    'committed_retention_seconds': LOCK_CONFIG['timeout'] * 2
+}
+
+
+def _fsync_file(path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+
+def atomic_save(wb, path):
+    """
+    原子保存工作簿
+
+    先保存到同目录的临时文件（保留原文件的权限），再替换原文件。
+    目标文件被其他程序占用时抛出 PermissionError（由调用方重试），临时文件会被删除。
+    """
+    path = os.path.abspath(path)
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f'.{name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp')
+
+    try:
+        wb.save(tmp_path)
+        _fsync_file(tmp_path)
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        raise
+
+
+def journal_path(excel_path):
+    """写入日志文件路径"""
+    return os.path.abspath(excel_path) + JOURNAL_CONFIG['suffix']
+
+
+def date_key(date):
+    """日期统一为 'YYYY-MM-DD' 字符串"""
+    return date if isinstance(date, str) else date.strftime('%Y-%m-%d')
+
+
+class WriteJournal:
+    """
+    一个工作簿的写入日志
+
+    每行一条记录：
+        {"id": ..., "status": "pending", "time": ..., "data": {日期: {水表系统名称: 数值}}}
+        {"id": ..., "status": "committed", "time": ...}
+        {"id": ..., "status": "failed", "time": ..., "error": ...}    一次写入失败
+        {"id": ..., "status": "dead", "time": ..., "error": ...}      失败次数达到上限，转为死信
+    所有操作都持有日志锁（日志路径 + '.lock'，跨进程）。日志不在提交时删除，
+    由 compact() 在持有工作簿写入锁时整理。
+    """
+
+    def __init__(self, excel_path):
+        self.path = journal_path(excel_path)
+        self._lock = workbook_lock(self.path, timeout=JOURNAL_CONFIG['lock_timeout'])
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with open(self.path, 'ab+') as f:
+            # 上次追加被中断时最后一行不完整，从新的一行开始
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    line = '\n' + line
+            f.write(line.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _scan(self):
+        """
+        读取日志
+
+        Returns:
+            tuple: (未提交的记录 {id: {'status': 'pending' 或 'dead', 'time', 'data', 'attempts', 'error'}}（按写入顺序）,
+                    已提交的记录 {id: 提交时间}, 每个记录ID对应的原始行 {id: [行]})
+        """
+        entries = {}
+        committed = {}
+        lines = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 追加时被中断留下的不完整行
+                        continue
+                    entry_id = record.get('id')
+                    lines.setdefault(entry_id, []).append(line if line.endswith('\n') else line + '\n')
+                    status = record.get('status')
+                    if status == 'pending':
+                        entries[entry_id] = {'status': 'pending', 'time': record.get('time'),
+                                             'data': record.get('data', {}), 'attempts': 0, 'error': None}
+                    elif status == 'committed':
+                        entries.pop(entry_id, None)
+                        committed[entry_id] = record.get('time')
+                    elif status in ('failed', 'dead') and entry_id in entries:
+                        entry = entries[entry_id]
+                        entry['error'] = record.get('error')
+                        if status == 'failed':
+                            entry['attempts'] += 1
+                        else:
+                            entry['status'] = 'dead'
+        except OSError:
+            pass
+        return entries, committed, lines
+
+    def _read(self):
+        """未提交的记录（含死信，按写入顺序）"""
+        return self._scan()[0]
+
+    def begin(self, data_by_date):
+        """
+        写入工作簿前记录待写入的数据
+
+        Returns:
+            str: 记录ID，保存成功后传给 commit()
+        """
+        entry_id = uuid.uuid4().hex
+        data = {date_key(date): dict(values) for date, values in data_by_date.items()}
+        with self._lock:
+            self._append({'id': entry_id, 'status': 'pending',
+                          'time': datetime.now().isoformat(timespec='seconds'), 'data': data})
+        return entry_id
+
+    def commit(self, entry_ids):
+        """标记记录已写入并保存（不删除日志，见 compact）"""
+        if isinstance(entry_ids, str):
+            entry_ids = [entry_ids]
+        now = datetime.now().isoformat(timespec='seconds')
+        with self._lock:
+            for entry_id in entry_ids:
+                self._append({'id': entry_id, 'status': 'committed', 'time': now})
+
+    def compact(self):
+        """
+        整理日志：去掉保留时间之前已提交的记录，没有剩余记录时删除日志文件
+
+        只在持有工作簿写入锁时调用：排队中的写入拿到工作簿写入锁后才查询自己的记录，
+        已提交的记录在保留时间内不会被去掉。
+        """
+        cutoff = (datetime.now() - timedelta(seconds=JOURNAL_CONFIG['committed_retention_seconds'])
+                  ).isoformat(timespec='seconds')
+        with self._lock:
+            entries, committed, lines = self._scan()
+            keep = [entry_id for entry_id in lines
+                    if entry_id in entries or (committed.get(entry_id) or '') >= cutoff]
+            if len(keep) == len(lines):
+                return
+            try:
+                if not keep:
+                    os.remove(self.path)
+                    return
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(line for entry_id in keep for line in lines[entry_id])
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"[WARNING] 整理写入日志失败: {e}")
+
+    def status(self, entry_id):
+        """
+        记录的状态
+
+        Returns:
+            str: 'pending'、'dead'、'committed'；日志中没有该记录时返回 None
+        """
+        with self._lock:
+            entries, committed, _ = self._scan()
+        if entry_id in entries:
+            return entries[entry_id]['status']
+        return 'committed' if entry_id in committed else None
+
+    def fail(self, entry_ids, error):
+        """
+        记录一次写入失败；失败次数达到 max_attempts 的记录转为死信
+
+        Returns:
+            list: 本次转为死信的记录ID
+        """
+        if isinstance(entry_ids, str):
+            entry_ids = [entry_ids]
+        now = datetime.now().isoformat(timespec='seconds')
+        dead = []
+        with self._lock:
+            for entry_id in entry_ids:
+                self._append({'id': entry_id, 'status': 'failed', 'time': now, 'error': error})
+            entries = self._read()
+            for entry_id in entry_ids:
+                entry = entries.get(entry_id)
+                if entry and entry['status'] == 'pending' and entry['attempts'] >= JOURNAL_CONFIG['max_attempts']:
+                    self._append({'id': entry_id, 'status': 'dead', 'time': now, 'error': error})
+                    dead.append(entry_id)
+        return dead
+
+    def entries(self):
+        """
+        待重放的记录
+
+        Returns:
+            dict: {记录ID: {日期: {水表系统名称: 数值}}}（按写入顺序，不含死信）
+        """
+        with self._lock:
+            entries = self._read()
+        return {entry_id: entry['data'] for entry_id, entry in entries.items() if entry['status'] == 'pending'}
+
+    def dead_letters(self):
+        """
+        死信（多次写入失败、不再重放的记录）
+
+        Returns:
+            dict: {记录ID: {'time', 'data', 'attempts', 'error'}}
+        """
+        with self._lock:
+            entries = self._read()
+        return {entry_id: {key: entry[key] for key in ('time', 'data', 'attempts', 'error')}
+                for entry_id, entry in entries.items() if entry['status'] == 'dead'}
+
+    def pending(self):
+        """
+        未提交的数据（不含死信）
+
+        Returns:
+            tuple: (记录ID列表, {日期: {水表系统名称: 数值}})，同一单元格以后写入的记录为准
+        """
+        entries = self.entries()
+        return list(entries), merge_entries(entries)
+
+
+def merge_entries(entries):
+    """合并多条记录的数据 {日期: {水表系统名称: 数值}}，同一单元格以后写入的记录为准"""
+    merged = {}
+    for data in entries.values():
+        for date, values in data.items():
+            merged.setdefault(date, {}).update(values)
+    return merged
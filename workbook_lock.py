@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作簿写入锁
+Web 服务以 gunicorn 多进程运行，/execute_auto_update、/add_summary 和后台线程都可能同时修改
+excel_exports 下的工作簿。这里用工作簿旁的锁文件串行化所有修改：
+- WorkbookLock：跨进程（fcntl.flock，Windows 下 msvcrt.locking）加进程内线程锁，同一线程可重入
+每日总供水表的写入还会通过写入日志合并：排队等锁的请求由先拿到锁的请求一并写入，见 daily_update_pipeline；
+相同参数的重复请求由任务队列（job_queue）去重。
+"""
+
+import os
+import threading
+import time
+
+# 跨进程文件锁：优先使用fcntl，Windows下使用msvcrt
+FCNTL_AVAILABLE = False
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    fcntl = None
+
+MSVCRT_AVAILABLE = False
+try:
+    import msvcrt
+    MSVCRT_AVAILABLE = True
+except ImportError:
+    msvcrt = None
+
+# 写入锁配置
+LOCK_CONFIG = {
+    'suffix': '.lock',          # 锁文件 = 工作簿路径 + 后缀
+    'timeout': 150,             # 等待锁的最长秒数（小于 gunicorn 的 180 秒超时）
+    'poll_interval': 0.2        # 等待锁时的重试间隔（秒）
+}
+
+
+class WorkbookLockTimeout(TimeoutError):
+    """等待工作簿写入锁超时"""
+
+
+def lock_path(excel_path):
+    """锁文件路径"""
+    return os.path.abspath(excel_path) + LOCK_CONFIG['suffix']
+
+
+def _try_lock_file(f):
+    """非阻塞地锁定文件，被其他进程占用时抛出 OSError"""
+    if FCNTL_AVAILABLE:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    elif MSVCRT_AVAILABLE:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+def _unlock_file(f):
+    if FCNTL_AVAILABLE:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    elif MSVCRT_AVAILABLE:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# 锁文件路径 -> {'lock': 线程锁, 'depth': 重入次数, 'file': 已锁定的文件}
+_states = {}
+_states_lock = threading.Lock()
+
+
+class WorkbookLock:
+    """一个工作簿的写入锁（跨进程、跨线程；同一线程可重入）"""
+
+    def __init__(self, excel_path, timeout=None):
+        self.path = lock_path(excel_path)
+        self.timeout = LOCK_CONFIG['timeout'] if timeout is None else timeout
+        with _states_lock:
+            self._state = _states.setdefault(self.path, {'lock': threading.RLock(), 'depth': 0, 'file': None})
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        state = self._state
+        if not state['lock'].acquire(timeout=max(self.timeout, 0)):
+            raise WorkbookLockTimeout(f'等待工作簿写入锁超时: {self.path}')
+        try:
+            if state['depth'] == 0:
+                state['file'] = self._lock_file(deadline)
+            state['depth'] += 1
+        except BaseException:
+            state['lock'].release()
+            raise
+        return self
+
+    def _lock_file(self, deadline):
+        f = open(self.path, 'a+b')
+        while True:
+            try:
+                _try_lock_file(f)
+                return f
+            except OSError:
+                if time.monotonic() >= deadline:
+                    f.close()
+                    raise WorkbookLockTimeout(f'等待工作簿写入锁超时: {self.path}')
+                time.sleep(LOCK_CONFIG['poll_interval'])
+
+    def release(self):
+        state = self._state
+        state['depth'] -= 1
+        if state['depth'] == 0:
+            try:
+                _unlock_file(state['file'])
+            finally:
+                state['file'].close()
+                state['file'] = None
+        state['lock'].release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def workbook_lock(excel_path, timeout=None):
+    """工作簿写入锁，用法：with workbook_lock(path): 加载、修改、保存"""
+    return WorkbookLock(excel_path, timeout)